@@ -0,0 +1,312 @@
+"""
+Load generator for /rwh-design: replays a JSONL file of rooftops at a fixed
+concurrency and reports throughput and p50/p95/p99 latency.
+
+    python bench_load.py --make-requests 2000 rooftops.jsonl
+    python bench_load.py rooftops.jsonl --spawn --concurrency 32 --requests 5000
+    python bench_load.py rooftops.jsonl --url http://127.0.0.1:8001 --duration 60
+
+Every line is an object of /rwh-design query parameters (rooftop_area_m2,
+rooftop_type, lat, lon and optionally year, demand_l_per_day, ...); lines
+without the required ones are skipped. The file is cycled until --requests
+have been sent or --duration has passed; the first --warmup requests are not
+recorded. --make-requests writes a deterministic file of rooftops scattered
+around the stations of the station CSV, so most lookups find a station.
+
+--spawn starts openmeteo_stub.py and the API (uvicorn) on local ports, with
+a fresh rainfall cache and no raster so rainfall goes to the stub; the
+--stub-* options set the stub's latency and error rate. Results (overall,
+2xx only, and per Server-Timing stage) go to --out; compare two runs with
+bench_results.py.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import numpy as np
+
+from bench_results import print_results, save_results, summarize
+
+DESIGN_PATH = "/rwh-design"
+REQUIRED_PARAMS = ("rooftop_area_m2", "rooftop_type", "lat", "lon")
+ROOFTOP_TYPES = ("concrete", "tile", "metal", "asbestos", "green")
+# --make-requests scatters rooftops up to this far (degrees) from a station
+SCATTER_DEG = 0.2
+SERVER_START_TIMEOUT_S = 60.0
+
+
+def make_requests(path: str, n: int, station_csv: str, seed: int) -> int:
+    from station_store import read_station_csv
+
+    store = read_station_csv(station_csv)
+    valid = np.flatnonzero(np.isfinite(store.lat) & np.isfinite(store.lon) & np.isfinite(store.depth))
+    if len(valid) == 0:
+        raise SystemExit(f"{station_csv} has no stations with coordinates and depth")
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(valid, n)
+    lat = store.lat[rows] + rng.uniform(-SCATTER_DEG, SCATTER_DEG, n)
+    lon = store.lon[rows] + rng.uniform(-SCATTER_DEG, SCATTER_DEG, n)
+    area = rng.uniform(40.0, 400.0, n)
+    kinds = rng.integers(0, len(ROOFTOP_TYPES), n)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            f.write(json.dumps({
+                "rooftop_area_m2": round(float(area[i]), 1),
+                "rooftop_type": ROOFTOP_TYPES[kinds[i]],
+                "lat": round(float(lat[i]), 4),
+                "lon": round(float(lon[i]), 4),
+            }) + "\n")
+    return n
+
+
+def read_requests(path: str) -> Tuple[List[Dict[str, object]], int]:
+    """Query parameter sets of the file and the number of skipped lines."""
+    items: List[Dict[str, object]] = []
+    skipped = 0
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if not isinstance(item, dict) or any(name not in item for name in REQUIRED_PARAMS):
+                skipped += 1
+                continue
+            items.append(item)
+    return items, skipped
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Stage -> milliseconds from a Server-Timing header (repeated stages are summed)."""
+    stages: Dict[str, float] = {}
+    for entry in (header or "").split(","):
+        name, _, rest = entry.strip().partition(";")
+        for param in rest.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur" and name:
+                stages[name] = stages.get(name, 0.0) + float(value)
+    return stages
+
+
+async def replay(
+    base_url: str,
+    items: List[Dict[str, object]],
+    concurrency: int,
+    requests: Optional[int],
+    duration_s: Optional[float],
+    warmup: int,
+    timeout_s: float,
+) -> Tuple[List[Tuple[float, str, Dict[str, float]]], float]:
+    """(latency s, status, stage ms) per recorded request, and the recorded wall time."""
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    records: List[Tuple[float, str, Dict[str, float]]] = []
+    counter = itertools.count()
+    total = None if requests is None else warmup + requests
+    state = {"deadline": None, "started": None}
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout_s, limits=limits) as client:
+
+        async def worker() -> None:
+            while True:
+                i = next(counter)
+                if total is not None and i >= total:
+                    return
+                if state["deadline"] is not None and time.perf_counter() >= state["deadline"]:
+                    return
+                t0 = time.perf_counter()
+                try:
+                    r = await client.get(DESIGN_PATH, params=items[i % len(items)])
+                    status, stages = str(r.status_code), parse_server_timing(r.headers.get("server-timing"))
+                except httpx.HTTPError as e:
+                    status, stages = f"error:{type(e).__name__}", {}
+                latency = time.perf_counter() - t0
+                if i >= warmup:
+                    if state["started"] is None:
+                        state["started"] = t0
+                        if duration_s is not None:
+                            state["deadline"] = t0 + duration_s
+                    records.append((latency, status, stages))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - state["started"] if state["started"] is not None else 0.0
+    return records, wall
+
+
+def report(records: List[Tuple[float, str, Dict[str, float]]], wall_s: float) -> Dict[str, Dict[str, object]]:
+    statuses = Counter(status for _, status, _ in records)
+    overall = summarize([latency for latency, _, _ in records], wall_s)
+    overall["status"] = dict(sorted(statuses.items()))
+    ok = [latency for latency, status, _ in records if status.startswith("2")]
+    results: Dict[str, Dict[str, object]] = {"rwh-design": overall, "rwh-design/2xx": summarize(ok, wall_s)}
+
+    per_stage: Dict[str, List[float]] = defaultdict(list)
+    for _, status, stages in records:
+        if status.startswith("2"):
+            for name, ms in stages.items():
+                per_stage[name].append(ms / 1000.0)
+    for name in sorted(per_stage):
+        results[f"stage/{name}"] = summarize(per_stage[name])
+    return results
+
+
+def _wait_ready(url: str, proc: subprocess.Popen) -> None:
+    deadline = time.monotonic() + SERVER_START_TIMEOUT_S
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server for {url} exited with status {proc.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"server for {url} did not start within {SERVER_START_TIMEOUT_S:.0f}s")
+
+
+def spawn_servers(args, work_dir: str) -> List[subprocess.Popen]:
+    """Start the stub and the API pointed at it; returns the processes (stub first)."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    stub_env = dict(
+        os.environ,
+        STUB_LATENCY_MS=str(args.stub_latency_ms),
+        STUB_JITTER_MS=str(args.stub_jitter_ms),
+        STUB_ERROR_RATE=str(args.stub_error_rate),
+        STUB_ERROR_STATUS=str(args.stub_error_status),
+        STUB_SEED=str(args.seed),
+    )
+    if args.stub_fixtures:
+        stub_env["STUB_FIXTURES_DIR"] = os.path.abspath(args.stub_fixtures)
+    api_env = dict(
+        os.environ,
+        OPEN_METEO_URL=f"http://127.0.0.1:{args.stub_port}/v1/archive",
+        RAINFALL_CACHE_FILE=os.path.join(work_dir, "rainfall_cache.sqlite3"),
+        RAINFALL_RASTER_FILE=os.path.join(work_dir, "no_raster.bin"),
+        LOG_LEVEL="WARNING",
+    )
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning"]
+    procs = []
+    try:
+        stub = subprocess.Popen(
+            uvicorn + ["openmeteo_stub:app", "--port", str(args.stub_port)], cwd=here, env=stub_env
+        )
+        procs.append(stub)
+        _wait_ready(f"http://127.0.0.1:{args.stub_port}/stub/stats", stub)
+        api = subprocess.Popen(
+            uvicorn + ["main:app", "--port", str(args.port), "--workers", str(args.workers)], cwd=here, env=api_env
+        )
+        procs.append(api)
+        _wait_ready(f"http://127.0.0.1:{args.port}/", api)
+    except BaseException:
+        stop_servers(procs)
+        raise
+    return procs
+
+
+def stop_servers(procs: List[subprocess.Popen]) -> None:
+    for proc in reversed(procs):
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("requests_file", help="JSONL of /rwh-design query parameters")
+    parser.add_argument("--make-requests", type=int, metavar="N", help="write N rooftops to requests_file and exit")
+    parser.add_argument("--station-csv", default="india_gw_stations.csv", help="stations --make-requests scatters around")
+    parser.add_argument("--url", default="http://127.0.0.1:8001", help="API base URL (ignored with --spawn)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=None, help="recorded requests (default 1000 without --duration)")
+    parser.add_argument("--duration", type=float, default=None, help="record for this many seconds instead")
+    parser.add_argument("--warmup", type=int, default=50, help="unrecorded requests sent first")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="bench_load.json")
+
+    spawn = parser.add_argument_group("local servers")
+    spawn.add_argument("--spawn", action="store_true", help="start the Open-Meteo stub and the API locally")
+    spawn.add_argument("--port", type=int, default=8001)
+    spawn.add_argument("--workers", type=int, default=1, help="uvicorn workers of the API")
+    spawn.add_argument("--stub-port", type=int, default=8002)
+    spawn.add_argument("--stub-latency-ms", type=float, default=0.0)
+    spawn.add_argument("--stub-jitter-ms", type=float, default=0.0)
+    spawn.add_argument("--stub-error-rate", type=float, default=0.0)
+    spawn.add_argument("--stub-error-status", type=int, default=503)
+    spawn.add_argument("--stub-fixtures", help="directory of recorded archive fixtures")
+    args = parser.parse_args()
+
+    if args.make_requests is not None:
+        n = make_requests(args.requests_file, args.make_requests, args.station_csv, args.seed)
+        print(f"wrote {n} rooftops to {args.requests_file}")
+        return
+    if args.requests is None and args.duration is None:
+        args.requests = 1000
+
+    items, skipped = read_requests(args.requests_file)
+    if not items:
+        raise SystemExit(f"{args.requests_file} has no lines with {', '.join(REQUIRED_PARAMS)}")
+    if skipped:
+        print(f"skipped {skipped} line(s) without {', '.join(REQUIRED_PARAMS)}")
+
+    procs: List[subprocess.Popen] = []
+    work_dir = tempfile.mkdtemp(prefix="rtrwh-load-")
+    base_url = args.url
+    stub_stats = None
+    try:
+        if args.spawn:
+            procs = spawn_servers(args, work_dir)
+            base_url = f"http://127.0.0.1:{args.port}"
+        records, wall = asyncio.run(replay(
+            base_url, items, args.concurrency, args.requests, args.duration, args.warmup, args.timeout
+        ))
+        if args.spawn:
+            stub_stats = httpx.get(f"http://127.0.0.1:{args.stub_port}/stub/stats").json()
+    finally:
+        stop_servers(procs)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = report(records, wall)
+    if stub_stats is not None:
+        results["rwh-design"]["upstream_requests"] = stub_stats["requests"]
+    config = {
+        "requests_file": args.requests_file,
+        "rooftops": len(items),
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "duration_s": args.duration,
+        "warmup": args.warmup,
+        "spawn": args.spawn,
+    }
+    if args.spawn:
+        config.update(
+            workers=args.workers,
+            stub_latency_ms=args.stub_latency_ms,
+            stub_jitter_ms=args.stub_jitter_ms,
+            stub_error_rate=args.stub_error_rate,
+            stub_error_status=args.stub_error_status,
+            stub_fixtures=args.stub_fixtures,
+        )
+    save_results(args.out, "load", config, results)
+    print_results(results)
+    print(f"status: {results['rwh-design']['status']}")
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Micro-benchmarks of the station lookup on synthetic station sets:
+
+    python bench_lookup.py [--sizes 1000,100000,1000000] [--out bench_lookup.json]
+
+For every size, a deterministic CSV of that many stations spread over India
+is written and loaded through read_station_csv (timed as load/<n>). The same
+seeded query points are then run through:
+
+    haversine_km/<n>          nearest station by a Python scan with haversine_km
+                              (the pre-index lookup; fewer queries on big sets)
+    haversine_km_array/<n>    the same scan vectorised with haversine_km_array
+    depth_for_point/<n>       main.get_india_depth_for_point on the grid index
+    depth_for_point_as_of/<n> the same with as_of_day (masked k_nearest)
+
+plus haversine_km/call, the cost of one haversine_km call. Queries that find
+no station within the radius count as misses; their time is included.
+Results go to --out (see bench_results.py to compare two runs).
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+from fastapi import HTTPException
+
+import main as api
+from bench_results import print_results, save_results, summarize
+from geo import haversine_km, haversine_km_array
+from station_history import parse_day
+from station_store import STATION_FIELDS, read_station_csv
+
+DEFAULT_SIZES = (1_000, 100_000, 1_000_000)
+# synthetic stations and queries fall inside this (south, west, north, east)
+INDIA_BBOX = (8.0, 68.0, 35.0, 97.0)
+READING_DATE = "2023-05-15"
+AS_OF_DATE = "2024-01-01"
+# the Python scan gets about this many station distance calls per size
+SCAN_BUDGET_ROWS = 2_000_000
+MIN_SCAN_QUERIES = 5
+WARMUP_QUERIES = 20
+
+
+def write_synthetic_csv(path: str, n: int, seed: int) -> None:
+    rng = np.random.default_rng(seed)
+    south, west, north, east = INDIA_BBOX
+    lat = rng.uniform(south, north, n)
+    lon = rng.uniform(west, east, n)
+    depth = rng.gamma(2.0, 5.0, n)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(STATION_FIELDS) + "\n")
+        for i in range(n):
+            f.write(
+                f"SYN{i:07d},Synthetic {i},{lat[i]:.5f},{lon[i]:.5f},{depth[i]:.2f},"
+                f"{READING_DATE},State {i % 36},District {i % 700}\n"
+            )
+
+
+def query_points(n: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed + 1)
+    south, west, north, east = INDIA_BBOX
+    return np.column_stack([rng.uniform(south, north, n), rng.uniform(west, east, n)])
+
+
+def _timed_calls(
+    points: np.ndarray, lookup: Callable[[float, float], bool], warmup: int = WARMUP_QUERIES
+) -> Dict[str, object]:
+    """Per-query latencies of lookup(lat, lon) -> found, after warmup untimed calls."""
+    for lat, lon in points[:warmup]:
+        lookup(lat, lon)
+    latencies: List[float] = []
+    misses = 0
+    wall0 = time.perf_counter()
+    for lat, lon in points:
+        t0 = time.perf_counter()
+        found = lookup(lat, lon)
+        latencies.append(time.perf_counter() - t0)
+        misses += not found
+    summary = summarize(latencies, time.perf_counter() - wall0)
+    summary["misses"] = misses
+    return summary
+
+
+def bench_haversine_call(repeats: int = 200, batch: int = 1000) -> Dict[str, object]:
+    lat, lon = 22.57, 88.36
+    latencies = []
+    for r in range(repeats):
+        other = 8.0 + r * 0.1
+        t0 = time.perf_counter()
+        for _ in range(batch):
+            haversine_km(lat, lon, other, 77.0)
+        latencies.append((time.perf_counter() - t0) / batch)
+    return summarize(latencies)
+
+
+def bench_size(
+    n: int, points: np.ndarray, data_dir: str, seed: int, radius_km: float
+) -> Dict[str, Dict[str, object]]:
+    csv_path = os.path.join(data_dir, f"stations_{n}.csv")
+    if not os.path.exists(csv_path):
+        write_synthetic_csv(csv_path, n, seed)
+    t0 = time.perf_counter()
+    store = read_station_csv(csv_path)
+    load_s = time.perf_counter() - t0
+    results: Dict[str, Dict[str, object]] = {f"load/{n}": summarize([load_s])}
+
+    lats, lons = store.lat, store.lon
+    rows = list(zip(lats.tolist(), lons.tolist()))
+
+    def scan(lat: float, lon: float) -> bool:
+        best = min(haversine_km(lat, lon, la, lo) for la, lo in rows)
+        return best <= radius_km
+
+    def scan_array(lat: float, lon: float) -> bool:
+        return float(haversine_km_array(lat, lon, lats, lons).min()) <= radius_km
+
+    api.india_store = store
+    as_of_day = parse_day(AS_OF_DATE)
+
+    def depth_for_point(lat: float, lon: float) -> bool:
+        try:
+            api.get_india_depth_for_point(lat, lon, max_radius_km=radius_km)
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            return False
+        return True
+
+    def depth_for_point_as_of(lat: float, lon: float) -> bool:
+        try:
+            api.get_india_depth_for_point(lat, lon, max_radius_km=radius_km, as_of_day=as_of_day)
+        except HTTPException as e:
+            if e.status_code != 404:
+                raise
+            return False
+        return True
+
+    scan_queries = max(MIN_SCAN_QUERIES, min(len(points), SCAN_BUDGET_ROWS // n))
+    results[f"haversine_km/{n}"] = _timed_calls(points[:scan_queries], scan, warmup=1)
+    results[f"haversine_km_array/{n}"] = _timed_calls(points, scan_array)
+    results[f"depth_for_point/{n}"] = _timed_calls(points, depth_for_point)
+    results[f"depth_for_point_as_of/{n}"] = _timed_calls(points, depth_for_point_as_of)
+    api.india_store = None
+    return results
+
+
+def run(
+    sizes: Sequence[int], queries: int, seed: int, radius_km: float, data_dir: str
+) -> Dict[str, Dict[str, object]]:
+    points = query_points(queries, seed)
+    results = {"haversine_km/call": bench_haversine_call()}
+    for n in sizes:
+        results.update(bench_size(n, points, data_dir, seed, radius_km))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", default=",".join(str(n) for n in DEFAULT_SIZES), help="comma-separated station counts"
+    )
+    parser.add_argument("--queries", type=int, default=2000, help="query points per benchmark")
+    parser.add_argument("--radius-km", type=float, default=50.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="keep the synthetic CSVs here (default: a temporary directory)")
+    parser.add_argument("--out", default="bench_lookup.json")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="rtrwh-bench-")
+    os.makedirs(data_dir, exist_ok=True)
+    try:
+        results = run(sizes, args.queries, args.seed, args.radius_km, data_dir)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    config = {"sizes": sizes, "queries": args.queries, "radius_km": args.radius_km, "seed": args.seed}
+    save_results(args.out, "lookup", config, results)
+    print_results(results)
+    print(f"saved {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Latency summaries and result files shared by bench_lookup.py and
+bench_load.py, and a comparison of two result files:
+
+    python bench_results.py baseline.json current.json [--threshold 0.10]
+
+A result file holds the environment (Python, NumPy, CPU count, git commit),
+the run's configuration, and one summary per benchmark name. The comparison
+lists every benchmark whose p50/p95/p99 grew by more than threshold (or
+whose throughput fell by more than it) and exits with status 1 if any did.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+# compared by compare(); latency keys regress upwards, throughput downwards
+LATENCY_KEYS = tuple(f"p{p}_ms" for p in PERCENTILES)
+THROUGHPUT_KEY = "throughput_per_s"
+DEFAULT_THRESHOLD = 0.10
+
+
+def summarize(latencies_s: Sequence[float], wall_s: Optional[float] = None) -> Dict[str, object]:
+    """Count, mean, p50/p95/p99 and max in milliseconds; throughput when the wall time is given."""
+    values = np.asarray(latencies_s, dtype=np.float64) * 1000.0
+    summary: Dict[str, object] = {"count": int(len(values))}
+    if len(values):
+        summary["mean_ms"] = round(float(values.mean()), 6)
+        for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"p{p}_ms"] = round(float(v), 6)
+        summary["max_ms"] = round(float(values.max()), 6)
+    if wall_s is not None and wall_s > 0:
+        summary[THROUGHPUT_KEY] = round(len(values) / wall_s, 2)
+    return summary
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment() -> Dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "git_commit": _git_commit(),
+    }
+
+
+def save_results(
+    path: str, kind: str, config: Dict[str, object], results: Dict[str, Dict[str, object]]
+) -> Dict[str, object]:
+    document = {
+        "kind": kind,
+        "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "environment": environment(),
+        "config": config,
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=2)
+        f.write("\n")
+    return document
+
+
+def print_results(results: Dict[str, Dict[str, object]]) -> None:
+    columns = ("count",) + LATENCY_KEYS + ("max_ms", THROUGHPUT_KEY)
+    width = max([len(name) for name in results] + [9])
+    print(f"{'benchmark':<{width}}  " + "  ".join(f"{c:>16}" for c in columns))
+    for name, summary in results.items():
+        cells = []
+        for c in columns:
+            value = summary.get(c)
+            cells.append(f"{'-' if value is None else value:>16}")
+        print(f"{name:<{width}}  " + "  ".join(cells))
+
+
+def compare(
+    baseline: Dict[str, object], current: Dict[str, object], threshold: float = DEFAULT_THRESHOLD
+) -> List[Dict[str, object]]:
+    """One row per metric of the benchmarks both files ran; "regressed" marks changes beyond threshold."""
+    rows: List[Dict[str, object]] = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        for key in LATENCY_KEYS + (THROUGHPUT_KEY,):
+            old, new = before.get(key), now.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if key == THROUGHPUT_KEY else change
+            rows.append({
+                "benchmark": name,
+                "metric": key,
+                "baseline": old,
+                "current": new,
+                "change": round(change, 6),
+                "regressed": worse > threshold,
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument(
+        "--threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="relative change counted as a regression (default 0.10 = 10%%)",
+    )
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSED" if row["regressed"] else ""
+        print(
+            f"{row['benchmark']:<40} {row['metric']:<18} {row['baseline']:>12} -> {row['current']:>12} "
+            f"({row['change']:+.1%}) {flag}"
+        )
+    regressed = [row for row in rows if row["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
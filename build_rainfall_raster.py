@@ -0,0 +1,163 @@
+"""
+Build the offline rainfall raster (rainfall_raster.py) from stored
+Open-Meteo archive responses, so /rwh-design can be served without upstream calls.
+
+    python build_rainfall_raster.py fetch --years 2015-2024 [--bbox 6.5,68,37.5,97.5] [--out-dir rainfall_dumps]
+    python build_rainfall_raster.py build rainfall_dumps [-o rainfall_raster.bin]
+
+`fetch` saves archive responses for every 0.1 deg cell in the bounding box
+(multi-location requests, resumable: existing files are skipped). `build`
+needs no network; it accepts those files as well as raw archive responses
+(.json or .json.gz, one location or a list). Raw responses are placed by the
+coordinates Open-Meteo reports, snapped to the rainfall grid.
+Maxima are computed by the same code as the live path.
+"""
+import argparse
+import gzip
+import json
+import os
+import time
+from typing import Iterator, List, Tuple
+
+from fastapi import HTTPException
+
+import upstream
+from rainfall import OPEN_METEO_URL, archive_params, rainfall_stats_from_payload
+from rainfall_cache import RAINFALL_CELL_DEG, rainfall_cell
+from rainfall_raster import RainfallRaster, RasterEntry, write_raster
+
+INDIA_BBOX = (6.5, 68.0, 37.5, 97.5)
+
+
+def grid_cells(south: float, west: float, north: float, east: float) -> List[Tuple[float, float]]:
+    lat_nodes = range(round(south / RAINFALL_CELL_DEG), round(north / RAINFALL_CELL_DEG) + 1)
+    lon_nodes = range(round(west / RAINFALL_CELL_DEG), round(east / RAINFALL_CELL_DEG) + 1)
+    return [
+        rainfall_cell(i * RAINFALL_CELL_DEG, j * RAINFALL_CELL_DEG)
+        for i in lat_nodes
+        for j in lon_nodes
+    ]
+
+
+def _load_json(path: str) -> object:
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _dump_files(paths: List[str]) -> Iterator[str]:
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, _, names in os.walk(path):
+            for name in sorted(names):
+                if name.endswith((".json", ".json.gz")):
+                    yield os.path.join(root, name)
+
+
+def _payload_year(payload: dict) -> int:
+    return int(payload["hourly"]["time"][0][:4])
+
+
+def dump_records(path: str) -> Iterator[Tuple[float, float, int, dict]]:
+    """(cell_lat, cell_lon, year, payload) for every location in one dump file."""
+    data = _load_json(path)
+    if isinstance(data, dict) and "response" in data:
+        # written by `fetch`: requested cells and year are recorded alongside
+        payloads = data["response"] if isinstance(data["response"], list) else [data["response"]]
+        if len(payloads) != len(data["cells"]):
+            raise ValueError(f"{path}: {len(payloads)} locations for {len(data['cells'])} cells")
+        for (cell_lat, cell_lon), payload in zip(data["cells"], payloads):
+            yield cell_lat, cell_lon, int(data["year"]), payload
+        return
+
+    for payload in data if isinstance(data, list) else [data]:
+        cell_lat, cell_lon = rainfall_cell(payload["latitude"], payload["longitude"])
+        yield cell_lat, cell_lon, _payload_year(payload), payload
+
+
+def fetch(args: argparse.Namespace) -> None:
+    south, west, north, east = (float(v) for v in args.bbox.split(","))
+    first, _, last = args.years.partition("-")
+    years = range(int(first), int(last or first) + 1)
+    cells = grid_cells(south, west, north, east)
+    session = upstream.get_session()
+
+    fetched = skipped = 0
+    for year in years:
+        year_dir = os.path.join(args.out_dir, str(year))
+        os.makedirs(year_dir, exist_ok=True)
+        for start in range(0, len(cells), args.batch):
+            batch = cells[start: start + args.batch]
+            out_path = os.path.join(year_dir, f"{batch[0][0]:.1f}_{batch[0][1]:.1f}_n{len(batch)}.json.gz")
+            if os.path.exists(out_path):
+                skipped += 1
+                continue
+            resp = session.get(OPEN_METEO_URL, params=archive_params(batch, year), timeout=upstream.sync_timeout())
+            resp.raise_for_status()
+            record = {"year": year, "cells": batch, "response": resp.json()}
+            with gzip.open(out_path + ".tmp", "wt", encoding="utf-8") as f:
+                json.dump(record, f)
+            os.replace(out_path + ".tmp", out_path)
+            fetched += 1
+            if args.pause:
+                time.sleep(args.pause)
+    print(f"{len(cells)} cells x {len(years)} years: {fetched} requests saved, {skipped} already present")
+
+
+def build(args: argparse.Namespace) -> None:
+    t0 = time.perf_counter()
+    entries: List[Tuple[float, float, int, RasterEntry]] = []
+    files = empty = 0
+    for path in _dump_files(args.dumps):
+        files += 1
+        for cell_lat, cell_lon, year, payload in dump_records(path):
+            try:
+                daily, hourly = rainfall_stats_from_payload(payload, year)
+            except HTTPException:
+                # no precipitation values for this location; leave it to the live path
+                empty += 1
+                continue
+            entries.append((cell_lat, cell_lon, year, (
+                daily["max_daily_precip_mm"],
+                daily["max_daily_precip_date"],
+                hourly["max_hourly_precip_mm"],
+                hourly["max_hourly_precip_time"],
+            )))
+    t1 = time.perf_counter()
+    raster = RainfallRaster.from_entries(entries)
+    size = write_raster(raster, args.output)
+    t2 = time.perf_counter()
+
+    stats = raster.stats()
+    print(
+        f"{stats['entries']} cell-years from {files} files ({empty} without data) -> {args.output} "
+        f"({size} bytes; years {stats['years']}, lat {stats['lat_range']}, lon {stats['lon_range']}; "
+        f"parse {t1 - t0:.3f}s, write {t2 - t1:.3f}s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_fetch = sub.add_parser("fetch", help="save archive responses for a bounding box (needs network)")
+    p_fetch.add_argument("--years", required=True, help="YYYY or YYYY-YYYY")
+    p_fetch.add_argument("--bbox", default=",".join(str(v) for v in INDIA_BBOX), help="south,west,north,east")
+    p_fetch.add_argument("--out-dir", default="rainfall_dumps")
+    p_fetch.add_argument("--batch", type=int, default=upstream.DISPATCH_MAX_BATCH, help="cells per request")
+    p_fetch.add_argument("--pause", type=float, default=0.0, help="seconds between requests")
+    p_fetch.set_defaults(func=fetch)
+
+    p_build = sub.add_parser("build", help="compile stored responses into the raster file")
+    p_build.add_argument("dumps", nargs="+", help="dump files or directories")
+    p_build.add_argument("-o", "--output", default="rainfall_raster.bin")
+    p_build.set_defaults(func=build)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
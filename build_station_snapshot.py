@@ -0,0 +1,34 @@
+"""
+Compile the CGWB/WRIS station CSV into a binary snapshot that API workers
+memory-map at startup instead of parsing the CSV.
+
+    python build_station_snapshot.py [india_gw_stations.csv] [india_gw_stations.snap]
+
+The snapshot records the CSV size/mtime; workers ignore it once the CSV changes.
+"""
+import argparse
+import time
+
+from station_store import read_station_csv, write_snapshot
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("csv_path", nargs="?", default="india_gw_stations.csv")
+    parser.add_argument("snapshot_path", nargs="?", default="india_gw_stations.snap")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    store = read_station_csv(args.csv_path)
+    t1 = time.perf_counter()
+    size = write_snapshot(store, args.snapshot_path, csv_path=args.csv_path)
+    t2 = time.perf_counter()
+
+    print(
+        f"{len(store)} stations ({len(store.history)} dated readings) from {args.csv_path} -> {args.snapshot_path} "
+        f"({size} bytes; parse {t1 - t0:.3f}s, write {t2 - t1:.3f}s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+Runoff, C I A and recharge-pit sizing shared by /rwh-design and the batch
+endpoint. Inputs are arrays so a whole batch is sized in one pass; single
+requests go through the same code with one-element arrays.
+
+Also the response shaping both endpoints offer (compact=true, fields=) and
+DesignMemo, the /rwh-design result memo.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (category, components) by groundwater depth class: <= 3 m, 3-10 m, >= 10 m bgl
+DESIGN_CLASSES = (
+    (
+        "Storage only (rainwater harvesting tank). Groundwater is shallow (0–3 m bgl).",
+        ["storage_tank"],
+    ),
+    (
+        "Recharge pit + storage tank (depth between 3–10 m bgl).",
+        ["recharge_pit", "storage_tank"],
+    ),
+    (
+        "Recharge pit + storage tank + recharge trench (depth ≥ 10 m bgl).",
+        ["recharge_pit", "storage_tank", "recharge_trench"],
+    ),
+)
+
+# top-level blocks of a design result, in response order
+DESIGN_SECTIONS = ("input", "groundwater", "rainfall", "runoff_calculation", "design")
+# dropped at any depth by compact_result(): explanatory notes and the
+# legacy alias of max_hourly_precip_mm
+VERBOSE_KEYS = frozenset({"note", "max_hourly_prec_mm"})
+# results kept by DesignMemo
+DESIGN_MEMO_SIZE = 4096
+
+DESIGN_NOTE = (
+    "Runoff volume is computed using rainfall depth from max daily rainfall (mm/day), "
+    "runoffDepth = C * rainfallDepth, Volume = runoffDepth * Area. "
+    "Q_cia_m3_per_hr uses C I A with I from max hourly rainfall (mm/hour). "
+    "Recharge pit volume is taken equal to total runoff volume when depth > 3 m bgl. "
+    "Pit dimensions assume a rectangular pit with L:B = 2:1 and depth based on volume class."
+)
+
+
+def compute_design_arrays(
+    rooftop_area_m2: np.ndarray,
+    c_runoff: np.ndarray,
+    max_daily_mm: np.ndarray,
+    max_hourly_mm: np.ndarray,
+    depth_m: np.ndarray,
+) -> Dict[str, np.ndarray]:
+    """Element-wise the same arithmetic (and therefore the same floats) as the scalar formulas."""
+    rainfall_depth_m = max_daily_mm / 1000.0
+    runoff_depth_m = c_runoff * rainfall_depth_m
+    runoff_volume_m3 = runoff_depth_m * rooftop_area_m2
+
+    i_m_per_hr = max_hourly_mm / 1000.0
+    q_cia_m3_per_hr = c_runoff * i_m_per_hr * rooftop_area_m2
+
+    design_class = np.where(depth_m <= 3.0, 0, np.where(depth_m < 10.0, 1, 2))
+    recharge_pit_volume_m3 = np.where(design_class == 0, 0.0, runoff_volume_m3)
+
+    # pit depth by volume class, L:B = 2:1 (see design_recharge_pit_dimensions)
+    pit_depth_m = np.where(
+        recharge_pit_volume_m3 <= 10.0, 2.0, np.where(recharge_pit_volume_m3 <= 50.0, 3.0, 4.0)
+    )
+    # no pit is designed for non-positive volumes; clamp so sqrt stays quiet
+    pit_breadth_m = np.sqrt(np.maximum(recharge_pit_volume_m3, 0.0) / pit_depth_m / 2.0)
+    pit_length_m = 2.0 * pit_breadth_m
+
+    return {
+        "rainfall_depth_m": rainfall_depth_m,
+        "runoff_depth_m": runoff_depth_m,
+        "runoff_volume_m3": runoff_volume_m3,
+        "i_mm_per_hr": max_hourly_mm,
+        "i_m_per_hr": i_m_per_hr,
+        "q_cia_m3_per_hr": q_cia_m3_per_hr,
+        "design_class": design_class,
+        "recharge_pit_volume_m3": recharge_pit_volume_m3,
+        "pit_length_m": pit_length_m,
+        "pit_breadth_m": pit_breadth_m,
+        "pit_depth_m": pit_depth_m,
+    }
+
+
+def design_result(
+    arrays: Dict[str, np.ndarray],
+    i: int,
+    inputs: Dict[str, object],
+    gw_info: Dict[str, object],
+    daily_rain: Dict[str, object],
+    hourly_rain: Dict[str, object],
+    c_runoff: float,
+) -> Dict[str, object]:
+    """Assemble the /rwh-design response for element i of compute_design_arrays()."""
+    design_class = int(arrays["design_class"][i])
+    category, components = DESIGN_CLASSES[design_class]
+    pit_volume = float(arrays["recharge_pit_volume_m3"][i])
+
+    pit_dimensions: Optional[Dict[str, float]] = None
+    if design_class > 0 and pit_volume > 0:
+        pit_dimensions = {
+            "length_m": round(float(arrays["pit_length_m"][i]), 2),
+            "breadth_m": round(float(arrays["pit_breadth_m"][i]), 2),
+            "depth_m": float(arrays["pit_depth_m"][i]),
+        }
+
+    return {
+        "input": inputs,
+        "groundwater": gw_info,
+        "rainfall": {
+            "daily": daily_rain,
+            "hourly": hourly_rain,
+        },
+        "runoff_calculation": {
+            "runoff_coefficient": c_runoff,
+            "rainfall_depth_m_from_max_daily": float(arrays["rainfall_depth_m"][i]),
+            "runoff_depth_m": float(arrays["runoff_depth_m"][i]),
+            "runoff_volume_m3": float(arrays["runoff_volume_m3"][i]),
+            "i_mm_per_hr_from_max_hourly": float(arrays["i_mm_per_hr"][i]),
+            "i_m_per_hr_from_max_hourly": float(arrays["i_m_per_hr"][i]),
+            "q_cia_m3_per_hr": float(arrays["q_cia_m3_per_hr"][i]),
+        },
+        "design": {
+            "category": category,
+            "components": list(components),
+            "recharge_pit_volume_m3": pit_volume,
+            "recharge_pit_dimensions_m": pit_dimensions,
+            "feasible": "yes" if design_class > 0 else "no",
+            "note": DESIGN_NOTE,
+        },
+    }
+
+
+def compact_result(value):
+    """Copy of a result without VERBOSE_KEYS; lists of plain values are shared, not copied."""
+    if isinstance(value, dict):
+        return {k: compact_result(v) for k, v in value.items() if k not in VERBOSE_KEYS}
+    if isinstance(value, list) and value and isinstance(value[0], (dict, list)):
+        return [compact_result(v) for v in value]
+    return value
+
+
+def select_fields(result: Dict[str, object], paths: Sequence[Tuple[str, ...]]) -> Dict[str, object]:
+    """
+    Copy of result holding only the given key paths ("design.category" is
+    ("design", "category")), in result order. Paths the result does not
+    have are left out; a path wins over the longer paths below it.
+    """
+    spec: Dict[str, object] = {}
+    for path in paths:
+        node = spec
+        for key in path[:-1]:
+            child = node.setdefault(key, {})
+            if child is True:
+                break
+            node = child
+        else:
+            node[path[-1]] = True
+
+    def pick(value: Dict[str, object], spec: Dict[str, object]) -> Dict[str, object]:
+        out = {}
+        for key, sub in value.items():
+            want = spec.get(key)
+            if want is True:
+                out[key] = sub
+            elif want is not None and isinstance(sub, dict):
+                out[key] = pick(sub, want)
+        return out
+
+    return pick(result, spec)
+
+
+class DesignMemo:
+    """
+    LRU of design results by normalised inputs. A value is shared by every
+    request that hits it, so callers must copy before modifying. Entries
+    put with a ttl_s expire after it; None keeps them until evicted.
+    """
+
+    def __init__(self, size: int = DESIGN_MEMO_SIZE):
+        self.size = size
+        self._entries: "OrderedDict[Hashable, Tuple[Dict[str, object], Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key: Hashable) -> Optional[Dict[str, object]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Dict[str, object], ttl_s: Optional[float] = None) -> None:
+        expires = None if ttl_s is None else time.monotonic() + ttl_s
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, object]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "size": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+        }
@@ -0,0 +1,27 @@
+"""
+Compact JSON encoding for API responses: orjson (in requirements.txt,
+several times faster on the nested design results), or the standard library
+with the same compact separators where it is not installed.
+
+orjson writes NaN/Infinity as null, where the standard library path raises
+ValueError like Starlette's JSONResponse does.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # optional
+    orjson = None
+
+ENCODER = "orjson" if orjson is not None else "json"
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: object) -> bytes:
+        return orjson.dumps(obj, option=_OPTIONS)
+
+else:
+
+    def dumps(obj: object) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
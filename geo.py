@@ -0,0 +1,40 @@
+import math
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+# Half the Earth's circumference: no two points on the sphere are further apart.
+MAX_GREAT_CIRCLE_KM = math.pi * EARTH_RADIUS_KM
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    R = EARTH_RADIUS_KM
+    p1 = math.radians(lat1)
+    p2 = math.radians(lat2)
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def haversine_km_array(lat1, lon1, lat2, lon2):
+    """haversine_km over NumPy arrays (broadcasting), for bulk distance matrices."""
+    p1 = np.radians(lat1)
+    p2 = np.radians(lat2)
+    dlat = np.radians(np.subtract(lat2, lat1))
+    dlon = np.radians(np.subtract(lon2, lon1))
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def haversine_km_rad_array(lat1, lon1, lat2, lon2):
+    """haversine_km_array for coordinates already in radians (StationStore.lat_rad / lon_rad)."""
+    dlat = np.subtract(lat2, lat1)
+    dlon = np.subtract(lon2, lon1)
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
@@ -0,0 +1,146 @@
+"""
+Intensity-duration-frequency (IDF) curves from multi-year hourly series.
+
+Annual maxima of rolling totals are taken for each duration (one cumulative
+sum over all years, then a windowed difference and a per-year reduceat) and
+fitted per duration with L-moments, either Gumbel (EV1) or GEV. Return levels
+are reported both as depths (mm) and mean intensities (mm/hour).
+"""
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+IDF_DURATIONS_H = (1, 2, 3, 6, 12, 24)
+IDF_RETURN_PERIODS = (2, 5, 10, 25, 50, 100)
+IDF_DISTRIBUTIONS = ("gumbel", "gev")
+IDF_DEFAULT_YEARS = 30
+
+# years with less hourly data than this are left out of the fit
+IDF_MIN_COVERAGE = 0.9
+# fewer annual maxima than this give return levels too unstable to use
+IDF_MIN_YEARS = 5
+
+_EULER_GAMMA = 0.5772156649015329
+
+
+def annual_maxima(
+    series: Sequence[np.ndarray],
+    durations_h: Sequence[int] = IDF_DURATIONS_H,
+    breaks: Optional[Sequence[bool]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Max rolling total (mm) per year and duration -> (n_years, n_durations),
+    plus each year's fraction of non-missing hours. Series are years of
+    hourly values (NaN = missing); a window is credited to the year it
+    starts in, so it may run into the next series unless breaks marks that
+    year (True where the next series is not the following year).
+    """
+    lengths = np.array([len(s) for s in series], dtype=np.int64)
+    if len(lengths) == 0 or lengths.min() < max(durations_h):
+        raise ValueError("every year needs at least as many hours as the longest duration")
+    x = np.concatenate(series)
+    missing = np.isnan(x)
+    cumulative = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, x), dtype=np.float64)))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    ends = starts + lengths
+    clipped = ends[:-1][np.asarray(breaks, dtype=bool)[:-1]] if breaks is not None else ends[:0]
+
+    maxima = np.empty((len(lengths), len(durations_h)))
+    for k, d in enumerate(durations_h):
+        totals = cumulative[d:] - cumulative[:-d]
+        # windows that would cross a gap between years
+        for end in clipped.tolist():
+            totals[end - d + 1: end] = -np.inf
+        maxima[:, k] = np.maximum.reduceat(totals, starts)
+    coverage = np.add.reduceat(~missing, starts) / lengths
+    return maxima, coverage
+
+
+def lmoments(sample: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """First three sample L-moments of each column (unbiased probability-weighted moments)."""
+    x = np.sort(sample, axis=0)
+    n = x.shape[0]
+    j = np.arange(n, dtype=np.float64)[:, None]
+    b0 = x.mean(axis=0)
+    b1 = (j / (n - 1) * x).mean(axis=0)
+    b2 = (j * (j - 1) / ((n - 1) * (n - 2)) * x).mean(axis=0)
+    return b0, 2 * b1 - b0, 6 * b2 - 6 * b1 + b0
+
+
+def _reduced_variate(return_periods: np.ndarray) -> np.ndarray:
+    # -ln(F) for the annual non-exceedance probability F = 1 - 1/T
+    return -np.log(1.0 - 1.0 / return_periods)
+
+
+def gumbel_return_levels(maxima: np.ndarray, return_periods: Sequence[float]) -> np.ndarray:
+    """(n_periods, n_durations) return levels from a Gumbel fit to each column."""
+    l1, l2, _ = lmoments(maxima)
+    alpha = l2 / math.log(2.0)
+    xi = l1 - _EULER_GAMMA * alpha
+    y = -np.log(_reduced_variate(np.asarray(return_periods, dtype=np.float64)))
+    return xi[None, :] + alpha[None, :] * y[:, None]
+
+
+def gev_return_levels(maxima: np.ndarray, return_periods: Sequence[float]) -> np.ndarray:
+    """(n_periods, n_durations) return levels from a GEV fit (Hosking's L-moment estimator)."""
+    l1, l2, l3 = lmoments(maxima)
+    t3 = np.divide(l3, l2, out=np.zeros_like(l3), where=l2 > 0)
+    c = 2.0 / (3.0 + t3) - math.log(2.0) / math.log(3.0)
+    k = 7.8590 * c + 2.9554 * c * c
+
+    # k -> 0 is the Gumbel limit; substitute a tiny k there to keep one formula
+    k = np.where(np.abs(k) < 1e-6, 1e-6, k)
+    gamma_1k = np.array([math.gamma(1.0 + v) for v in k])
+    alpha = l2 * k / ((1.0 - 2.0 ** -k) * gamma_1k)
+    xi = l1 - alpha * (1.0 - gamma_1k) / k
+
+    y = _reduced_variate(np.asarray(return_periods, dtype=np.float64))[:, None]
+    return xi[None, :] + alpha[None, :] / k[None, :] * (1.0 - y ** k[None, :])
+
+
+def idf_table(
+    series_by_year: Dict[int, np.ndarray],
+    return_periods: Sequence[float] = IDF_RETURN_PERIODS,
+    durations_h: Sequence[int] = IDF_DURATIONS_H,
+    distribution: str = "gumbel",
+) -> Dict[str, object]:
+    """
+    IDF values for years of hourly series (rolling windows do not cross a
+    missing or dropped year). Raises ValueError when
+    the inputs cannot support a fit (too few usable years, bad arguments).
+    """
+    if distribution not in IDF_DISTRIBUTIONS:
+        raise ValueError(f"distribution must be one of {', '.join(IDF_DISTRIBUTIONS)}")
+    if any(t <= 1 for t in return_periods):
+        raise ValueError("return periods must be greater than 1 year")
+
+    # a year shorter than the longest window (e.g. the first days of the
+    # running year) cannot hold an annual maximum
+    too_short = sorted(y for y, s in series_by_year.items() if len(s) < max(durations_h))
+    years = sorted(y for y in series_by_year if y not in too_short)
+    if not years:
+        raise ValueError("no year has enough hourly data")
+    breaks = [b != a + 1 for a, b in zip(years, years[1:])] + [True]
+    maxima, coverage = annual_maxima([series_by_year[y] for y in years], durations_h, breaks)
+    usable = coverage >= IDF_MIN_COVERAGE
+    used_years: List[int] = [y for y, ok in zip(years, usable) if ok]
+    if len(used_years) < IDF_MIN_YEARS:
+        raise ValueError(
+            f"{len(used_years)} year(s) with at least {IDF_MIN_COVERAGE:.0%} hourly coverage; "
+            f"{IDF_MIN_YEARS} needed"
+        )
+
+    fit = gumbel_return_levels if distribution == "gumbel" else gev_return_levels
+    depth = np.maximum(fit(maxima[usable], return_periods), 0.0)
+    intensity = depth / np.asarray(durations_h, dtype=np.float64)[None, :]
+    return {
+        "distribution": distribution,
+        "years": [used_years[0], used_years[-1]],
+        "n_years": len(used_years),
+        "skipped_years": sorted(too_short + [y for y, ok in zip(years, usable) if not ok]),
+        "durations_h": list(durations_h),
+        "return_periods_years": list(return_periods),
+        "depth_mm": np.round(depth, 2).tolist(),
+        "intensity_mm_per_hr": np.round(intensity, 2).tolist(),
+    }
@@ -0,0 +1,198 @@
+"""
+Groundwater depth interpolated from the k nearest stations.
+
+- idw:     inverse-distance weighting, w = 1 / d**power (a station at the
+           query point gets its own depth)
+- kriging: ordinary kriging with an exponential variogram fitted once per
+           station store; every query point's (k+1) x (k+1) system is solved
+           in one batched np.linalg.solve
+
+Both work on whole arrays of query points, so a single point and a map grid
+go through the same code.
+"""
+import math
+import weakref
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from geo import haversine_km_rad_array
+from station_store import StationStore
+
+INTERPOLATION_METHODS = ("idw", "kriging")
+DEFAULT_K = 8
+DEFAULT_IDW_POWER = 2.0
+
+# distances below this count as "at the station"
+_SAME_POINT_KM = 1e-6
+# bytes of one (n, k+1, k+1) float64 system stack per batched kriging solve;
+# the solve holds a few arrays that size, so this bounds its peak memory
+# whatever k is
+_KRIGING_CHUNK_BYTES = 16 * 1024 * 1024
+
+
+def kriging_chunk(k: int) -> int:
+    """Query points per batched kriging solve for k neighbours."""
+    return max(1, _KRIGING_CHUNK_BYTES // ((k + 1) ** 2 * 8))
+
+# variogram fit: stations sampled, lag bins, candidate practical ranges
+VARIOGRAM_SAMPLE = 2000
+VARIOGRAM_MAX_LAG_KM = 200.0
+VARIOGRAM_BINS = 20
+_VARIOGRAM_RANGES_KM = np.geomspace(5.0, 400.0, 60)
+
+_variograms: "weakref.WeakKeyDictionary[StationStore, Tuple[float, float, float]]" = weakref.WeakKeyDictionary()
+
+
+def depth_mask(store: StationStore, as_of_day: Optional[int] = None) -> np.ndarray:
+    """Stations usable for interpolation: finite coordinates and a depth (read by as_of_day)."""
+    located = np.isfinite(store.lat) & np.isfinite(store.lon)
+    if as_of_day is None:
+        return located & np.isfinite(store.depth)
+    return located & (store.history.first_day() <= as_of_day)
+
+
+def fit_variogram(store: StationStore, seed: int = 0) -> Tuple[float, float, float]:
+    """
+    (nugget, partial sill, practical range km) of an exponential variogram,
+    gamma(h) = nugget + psill * (1 - exp(-3h / range)), fitted by weighted
+    least squares to the binned semivariogram of a station sample.
+    """
+    rows = np.flatnonzero(depth_mask(store))
+    if len(rows) > VARIOGRAM_SAMPLE:
+        rows = np.random.default_rng(seed).choice(rows, VARIOGRAM_SAMPLE, replace=False)
+    variance = float(np.var(store.depth[rows])) if len(rows) else 0.0
+    if len(rows) < 3 or variance <= 0.0:
+        return max(variance, 1e-6), 0.0, VARIOGRAM_MAX_LAG_KM
+
+    i, j = np.triu_indices(len(rows), k=1)
+    lat, lon = store.lat_rad[rows], store.lon_rad[rows]
+    h = haversine_km_rad_array(lat[i], lon[i], lat[j], lon[j])
+    sq = 0.5 * (store.depth[rows][i] - store.depth[rows][j]) ** 2
+    near = h <= VARIOGRAM_MAX_LAG_KM
+    bins = np.minimum((h[near] / VARIOGRAM_MAX_LAG_KM * VARIOGRAM_BINS).astype(np.int64), VARIOGRAM_BINS - 1)
+    counts = np.bincount(bins, minlength=VARIOGRAM_BINS)
+    used = counts > 0
+    if used.sum() < 3:
+        return variance, 0.0, VARIOGRAM_MAX_LAG_KM
+    lag = np.bincount(bins, weights=h[near], minlength=VARIOGRAM_BINS)[used] / counts[used]
+    gamma = np.bincount(bins, weights=sq[near], minlength=VARIOGRAM_BINS)[used] / counts[used]
+    weight = np.sqrt(counts[used])
+
+    best = (math.inf, variance, 0.0, VARIOGRAM_MAX_LAG_KM)
+    for a in _VARIOGRAM_RANGES_KM:
+        # linear in (nugget, psill) once the range is fixed
+        design = np.stack([np.ones_like(lag), 1.0 - np.exp(-3.0 * lag / a)], axis=1)
+        coef, *_ = np.linalg.lstsq(design * weight[:, None], gamma * weight, rcond=None)
+        nugget, psill = max(float(coef[0]), 0.0), max(float(coef[1]), 0.0)
+        err = float(np.sum((weight * (nugget + psill * design[:, 1] - gamma)) ** 2))
+        if err < best[0]:
+            best = (err, nugget, psill, float(a))
+    _, nugget, psill, a = best
+    # a small nugget keeps systems with co-located stations solvable
+    return max(nugget, 1e-6 * variance), psill, a
+
+
+def variogram_for(store: StationStore) -> Tuple[float, float, float]:
+    params = _variograms.get(store)
+    if params is None:
+        params = fit_variogram(store)
+        _variograms[store] = params
+    return params
+
+
+def idw_weights(dist_km: np.ndarray, power: float = DEFAULT_IDW_POWER) -> np.ndarray:
+    """Row-normalised IDW weights for (n_points, k) distances; inf marks an empty slot."""
+    valid = np.isfinite(dist_km)
+    at_station = valid & (dist_km < _SAME_POINT_KM)
+    with np.errstate(divide="ignore"):
+        w = np.where(valid, 1.0 / np.maximum(dist_km, _SAME_POINT_KM) ** power, 0.0)
+    exact = at_station.any(axis=1)
+    w[exact] = at_station[exact]
+    total = w.sum(axis=1, keepdims=True)
+    return np.divide(w, total, out=np.zeros_like(w), where=total > 0)
+
+
+def kriging_weights(
+    store: StationStore, rows: np.ndarray, dist_km: np.ndarray
+) -> np.ndarray:
+    """Ordinary-kriging weights for (n_points, k) neighbour rows; -1 marks an empty slot."""
+    nugget, psill, range_km = variogram_for(store)
+    sill = nugget + psill
+    valid = rows >= 0
+    n, k = rows.shape
+
+    def covariance(h: np.ndarray) -> np.ndarray:
+        return psill * np.exp(-3.0 * h / range_km)
+
+    safe = np.where(valid, rows, 0)
+    lat, lon = store.lat_rad[safe], store.lon_rad[safe]
+    between = haversine_km_rad_array(lat[:, :, None], lon[:, :, None], lat[:, None, :], lon[:, None, :])
+
+    a = np.zeros((n, k + 1, k + 1))
+    a[:, :k, :k] = covariance(between)
+    # the nugget only sits on the diagonal, so co-located stations stay distinct
+    a[:, np.arange(k), np.arange(k)] = sill
+    a[:, :k, k] = 1.0
+    a[:, k, :k] = 1.0
+    b = np.zeros((n, k + 1))
+    b[:, :k] = covariance(np.where(valid, dist_km, 0.0))
+    b[:, k] = 1.0
+
+    # empty slots become decoupled unknowns with zero weight
+    empty = ~valid
+    pair = empty[:, :, None] | empty[:, None, :]
+    a[:, :k, :k][pair] = 0.0
+    a[:, :k, k][empty] = 0.0
+    a[:, k, :k][empty] = 0.0
+    diag = a[:, np.arange(k), np.arange(k)]
+    diag[empty] = 1.0
+    a[:, np.arange(k), np.arange(k)] = diag
+    b[:, :k][empty] = 0.0
+    # points with no neighbour at all: keep the system regular, weights stay 0
+    a[~valid.any(axis=1), k, k] = 1.0
+
+    return np.linalg.solve(a, b[:, :, None])[:, :k, 0]
+
+
+def interpolate_depth(
+    store: StationStore,
+    lats: np.ndarray,
+    lons: np.ndarray,
+    method: str = "idw",
+    k: int = DEFAULT_K,
+    max_radius_km: float = 50.0,
+    power: float = DEFAULT_IDW_POWER,
+    as_of_day: Optional[int] = None,
+) -> Dict[str, object]:
+    """
+    Interpolated depth (m bgl; NaN where no station is within max_radius_km)
+    for every query point, plus the neighbour rows, distances, weights and
+    station depths and the method actually used (kriging falls back to idw
+    on a singular system). With as_of_day (days since 1970-01-01) each
+    station contributes its latest reading on or before that day.
+    """
+    if method not in INTERPOLATION_METHODS:
+        raise ValueError(f"method must be one of {', '.join(INTERPOLATION_METHODS)}")
+    rows, dist = store.index.k_nearest(lats, lons, k, max_radius_km, mask=depth_mask(store, as_of_day))
+    if method == "idw":
+        weights = idw_weights(dist, power)
+    else:
+        chunk = kriging_chunk(k)
+        try:
+            weights = np.concatenate([
+                kriging_weights(store, rows[s: s + chunk], dist[s: s + chunk])
+                for s in range(0, len(rows), chunk)
+            ]) if len(rows) else np.zeros_like(dist)
+        except np.linalg.LinAlgError:
+            # degenerate neighbour geometry somewhere in the batch
+            weights = idw_weights(dist, power)
+            method = "idw"
+
+    if as_of_day is None:
+        values = np.where(rows >= 0, store.depth[np.maximum(rows, 0)], np.nan)
+    else:
+        values = store.history.as_of(rows.ravel(), as_of_day)[0].reshape(rows.shape)
+    depth = np.einsum("pk,pk->p", weights, np.where(rows >= 0, values, 0.0))
+    depth[(rows < 0).all(axis=1)] = np.nan
+    return {"depth": depth, "rows": rows, "dist": dist, "weights": weights, "values": values, "method": method}
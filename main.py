@@ -1,26 +1,120 @@
-from fastapi import FastAPI, HTTPException, Query
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-import requests
-import csv
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+import json
 import math
+import hmac
 import logging
-from typing import List, Dict, Optional
+import os
+import re
+import threading
+import time
+import zlib
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from design import (
+    DESIGN_SECTIONS,
+    DesignMemo,
+    compact_result,
+    compute_design_arrays,
+    design_result,
+    select_fields,
+)
+from idf import IDF_DEFAULT_YEARS, IDF_DISTRIBUTIONS, IDF_MIN_YEARS, IDF_RETURN_PERIODS
+from interpolation import DEFAULT_IDW_POWER, DEFAULT_K, INTERPOLATION_METHODS, depth_mask, interpolate_depth
+from geo import haversine_km
+import fast_json
+from metrics import (
+    TimedJSONResponse,
+    TimingMiddleware,
+    register_collector,
+    render_prometheus,
+    stage,
+    timed,
+)
+from rainfall import (
+    ARCHIVE_FIRST_YEAR,
+    OPEN_METEO_URL,
+    archive_dispatcher,
+    design_storm_results,
+    fetch_daily_series_async,
+    fetch_idf_async,
+    fetch_rainfall_stats,
+    fetch_rainfall_stats_async,
+    load_rainfall_raster,
+    rainfall_cache,
+)
+from rainfall_cache import rainfall_cell, ttl_for_year
+from station_history import SEASONS, format_day, parse_day
+from station_store import StationCsvLoader, StationStore, load_station_store
+from station_tiles import MAX_CLUSTER_ZOOM, MAX_TILE_ZOOM, StationTiles, mercator_xy, tiles_for
+from storage import (
+    DEFAULT_DEMAND_L_PER_DAY,
+    DEFAULT_FIRST_FLUSH_MM,
+    DEFAULT_STORAGE_YEARS,
+    DEFAULT_TARGET_RELIABILITY,
+    storage_sizing,
+)
+import rainfall
+import upstream
 
 # ---------------- logging ----------------
+# DEBUG formats per-request detail on the hot path; keep it off in production
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
 logger = logging.getLogger("new_rtrwh")
-logger.setLevel(logging.DEBUG)
+logger.setLevel(LOG_LEVEL)
 handler = logging.StreamHandler()
-handler.setLevel(logging.DEBUG)
+handler.setLevel(LOG_LEVEL)
 formatter = logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
 handler.setFormatter(formatter)
 if not logger.handlers:
     logger.addHandler(handler)
 # -----------------------------------------
 
+INDIA_GW_FILE = "india_gw_stations.csv"
+# Built by build_station_snapshot.py; memory-mapped when it matches the CSV.
+INDIA_GW_SNAPSHOT = "india_gw_stations.snap"
+# poll the CSV every N seconds and reload it when it changes (0 = off)
+INDIA_GW_WATCH_SECONDS = float(os.environ.get("INDIA_GW_WATCH_SECONDS", "0"))
+# /admin endpoints require a matching X-Admin-Token header; they are disabled when unset
+ADMIN_TOKEN = os.environ.get("RTRWH_ADMIN_TOKEN")
+india_store: Optional[StationStore] = None
+_india_lock = threading.Lock()
+# keeps parsed CSV chunks so a reload only re-parses what changed
+_india_loader = StationCsvLoader(INDIA_GW_FILE)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load station data before serving so no request pays the cold load.
+    # Failures are logged here and re-raised as 500s by the request path.
+    try:
+        load_india_data()
+    except HTTPException as e:
+        logger.error("Station data not loaded at startup: %s", e.detail)
+    load_rainfall_raster()
+    upstream.get_async_client()
+    watcher = None
+    if INDIA_GW_WATCH_SECONDS > 0:
+        watcher = asyncio.create_task(_watch_station_file(INDIA_GW_WATCH_SECONDS))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+    await upstream.close_async_client()
+
+
 app = FastAPI(
     title="Groundwater Depth + RWH API",
     description="CGWB/WRIS groundwater depth + Rooftop RWH sizing",
-    version="1.4.0"
+    version="1.4.0",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse,
 )
 
 # ---------- CORS CONFIGURATION ----------
@@ -31,13 +125,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 # ----------------------------------------
-
-OPEN_METEO_URL = "https://archive-api.open-meteo.com/v1/archive"
-INDIA_GW_FILE = "india_gw_stations.csv"
-india_stations: List[Dict[str, str]] = []
-india_data_loaded = False
+# Batch streams and large grids/station lists; single designs stay below
+# the threshold and are sent as is.
+GZIP_MIN_BYTES = 32 * 1024
+GZIP_LEVEL = 5
+app.add_middleware(GZipMiddleware, minimum_size=GZIP_MIN_BYTES, compresslevel=GZIP_LEVEL)
+# outermost: request latency, stage timings, Server-Timing header
+app.add_middleware(TimingMiddleware)
 
 
 @app.get("/")
@@ -45,107 +142,375 @@ def root():
     return {
         "message": "Groundwater Depth + RWH API",
         "endpoints": [
-            "/gw-depth-india (CGWB/WRIS local CSV)",
-            "/rwh-design (Rooftop rainwater harvesting design helper)"
+            "/gw-depth-india (CGWB/WRIS local CSV; method=nearest|idw|kriging, as_of=YYYY-MM-DD)",
+            "/gw-depth-india/grid (depth raster for a bbox and resolution)",
+            "/gw-depth-india/history (a station's dated readings and pre/post-monsoon trends)",
+            "/stations (stations or zoom clusters inside bbox=south,west,north,east)",
+            "/stations/tiles/{z}/{x}/{y} (clustered stations per XYZ map tile, compact or geojson)",
+            "/rwh-design (Rooftop rainwater harvesting design helper; return_period_years= sizes for a design storm; "
+            "fields= / compact=true trim the result; ETag + If-None-Match -> 304)",
+            "/rwh-design/batch (POST JSON array or JSONL of rooftops, streams NDJSON, gzip if accepted)",
+            "/rwh-storage (storage tank sizing from a daily water-balance simulation)",
+            "/rainfall/idf (intensity-duration-frequency table from multi-year hourly data)",
+            "/rainfall-cache/stats (Open-Meteo archive cache and rainfall raster counters)",
+            "/upstream/stats (Open-Meteo request coalescing and batch sizes)",
+            "/metrics (Prometheus: request/stage/upstream latency histograms, cache hit ratios)",
+            "/admin/stations (loaded station data version and last reload)",
+            "/admin/stations/reload (POST: re-read the station CSV and swap it in)",
         ]
     }
 
 
-def load_india_data():
-    global india_stations, india_data_loaded
+def load_india_data() -> StationStore:
+    global india_store
 
-    if india_data_loaded:
-        return
+    store = india_store
+    if store is not None:
+        return store
 
+    # threadpool requests can race here if startup loading failed
+    with _india_lock:
+        if india_store is not None:
+            return india_store
+        try:
+            store = load_station_store(INDIA_GW_FILE, INDIA_GW_SNAPSHOT, loader=_india_loader)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=500,
+                detail=(
+                    f"File '{INDIA_GW_FILE}' not found. "
+                    f"Place it next to main.py with columns: "
+                    f"station_id,station_name,latitude,longitude,depth_m_bgl,date,state,district"
+                ),
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error loading '{INDIA_GW_FILE}': {e}",
+            )
+        # per-zoom clusters are built here so no tile request pays for them
+        tiles_for(store)
+        logger.info("Loaded %d stations from %s", len(store), store.source)
+        india_store = store
+    return store
+
+
+# ---------- station data reload ----------
+_reload_lock = threading.Lock()
+last_reload: Optional[Dict[str, object]] = None
+
+
+def reload_india_data() -> Dict[str, object]:
+    # Builds the new store, index and tiles while requests keep using the
+    # old one, then swaps the global. Handlers read india_store once, so a
+    # request in flight finishes against the version it started with.
+    global india_store, last_reload
+    if not _reload_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A station data reload is already running")
     try:
-        with open(INDIA_GW_FILE, newline="", encoding="utf-8") as f:
-            reader = csv.DictReader(f)
-            india_stations = [row for row in reader]
-        if not india_stations:
-            raise RuntimeError("CSV has no rows")
-    except FileNotFoundError:
-        raise HTTPException(
-            status_code=500,
-            detail=(
-                f"File '{INDIA_GW_FILE}' not found. "
-                f"Place it next to main.py with columns: "
-                f"station_id,station_name,latitude,longitude,depth_m_bgl,date,state,district"
-            ),
-        )
-    except Exception as e:
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error loading '{INDIA_GW_FILE}': {e}",
+        old = india_store
+        t0 = time.perf_counter()
+        try:
+            store, counters = _india_loader.load()
+        except FileNotFoundError:
+            raise HTTPException(status_code=500, detail=f"File '{INDIA_GW_FILE}' not found; old data kept")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Error reloading '{INDIA_GW_FILE}': {e}; old data kept")
+        t1 = time.perf_counter()
+        tiles_for(store)
+        version = store.version
+        t2 = time.perf_counter()
+        with _india_lock:
+            india_store = store
+        t3 = time.perf_counter()
+
+        report = {
+            "old_version": None if old is None else old.version,
+            "new_version": version,
+            "changed": old is None or old.version != version,
+            "stations": len(store),
+            "readings": len(store.history),
+            "csv": counters,
+            "timings_ms": {
+                "load": round((t1 - t0) * 1000, 1),
+                "tiles": round((t2 - t1) * 1000, 1),
+                "swap": round((t3 - t2) * 1000, 3),
+                "total": round((t3 - t0) * 1000, 1),
+            },
+        }
+        last_reload = report
+        logger.info(
+            "Reloaded %d stations from %s: %s -> %s in %.0f ms (%d/%d chunks reused)",
+            len(store), store.source, report["old_version"], version, report["timings_ms"]["total"],
+            counters["chunks_reused"], counters["chunks"],
         )
+        return report
+    finally:
+        _reload_lock.release()
+
+
+async def _watch_station_file(interval_s: float) -> None:
+    loaded = seen = _india_loader.current_stamp()
+    while True:
+        await asyncio.sleep(interval_s)
+        stamp = _india_loader.current_stamp()
+        if stamp is None or stamp == loaded:
+            seen = stamp
+            continue
+        if stamp != seen:
+            # still being written; reload once it has been stable for a tick
+            seen = stamp
+            continue
+        loaded = stamp
+        try:
+            await asyncio.to_thread(reload_india_data)
+        except HTTPException as e:
+            logger.error("Station data reload failed: %s", e.detail)
 
-    india_data_loaded = True
 
+def _require_admin(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set RTRWH_ADMIN_TOKEN")
+    token = request.headers.get("x-admin-token", "")
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Missing or wrong X-Admin-Token")
+
+
+@app.get("/admin/stations")
+def admin_stations(request: Request):
+    _require_admin(request)
+    store = load_india_data()
+    return {
+        "version": store.version,
+        "source": store.source,
+        "stations": len(store),
+        "readings": len(store.history),
+        "csv_stamp": _india_loader.stamp,
+        "watch_seconds": INDIA_GW_WATCH_SECONDS,
+        "last_reload": last_reload,
+    }
 
-def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
-    R = 6371.0
-    p1 = math.radians(lat1)
-    p2 = math.radians(lat2)
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
 
-    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+@app.post("/admin/stations/reload")
+async def admin_reload_stations(request: Request):
+    _require_admin(request)
+    return await asyncio.to_thread(reload_india_data)
+
+
+def _parse_as_of(as_of: Optional[str]) -> Optional[int]:
+    if as_of is None:
+        return None
+    day = parse_day(as_of)
+    if day is None:
+        raise HTTPException(status_code=400, detail=f"Expected a date (YYYY-MM-DD), got '{as_of}'")
+    return day
 
 
 def get_india_depth_for_point(
     lat: float,
     lon: float,
     max_radius_km: float = 50.0,
+    as_of_day: Optional[int] = None,
 ) -> Dict[str, object]:
     if not (-90 <= lat <= 90 and -180 <= lon <= 180):
         raise HTTPException(status_code=400, detail="Invalid lat/lon")
 
-    load_india_data()
-
-    nearest_station: Optional[Dict[str, str]] = None
-    nearest_dist_km: float = float("inf")
-
-    for row in india_stations:
-        try:
-            s_lat = float(row["latitude"])
-            s_lon = float(row["longitude"])
-        except (KeyError, ValueError):
-            continue
-
-        dist = haversine_km(lat, lon, s_lat, s_lon)
-        if dist < nearest_dist_km:
-            nearest_dist_km = dist
-            nearest_station = row
-
-    if nearest_station is None or nearest_dist_km > max_radius_km:
+    store = load_india_data()
+
+    with stage("station"):
+        if as_of_day is None:
+            hit = store.index.nearest(lat, lon, max_radius_km)
+        else:
+            # nearest station that had been read by then
+            rows, dist = store.index.k_nearest(
+                np.array([lat]), np.array([lon]), 1, max_radius_km, mask=depth_mask(store, as_of_day)
+            )
+            hit = (int(rows[0, 0]), float(dist[0, 0])) if rows[0, 0] >= 0 else None
+    if hit is None:
         raise HTTPException(
             status_code=404,
-            detail=f"No CGWB/WRIS station found within {max_radius_km} km of ({lat},{lon})",
+            detail=f"No CGWB/WRIS station found within {max_radius_km} km of ({lat},{lon})"
+            + ("" if as_of_day is None else f" with a reading on or before {format_day(as_of_day)}"),
         )
+    i, nearest_dist_km = hit
+    return _depth_result(lat, lon, _station_fields(store, i, as_of_day), nearest_dist_km, as_of_day)
 
-    try:
-        depth_m = float(nearest_station["depth_m_bgl"])
-    except (KeyError, ValueError):
+
+def _station_fields(
+    store: StationStore, i: int, as_of_day: Optional[int] = None
+) -> Tuple[Dict[str, object], Dict[str, object]]:
+    # (station, reading) parts of a depth result; distance_km goes between them
+    if as_of_day is None:
+        depth_m = float(store.depth[i])
+        date = store.text("date", i)
+    else:
+        depth, day = store.history.as_of([i], as_of_day)
+        depth_m, date = float(depth[0]), format_day(day[0])
+    if not math.isfinite(depth_m):
         raise HTTPException(
             status_code=500,
             detail="Nearest station has invalid 'depth_m_bgl' value in CSV",
         )
 
-    return {
-        "input_lat": lat,
-        "input_lon": lon,
-        "nearest_station_id": nearest_station.get("station_id"),
-        "nearest_station_name": nearest_station.get("station_name"),
-        "state": nearest_station.get("state"),
-        "district": nearest_station.get("district"),
-        "station_lat": float(nearest_station.get("latitude", 0.0)),
-        "station_lon": float(nearest_station.get("longitude", 0.0)),
-        "distance_km": round(nearest_dist_km, 2),
+    station = {
+        "nearest_station_id": store.text("station_id", i),
+        "nearest_station_name": store.text("station_name", i),
+        "state": store.text("state", i),
+        "district": store.text("district", i),
+        "station_lat": float(store.lat[i]),
+        "station_lon": float(store.lon[i]),
+    }
+    reading = {
         "depth_m_below_ground": round(depth_m, 2),
-        "date": nearest_station.get("date"),
+        "date": date,
         "note": "Depth from CGWB/India-WRIS stations (m below ground level, bgl)",
     }
+    return station, reading
+
+
+def _depth_result(
+    lat: float,
+    lon: float,
+    fields: Tuple[Dict[str, object], Dict[str, object]],
+    distance_km: float,
+    as_of_day: Optional[int] = None,
+) -> Dict[str, object]:
+    station, reading = fields
+    result: Dict[str, object] = {"input_lat": lat, "input_lon": lon}
+    result.update(station)
+    result["distance_km"] = round(distance_km, 2)
+    result.update(reading)
+    if as_of_day is not None:
+        result["as_of"] = format_day(as_of_day)
+    return result
+
+
+def get_india_depths_for_points(
+    points: List[Tuple[float, float, float]]
+) -> Dict[Tuple[float, float, float], object]:
+    # get_india_depth_for_point() for many distinct (lat, lon, max_radius_km):
+    # one k_nearest() call per radius, station fields built once per station
+    # row. Values are results or the HTTPException the single lookup raises.
+    results: Dict[Tuple[float, float, float], object] = {}
+    by_radius: Dict[float, List[Tuple[float, float, float]]] = {}
+    for point in points:
+        lat, lon, radius = point
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            results[point] = HTTPException(status_code=400, detail="Invalid lat/lon")
+        else:
+            by_radius.setdefault(radius, []).append(point)
+    if not by_radius:
+        return results
+    try:
+        store = load_india_data()
+    except HTTPException as e:
+        for group in by_radius.values():
+            results.update((point, e) for point in group)
+        return results
+
+    fields: Dict[int, object] = {}
+    with stage("station"):
+        for radius, group in by_radius.items():
+            # two columns: an exact distance tie is settled by nearest(), so
+            # the lowest row wins like in the single lookup
+            rows, dist = store.index.k_nearest([p[0] for p in group], [p[1] for p in group], 2, radius)
+            for point, (row, second), (d, d_second) in zip(group, rows.tolist(), dist.tolist()):
+                lat, lon, _ = point
+                if second >= 0 and d_second == d:
+                    hit = store.index.nearest(lat, lon, radius)
+                    row = -1 if hit is None else hit[0]
+                if row < 0:
+                    results[point] = HTTPException(
+                        status_code=404,
+                        detail=f"No CGWB/WRIS station found within {radius} km of ({lat},{lon})",
+                    )
+                    continue
+                station = fields.get(row)
+                if station is None:
+                    try:
+                        station = _station_fields(store, row)
+                    except HTTPException as e:
+                        station = e
+                    fields[row] = station
+                if isinstance(station, HTTPException):
+                    results[point] = station
+                else:
+                    distance_km = haversine_km(lat, lon, float(store.lat[row]), float(store.lon[row]))
+                    results[point] = _depth_result(lat, lon, station, distance_km)
+    return results
+
+
+# ---------- interpolation / grid ----------
+GW_MAX_K = 32
+GW_GRID_MAX_CELLS = 250_000
+GW_GRID_MAX_RADIUS_KM = 200.0
+_GW_METHOD_PATTERN = "^(nearest|" + "|".join(INTERPOLATION_METHODS) + ")$"
+
+
+def get_india_depth_interpolated(
+    lat: float,
+    lon: float,
+    method: str,
+    k: int = DEFAULT_K,
+    max_radius_km: float = 50.0,
+    power: float = DEFAULT_IDW_POWER,
+    as_of_day: Optional[int] = None,
+) -> Dict[str, object]:
+    # Same response as the nearest-station lookup (the nearest_* keys still
+    # describe the closest station), with depth interpolated from up to k.
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="Invalid lat/lon")
+
+    store = load_india_data()
+    with stage("interpolate"):
+        result = interpolate_depth(
+            store, np.array([lat]), np.array([lon]), method=method, k=k, max_radius_km=max_radius_km, power=power,
+            as_of_day=as_of_day,
+        )
+    rows, dist, weights = result["rows"][0], result["dist"][0], result["weights"][0]
+    values = result["values"][0]
+    used = rows >= 0
+    if not used.any():
+        raise HTTPException(
+            status_code=404,
+            detail=f"No CGWB/WRIS station with a valid depth within {max_radius_km} km of ({lat},{lon})",
+        )
+    i = int(rows[0])
+    if as_of_day is None:
+        date = store.text("date", i)
+    else:
+        date = format_day(store.history.as_of([i], as_of_day)[1][0])
+
+    response = {
+        "input_lat": lat,
+        "input_lon": lon,
+        "nearest_station_id": store.text("station_id", i),
+        "nearest_station_name": store.text("station_name", i),
+        "state": store.text("state", i),
+        "district": store.text("district", i),
+        "station_lat": float(store.lat[i]),
+        "station_lon": float(store.lon[i]),
+        "distance_km": round(float(dist[0]), 2),
+        "depth_m_below_ground": round(float(result["depth"][0]), 2),
+        "date": date,
+        "interpolation": {
+            "method": result["method"],
+            "k_used": int(used.sum()),
+            "stations": [
+                {
+                    "station_id": store.text("station_id", int(r)),
+                    "distance_km": round(float(d), 2),
+                    "depth_m_bgl": round(float(v), 2),
+                    "weight": round(float(w), 4),
+                }
+                for r, d, w, v in zip(rows[used], dist[used], weights[used], values[used])
+            ],
+        },
+        "note": f"Depth interpolated ({result['method']}) from CGWB/India-WRIS stations (m below ground level, bgl)",
+    }
+    if as_of_day is not None:
+        response["as_of"] = format_day(as_of_day)
+    return response
 
 
 @app.get("/gw-depth-india")
@@ -156,114 +521,442 @@ def gw_depth_india(
         50.0,
         description="Maximum radius (km) to search for nearest CGWB station",
     ),
+    method: str = Query("nearest", pattern=_GW_METHOD_PATTERN, description="nearest, idw or kriging"),
+    k: int = Query(DEFAULT_K, ge=1, le=GW_MAX_K, description="Stations used by idw/kriging"),
+    power: float = Query(DEFAULT_IDW_POWER, gt=0, le=10, description="IDW distance exponent"),
+    as_of: Optional[str] = Query(
+        None, description="YYYY-MM-DD: use each station's latest reading on or before this date"
+    ),
 ):
-    return get_india_depth_for_point(lat=lat, lon=lon, max_radius_km=max_radius_km)
+    as_of_day = _parse_as_of(as_of)
+    if method == "nearest":
+        return get_india_depth_for_point(lat=lat, lon=lon, max_radius_km=max_radius_km, as_of_day=as_of_day)
+    return get_india_depth_interpolated(
+        lat, lon, method, k=k, max_radius_km=max_radius_km, power=power, as_of_day=as_of_day
+    )
 
 
-def fetch_max_daily_rainfall(lat: float, lon: float, year: int = 2024) -> Dict[str, float]:
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": f"{year}-01-01",
-        "end_date": f"{year}-12-31",
-        "daily": "precipitation_sum",
-        "timezone": "auto",
+def _trend_summary(store: StationStore, i: int) -> Dict[str, object]:
+    summary = {}
+    for season in SEASONS:
+        slope = float(store.trends[f"trend_{season}_slope"][i])
+        mean = float(store.trends[f"trend_{season}_mean"][i])
+        summary[season] = {
+            "years": int(store.trends[f"trend_{season}_years"][i]),
+            "slope_m_per_year": round(slope, 4) if math.isfinite(slope) else None,
+            "mean_depth_m_bgl": round(mean, 2) if math.isfinite(mean) else None,
+        }
+    return summary
+
+
+@app.get("/gw-depth-india/history")
+def gw_depth_india_history(
+    station_id: Optional[str] = Query(None, description="CGWB/WRIS station id"),
+    lat: Optional[float] = Query(None, ge=-90, le=90, description="Or: nearest station to lat/lon"),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    max_radius_km: float = Query(50.0, gt=0),
+    start: Optional[str] = Query(None, description="YYYY-MM-DD, first reading date included"),
+    end: Optional[str] = Query(None, description="YYYY-MM-DD, last reading date included"),
+):
+    store = load_india_data()
+    if station_id is not None:
+        i = store.row_for_id(station_id)
+        if i is None:
+            raise HTTPException(status_code=404, detail=f"Unknown station_id '{station_id}'")
+    elif lat is not None and lon is not None:
+        hit = store.index.nearest(lat, lon, max_radius_km)
+        if hit is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No CGWB/WRIS station found within {max_radius_km} km of ({lat},{lon})",
+            )
+        i = hit[0]
+    else:
+        raise HTTPException(status_code=400, detail="Pass station_id or lat and lon")
+
+    days, depths = store.history.series(i)
+    start_day, end_day = _parse_as_of(start), _parse_as_of(end)
+    a = 0 if start_day is None else int(np.searchsorted(days, start_day, side="left"))
+    b = len(days) if end_day is None else int(np.searchsorted(days, end_day, side="right"))
+    days, depths = days[a:b], depths[a:b]
+
+    return {
+        "station_id": store.text("station_id", i),
+        "station_name": store.text("station_name", i),
+        "state": store.text("state", i),
+        "district": store.text("district", i),
+        "station_lat": float(store.lat[i]),
+        "station_lon": float(store.lon[i]),
+        "readings": len(days),
+        "dates": [format_day(d) for d in days.tolist()],
+        "depth_m_bgl": np.round(depths, 2).tolist(),
+        # over the station's whole record, fitted at load
+        "trends": _trend_summary(store, i),
+        "note": (
+            "Depth in m below ground level (bgl). Trend slopes are least-squares fits through "
+            "annual pre-monsoon (Mar-May) and post-monsoon (Oct-Dec) means; positive = water table falling."
+        ),
     }
 
-    try:
-        resp = requests.get(OPEN_METEO_URL, params=params, timeout=20)
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Error calling Open-Meteo (daily): {e}")
 
-    if resp.status_code != 200:
+@app.get("/gw-depth-india/grid")
+def gw_depth_india_grid(
+    south: float = Query(..., ge=-90, le=90),
+    west: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    resolution_deg: float = Query(0.1, gt=0, description="Grid spacing in degrees"),
+    method: str = Query("idw", pattern=_GW_METHOD_PATTERN, description="nearest, idw or kriging"),
+    k: int = Query(DEFAULT_K, ge=1, le=GW_MAX_K),
+    power: float = Query(DEFAULT_IDW_POWER, gt=0, le=10),
+    max_radius_km: float = Query(50.0, gt=0, le=GW_GRID_MAX_RADIUS_KM),
+    as_of: Optional[str] = Query(None, description="YYYY-MM-DD: latest readings on or before this date"),
+):
+    as_of_day = _parse_as_of(as_of)
+    if north < south or east < west:
+        raise HTTPException(status_code=400, detail="bbox must have south <= north and west <= east")
+    n_lat = int(math.floor((north - south) / resolution_deg + 1e-9)) + 1
+    n_lon = int(math.floor((east - west) / resolution_deg + 1e-9)) + 1
+    if n_lat * n_lon > GW_GRID_MAX_CELLS:
         raise HTTPException(
-            status_code=resp.status_code,
-            detail=f"Open-Meteo (daily) returned status {resp.status_code}",
+            status_code=413,
+            detail=f"Grid of {n_lat} x {n_lon} cells exceeds {GW_GRID_MAX_CELLS}; use a coarser resolution",
+        )
+
+    store = load_india_data()
+    lats = south + resolution_deg * np.arange(n_lat)
+    lons = west + resolution_deg * np.arange(n_lon)
+    grid_lat, grid_lon = np.meshgrid(lats, lons, indexing="ij")
+    nearest_only = method == "nearest"
+    with stage("interpolate"):
+        result = interpolate_depth(
+            store, grid_lat.ravel(), grid_lon.ravel(),
+            method="idw" if nearest_only else method,
+            k=1 if nearest_only else k,
+            max_radius_km=max_radius_km,
+            power=power,
+            as_of_day=as_of_day,
         )
+    depth = np.round(result["depth"], 2).reshape(n_lat, n_lon)
+
+    return {
+        "bbox": {"south": south, "west": west, "north": north, "east": east},
+        "resolution_deg": resolution_deg,
+        "shape": [n_lat, n_lon],
+        "method": "nearest" if nearest_only else result["method"],
+        "lats": np.round(lats, 6).tolist(),
+        "lons": np.round(lons, 6).tolist(),
+        # rows run south to north; null where no station is within max_radius_km
+        "depth_m_bgl": np.where(np.isnan(depth), None, depth).tolist(),
+        "note": "Depth interpolated from CGWB/India-WRIS stations (m below ground level, bgl)",
+    }
 
+
+# ---------- station map (bbox / tiles) ----------
+STATIONS_MAX_LIMIT = 50000
+STATIONS_MAX_CLUSTER_TILES = 256
+TILE_MAX_AGE_S = 3600
+_STATION_FORMAT_PATTERN = "^(compact|geojson)$"
+_BBOX_NUMBER = r"-?\d+(\.\d+)?"
+_BBOX_PATTERN = rf"^\s*{_BBOX_NUMBER}\s*,\s*{_BBOX_NUMBER}\s*,\s*{_BBOX_NUMBER}\s*,\s*{_BBOX_NUMBER}\s*$"
+
+
+def _parse_bbox(text: str) -> Tuple[float, float, float, float]:
     try:
-        data = resp.json()
+        south, west, north, east = (float(v) for v in text.split(","))
     except ValueError:
-        raise HTTPException(status_code=500, detail="Failed to parse JSON from Open-Meteo (daily)")
+        raise HTTPException(
+            status_code=400, detail=f"bbox must be four numbers south,west,north,east, got '{text}'"
+        )
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise HTTPException(
+            status_code=400,
+            detail="bbox must be south,west,north,east with south <= north (west > east crosses 180)",
+        )
+    return south, west, north, east
+
+
+def _rounded(values: np.ndarray, digits: int) -> List[Optional[float]]:
+    values = np.round(values.astype(np.float64), digits)
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+def _stations_payload(store: StationStore, rows: np.ndarray, fmt: str) -> Dict[str, object]:
+    ids = [store.text("station_id", int(r)) for r in rows]
+    lat, lon = _rounded(store.lat[rows], 6), _rounded(store.lon[rows], 6)
+    depth = _rounded(store.depth[rows], 2)
+    if fmt == "geojson":
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [x, y]},
+                    "properties": {"station_id": i, "depth_m_bgl": d},
+                }
+                for i, y, x, d in zip(ids, lat, lon, depth)
+            ],
+        }
+    # column arrays: far smaller than one object per station
+    return {"kind": "stations", "count": len(ids), "station_id": ids, "lat": lat, "lon": lon, "depth_m_bgl": depth}
+
+
+def _clusters_payload(clusters: Dict[str, np.ndarray], fmt: str) -> Dict[str, object]:
+    count = clusters["count"].tolist()
+    lat, lon = _rounded(clusters["lat"], 5), _rounded(clusters["lon"], 5)
+    mean, low, high = (_rounded(clusters[k], 2) for k in ("mean_depth", "min_depth", "max_depth"))
+    if fmt == "geojson":
+        return {
+            "type": "FeatureCollection",
+            "features": [
+                {
+                    "type": "Feature",
+                    "geometry": {"type": "Point", "coordinates": [x, y]},
+                    "properties": {"count": n, "mean_depth_m_bgl": m, "min_depth_m_bgl": a, "max_depth_m_bgl": b},
+                }
+                for n, y, x, m, a, b in zip(count, lat, lon, mean, low, high)
+            ],
+        }
+    return {
+        "kind": "clusters",
+        "count": len(count),
+        "stations": int(clusters["count"].sum()),
+        "n": count,
+        "lat": lat,
+        "lon": lon,
+        "mean_depth_m_bgl": mean,
+        "min_depth_m_bgl": low,
+        "max_depth_m_bgl": high,
+    }
 
-    logger.debug("Open-Meteo daily response keys: %s", list(data.keys()))
 
-    try:
-        daily = data["daily"]
-        precip_list = daily["precipitation_sum"]  # mm/day
-        time_list = daily["time"]
-    except KeyError as e:
-        raise HTTPException(status_code=500, detail=f"Missing key in daily response: {e}")
+def _tile_xs(west: float, east: float, zoom: int) -> List[int]:
+    x0 = int(mercator_xy(np.array([0.0]), np.array([west]), zoom)[0][0])
+    x1 = int(mercator_xy(np.array([0.0]), np.array([east]), zoom)[0][0])
+    if x0 <= x1:
+        return list(range(x0, x1 + 1))
+    return list(range(x0, 1 << zoom)) + list(range(0, x1 + 1))
+
 
-    if not precip_list:
+def _bbox_clusters(
+    tiles: StationTiles, zoom: int, south: float, west: float, north: float, east: float
+) -> Dict[str, np.ndarray]:
+    # clusters of every tile overlapping the box, kept when their centroid is inside
+    xs = _tile_xs(west, east, zoom)
+    _, y_top = mercator_xy(np.array([north]), np.array([0.0]), zoom)
+    _, y_bottom = mercator_xy(np.array([south]), np.array([0.0]), zoom)
+    ys = range(int(y_top[0]), int(y_bottom[0]) + 1)
+    if len(xs) * len(ys) > STATIONS_MAX_CLUSTER_TILES:
         raise HTTPException(
-            status_code=404, detail="No daily precipitation data returned from Open-Meteo"
+            status_code=400,
+            detail=f"bbox covers more than {STATIONS_MAX_CLUSTER_TILES} tiles at zoom {zoom}; use a lower zoom",
+        )
+    parts = [tiles.tile_clusters(zoom, x, y) for x in xs for y in ys]
+    merged = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+    lat, lon = merged["lat"], merged["lon"]
+    inside = (lat >= south) & (lat <= north)
+    inside &= ((lon >= west) & (lon <= east)) if west <= east else ((lon >= west) | (lon <= east))
+    return {name: col[inside] for name, col in merged.items()}
+
+
+def _json_body(payload: Dict[str, object]) -> bytes:
+    return fast_json.dumps(payload)
+
+
+# one entry of an If-None-Match list: "*" or an optionally weak quoted tag
+_ENTITY_TAG = re.compile(r'\s*(?:(\*)|(?:W/)?("[^"]*"))\s*(?:,|$)')
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    # weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored, tags compared whole
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tag = etag[2:] if etag.startswith("W/") else etag
+    pos = 0
+    while pos < len(header):
+        m = _ENTITY_TAG.match(header, pos)
+        if m is None or m.end() == pos:
+            return False
+        if m.group(1) or m.group(2) == tag:
+            return True
+        pos = m.end()
+    return False
+
+
+def _cached_response(request: Request, tiles: StationTiles, key: Tuple, render) -> Response:
+    etag = '"' + tiles.version + "-" + "-".join(str(k) for k in key) + '"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={TILE_MAX_AGE_S}"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    body = tiles.cached(key, render)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/stations")
+def stations_in_bbox(
+    request: Request,
+    bbox: str = Query(..., pattern=_BBOX_PATTERN, description="south,west,north,east in degrees"),
+    zoom: Optional[int] = Query(
+        None, ge=0, le=MAX_CLUSTER_ZOOM, description="Return the precomputed clusters of this map zoom"
+    ),
+    limit: int = Query(5000, ge=1, le=STATIONS_MAX_LIMIT, description="Maximum stations returned"),
+    format: str = Query("compact", pattern=_STATION_FORMAT_PATTERN),
+):
+    south, west, north, east = _parse_bbox(bbox)
+    store = load_india_data()
+    tiles = tiles_for(store)
+
+    if zoom is not None:
+        return _cached_response(
+            request, tiles, ("bbox", bbox.replace(" ", ""), zoom, format),
+            lambda: _json_body(_clusters_payload(_bbox_clusters(tiles, zoom, south, west, north, east), format)),
         )
 
-    max_daily_mm = max(precip_list)
-    max_index = precip_list.index(max_daily_mm)
-    max_date = time_list[max_index]
+    def render() -> bytes:
+        rows = store.index.in_bbox(south, west, north, east)
+        payload = _stations_payload(store, rows[:limit], format)
+        payload["total"] = int(len(rows))
+        payload["truncated"] = bool(len(rows) > limit)
+        return _json_body(payload)
 
-    return {
-        "year": year,
-        "max_daily_precip_mm": float(max_daily_mm),
-        "max_daily_precip_date": max_date,
-        "note": "Max daily rainfall depth from Open-Meteo archive (mm/day)",
-    }
+    return _cached_response(request, tiles, ("bbox", bbox.replace(" ", ""), limit, format), render)
+
+
+@app.get("/stations/tiles/{z}/{x}/{y}")
+def station_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    format: str = Query("compact", pattern=_STATION_FORMAT_PATTERN),
+):
+    # zoom <= MAX_CLUSTER_ZOOM: clusters (64 x 64 cells per tile); deeper: the stations
+    if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=404, detail=f"No tile {z}/{x}/{y}")
+    store = load_india_data()
+    tiles = tiles_for(store)
+
+    def render() -> bytes:
+        if z <= MAX_CLUSTER_ZOOM:
+            payload = _clusters_payload(tiles.tile_clusters(z, x, y), format)
+        else:
+            payload = _stations_payload(store, tiles.tile_rows(z, x, y), format)
+        return _json_body(payload)
+
+    return _cached_response(request, tiles, ("tile", z, x, y, format), render)
+
+
+def fetch_max_daily_rainfall(lat: float, lon: float, year: int = 2024) -> Dict[str, float]:
+    return fetch_rainfall_stats(lat, lon, year)[0]
 
 
 def fetch_max_hourly_rainfall(lat: float, lon: float, year: int = 2024) -> Dict[str, float]:
-    params = {
-        "latitude": lat,
-        "longitude": lon,
-        "start_date": f"{year}-01-01",
-        "end_date": f"{year}-12-31",
-        "hourly": "precipitation",
-        "timezone": "auto",
-    }
+    return fetch_rainfall_stats(lat, lon, year)[1]
 
-    try:
-        resp = requests.get(OPEN_METEO_URL, params=params, timeout=20)
-    except requests.RequestException as e:
-        raise HTTPException(status_code=502, detail=f"Error calling Open-Meteo (hourly): {e}")
 
-    if resp.status_code != 200:
-        raise HTTPException(
-            status_code=resp.status_code,
-            detail=f"Open-Meteo (hourly) returned status {resp.status_code}",
-        )
+# ---------- IDF / design storms ----------
+# the archive starts in 1940; longer requests are clipped there anyway
+IDF_MAX_YEARS = 100
+_DISTRIBUTION_PATTERN = "^(" + "|".join(IDF_DISTRIBUTIONS) + ")$"
+
 
+def _parse_return_periods(text: Optional[str]) -> List[float]:
+    if not text:
+        return list(IDF_RETURN_PERIODS)
     try:
-        data = resp.json()
+        periods = sorted({float(v) for v in text.split(",") if v.strip()})
     except ValueError:
-        raise HTTPException(status_code=500, detail="Failed to parse JSON from Open-Meteo (hourly)")
+        raise HTTPException(status_code=422, detail="return_periods must be comma-separated numbers")
+    if not periods or periods[0] <= 1:
+        raise HTTPException(status_code=422, detail="return periods must be greater than 1 year")
+    return periods
+
+
+@app.get("/rainfall/idf")
+async def rainfall_idf(
+    lat: float = Query(..., description="Latitude"),
+    lon: float = Query(..., description="Longitude"),
+    year: int = Query(2024, description="Last year of the record"),
+    years: int = Query(IDF_DEFAULT_YEARS, ge=IDF_MIN_YEARS, le=IDF_MAX_YEARS, description="Years of hourly data to fit"),
+    distribution: str = Query("gumbel", pattern=_DISTRIBUTION_PATTERN),
+    return_periods: Optional[str] = Query(None, description="Comma-separated return periods in years, e.g. 2,10,100"),
+):
+    idf = await fetch_idf_async(
+        lat, lon, year, years, return_periods=_parse_return_periods(return_periods), distribution=distribution
+    )
+    return {"latitude": lat, "longitude": lon, "idf": idf}
 
-    logger.debug("Open-Meteo hourly response keys: %s", list(data.keys()))
 
-    try:
-        hourly = data["hourly"]
-        precip_list = hourly["precipitation"]
-        time_list = hourly["time"]
-    except KeyError as e:
-        raise HTTPException(status_code=500, detail=f"Missing key in hourly response: {e}")
+@app.get("/rainfall-cache/stats")
+def rainfall_cache_stats():
+    stats = rainfall_cache.stats()
+    raster = rainfall.rainfall_raster
+    stats["raster"] = raster.stats() if raster is not None else None
+    return stats
 
-    if not precip_list:
-        raise HTTPException(
-            status_code=404, detail="No hourly precipitation data returned from Open-Meteo"
-        )
 
-    max_hourly_mm = max(precip_list)
-    max_index = precip_list.index(max_hourly_mm)
-    max_time = time_list[max_index]
+@app.get("/upstream/stats")
+def upstream_stats():
+    return archive_dispatcher.stats()
 
-    # RETURN both key variants to be defensive / backwards-compatible
-    return {
-        "year": year,
-        "max_hourly_precip_mm": float(max_hourly_mm),
-        "max_hourly_prec_mm": float(max_hourly_mm),  # legacy/alt key
-        "max_hourly_precip_time": max_time,
-        "note": "Max hourly rainfall intensity from Open-Meteo archive (mm/hour)",
-    }
+
+# ---------- metrics ----------
+
+def _cache_samples():
+    stats = rainfall_cache.stats()
+    samples = [({"result": key}, stats[key]) for key in ("memory_hits", "disk_hits", "misses")]
+    raster = rainfall.rainfall_raster
+    if raster is not None:
+        samples.append(({"result": "raster_hits"}, raster.hits))
+        samples.append(({"result": "raster_misses"}, raster.misses))
+    return samples
+
+
+def _cache_ratio_samples():
+    samples = [
+        ({"cache": "rainfall"}, rainfall_cache.stats()["hit_ratio"]),
+        ({"cache": "design_memo"}, design_memo.stats()["hit_ratio"]),
+    ]
+    store = india_store
+    if store is not None:
+        tiles = tiles_for(store)
+        lookups = tiles.hits + tiles.misses
+        samples.append(({"cache": "station_tiles"}, tiles.hits / lookups if lookups else None))
+    return samples
+
+
+def _dispatcher_samples():
+    stats = archive_dispatcher.stats()
+    return [({"event": key}, stats[key]) for key in ("requests", "coalesced", "rejected", "batches", "upstream_errors")]
+
+
+def _station_samples():
+    store = india_store
+    if store is None:
+        return []
+    return [
+        ({"version": store.version, "kind": "stations"}, len(store)),
+        ({"version": store.version, "kind": "readings"}, len(store.history)),
+    ]
+
+
+register_collector(
+    "rtrwh_rainfall_lookups_total", "counter",
+    "Rainfall maxima lookups by outcome (raster, in-memory LRU, SQLite, miss)", _cache_samples,
+)
+register_collector("rtrwh_cache_hit_ratio", "gauge", "Hit ratio since start per cache", _cache_ratio_samples)
+register_collector(
+    "rtrwh_archive_dispatcher_events_total", "counter",
+    "Archive dispatcher counters; rejected requests got a 503 (Open-Meteo calls are not retried)",
+    _dispatcher_samples,
+)
+register_collector("rtrwh_station_data", "gauge", "Loaded station data size by version", _station_samples)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 def get_runoff_coefficient(rooftop_type: str) -> float:
@@ -308,28 +1001,7 @@ def design_recharge_pit_dimensions(volume_m3: float) -> Optional[Dict[str, float
     }
 
 
-@app.get("/rwh-design")
-def rwh_design(
-    rooftop_area_m2: float = Query(
-        ..., gt=0, description="Rooftop area in square metres"
-    ),
-    rooftop_type: str = Query(
-        ..., description="Rooftop type, e.g. concrete, tile, metal, green"
-    ),
-    lat: float = Query(..., description="Latitude of rooftop"),
-    lon: float = Query(..., description="Longitude of rooftop"),
-    year: int = Query(2024, description="Year for rainfall archive (default 2024)"),
-    max_radius_km: float = Query(
-        50.0,
-        description="Search radius for nearest CGWB station (km)",
-    ),
-):
-    gw_info = get_india_depth_for_point(lat=lat, lon=lon, max_radius_km=max_radius_km)
-    depth_m = gw_info["depth_m_below_ground"]
-
-    daily_rain = fetch_max_daily_rainfall(lat=lat, lon=lon, year=year)
-    hourly_rain = fetch_max_hourly_rainfall(lat=lat, lon=lon, year=year)
-
+def _rainfall_maxima(daily_rain: Dict[str, object], hourly_rain: Dict[str, object]) -> Tuple[float, float]:
     # Defensive extraction: support both key names and provide clear 502 if missing
     max_daily_mm = (
         daily_rain.get("max_daily_precip_mm")
@@ -353,78 +1025,385 @@ def rwh_design(
 
     # convert to floats (fast-fail if not convertible)
     try:
-        max_daily_mm = float(max_daily_mm)
-        max_hourly_mm = float(max_hourly_mm)
+        return float(max_daily_mm), float(max_hourly_mm)
     except (ValueError, TypeError) as e:
         logger.exception("Failed converting rainfall values to float: %s", e)
         raise HTTPException(status_code=502, detail="Invalid rainfall numeric format from upstream")
 
-    rainfall_depth_m = max_daily_mm / 1000.0
-    c_runoff = get_runoff_coefficient(rooftop_type)
-    runoff_depth_m = c_runoff * rainfall_depth_m
-    runoff_volume_m3 = runoff_depth_m * rooftop_area_m2
-
-    i_mm_per_hr = max_hourly_mm
-    i_m_per_hr = i_mm_per_hr / 1000.0
-    q_cia_m3_per_hr = c_runoff * i_m_per_hr * rooftop_area_m2
-
-    if depth_m <= 3.0:
-        design_category = "Storage only (rainwater harvesting tank). Groundwater is shallow (0–3 m bgl)."
-        recharge_pit_volume_m3 = 0.0
-        components = ["storage_tank"]
-        pit_dimensions = None
-    elif depth_m < 10.0:
-        design_category = "Recharge pit + storage tank (depth between 3–10 m bgl)."
-        recharge_pit_volume_m3 = runoff_volume_m3
-        components = ["recharge_pit", "storage_tank"]
-        pit_dimensions = design_recharge_pit_dimensions(recharge_pit_volume_m3)
-    else:
-        design_category = "Recharge pit + storage tank + recharge trench (depth ≥ 10 m bgl)."
-        recharge_pit_volume_m3 = runoff_volume_m3
-        components = ["recharge_pit", "storage_tank", "recharge_trench"]
-        pit_dimensions = design_recharge_pit_dimensions(recharge_pit_volume_m3)
 
-    feasible = "yes" if depth_m > 3.0 else "no"
+# ---------- storage sizing ----------
+STORAGE_MAX_YEARS = 60
+
 
+async def _storage_sizing(
+    lat: float,
+    lon: float,
+    year: int,
+    years: int,
+    c_runoff: float,
+    rooftop_area_m2: float,
+    demand_l_per_day: float,
+    first_flush_mm: float,
+    target_reliability: float,
+) -> Dict[str, object]:
+    first_year = max(ARCHIVE_FIRST_YEAR, year - years + 1)
+    rain_mm = await timed("daily_series", fetch_daily_series_async(lat, lon, first_year, year))
+    with stage("storage"):
+        sizing = storage_sizing(
+            rain_mm, c_runoff, rooftop_area_m2,
+            demand_l_per_day=demand_l_per_day,
+            first_flush_mm=first_flush_mm,
+            target_reliability=target_reliability,
+        )
+    sizing["years"] = [first_year, year]
+    return sizing
+
+
+@app.get("/rwh-storage")
+async def rwh_storage(
+    rooftop_area_m2: float = Query(..., gt=0, description="Rooftop area in square metres"),
+    rooftop_type: str = Query(..., description="Rooftop type, e.g. concrete, tile, metal, green"),
+    lat: float = Query(..., description="Latitude of rooftop"),
+    lon: float = Query(..., description="Longitude of rooftop"),
+    year: int = Query(2024, description="Last year of the rainfall record"),
+    years: int = Query(DEFAULT_STORAGE_YEARS, ge=1, le=STORAGE_MAX_YEARS, description="Years of daily rainfall to simulate"),
+    demand_l_per_day: float = Query(DEFAULT_DEMAND_L_PER_DAY, gt=0, description="Household demand (litres/day)"),
+    first_flush_mm: float = Query(DEFAULT_FIRST_FLUSH_MM, ge=0, description="Roof runoff diverted per rain day (mm)"),
+    target_reliability: float = Query(DEFAULT_TARGET_RELIABILITY, gt=0, le=1),
+):
+    c_runoff = get_runoff_coefficient(rooftop_type)
+    sizing = await _storage_sizing(
+        lat, lon, year, years, c_runoff, rooftop_area_m2,
+        demand_l_per_day, first_flush_mm, target_reliability,
+    )
     return {
         "input": {
             "rooftop_area_m2": rooftop_area_m2,
             "rooftop_type": rooftop_type,
             "latitude": lat,
             "longitude": lon,
-            "year": year,
-        },
-        "groundwater": gw_info,
-        "rainfall": {
-            "daily": daily_rain,
-            "hourly": hourly_rain,
-        },
-        "runoff_calculation": {
             "runoff_coefficient": c_runoff,
-            "rainfall_depth_m_from_max_daily": rainfall_depth_m,
-            "runoff_depth_m": runoff_depth_m,
-            "runoff_volume_m3": runoff_volume_m3,
-            "i_mm_per_hr_from_max_hourly": i_mm_per_hr,
-            "i_m_per_hr_from_max_hourly": i_m_per_hr,
-            "q_cia_m3_per_hr": q_cia_m3_per_hr,
-        },
-        "design": {
-            "category": design_category,
-            "components": components,
-            "recharge_pit_volume_m3": recharge_pit_volume_m3,
-            "recharge_pit_dimensions_m": pit_dimensions,
-            "feasible": feasible,
-            "note": (
-                "Runoff volume is computed using rainfall depth from max daily rainfall (mm/day), "
-                "runoffDepth = C * rainfallDepth, Volume = runoffDepth * Area. "
-                "Q_cia_m3_per_hr uses C I A with I from max hourly rainfall (mm/hour). "
-                "Recharge pit volume is taken equal to total runoff volume when depth > 3 m bgl. "
-                "Pit dimensions assume a rectangular pit with L:B = 2:1 and depth based on volume class."
-            ),
         },
+        "storage": sizing,
     }
 
 
+# ---------- design responses ----------
+DESIGN_MAX_AGE_S = 3600
+
+# /rwh-design results without their input and groundwater blocks
+design_memo = DesignMemo()
+
+
+def _parse_fields(text: Optional[str]) -> Optional[List[Tuple[str, ...]]]:
+    if text is None:
+        return None
+    paths = [tuple(part.strip().split(".")) for part in text.split(",") if part.strip()]
+    if not paths or any(p[0] not in DESIGN_SECTIONS or "" in p for p in paths):
+        raise HTTPException(
+            status_code=400,
+            detail=f"fields must be comma-separated paths starting with one of {', '.join(DESIGN_SECTIONS)}; "
+            f"got '{text}'",
+        )
+    return paths
+
+
+def _shape_result(
+    result: Dict[str, object], paths: Optional[List[Tuple[str, ...]]], compact: bool
+) -> Dict[str, object]:
+    if paths is not None:
+        result = select_fields(result, paths)
+    if compact:
+        result = compact_result(result)
+    return result
+
+
+def _design_response(request: Request, result: Dict[str, object], year: int) -> Response:
+    with stage("json"):
+        body = fast_json.dumps(result)
+    etag = f'"{zlib.crc32(body):08x}-{len(body):x}"'
+    # past years are final; the current year's rainfall still grows, so revalidate
+    cache_control = f"public, max-age={DESIGN_MAX_AGE_S}" if ttl_for_year(year) is None else "no-cache"
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+@app.get("/rwh-design")
+async def rwh_design(
+    request: Request,
+    rooftop_area_m2: float = Query(
+        ..., gt=0, description="Rooftop area in square metres"
+    ),
+    rooftop_type: str = Query(
+        ..., description="Rooftop type, e.g. concrete, tile, metal, green"
+    ),
+    lat: float = Query(..., description="Latitude of rooftop"),
+    lon: float = Query(..., description="Longitude of rooftop"),
+    year: int = Query(2024, description="Year for rainfall archive (default 2024)"),
+    max_radius_km: float = Query(
+        50.0,
+        description="Search radius for nearest CGWB station (km)",
+    ),
+    return_period_years: Optional[float] = Query(
+        None,
+        gt=1,
+        description="Size for the T-year design storm (IDF fit) instead of the single-year maxima",
+    ),
+    idf_years: int = Query(IDF_DEFAULT_YEARS, ge=IDF_MIN_YEARS, le=IDF_MAX_YEARS),
+    distribution: str = Query("gumbel", pattern=_DISTRIBUTION_PATTERN),
+    demand_l_per_day: Optional[float] = Query(
+        None,
+        gt=0,
+        description="Household demand; when given, the storage tank is sized by a daily water-balance simulation",
+    ),
+    target_reliability: float = Query(DEFAULT_TARGET_RELIABILITY, gt=0, le=1),
+    storage_years: int = Query(DEFAULT_STORAGE_YEARS, ge=1, le=STORAGE_MAX_YEARS),
+    fields: Optional[str] = Query(
+        None, description="Comma-separated result paths to return, e.g. design,runoff_calculation.runoff_volume_m3"
+    ),
+    compact: bool = Query(False, description="Leave out explanatory notes and legacy duplicate keys"),
+):
+    c_runoff = get_runoff_coefficient(rooftop_type)
+    paths = _parse_fields(fields)
+    gw_info = get_india_depth_for_point(lat=lat, lon=lon, max_radius_km=max_radius_km)
+    depth_m = gw_info["depth_m_below_ground"]
+
+    inputs = {
+        "rooftop_area_m2": rooftop_area_m2,
+        "rooftop_type": rooftop_type,
+        "latitude": lat,
+        "longitude": lon,
+        "year": year,
+    }
+    if return_period_years is not None:
+        inputs["return_period_years"] = return_period_years
+    if demand_l_per_day is not None:
+        inputs["demand_l_per_day"] = demand_l_per_day
+
+    # Past the station lookup the result depends on the location only through
+    # its rainfall cell and the station's depth, and on the rooftop type only
+    # through its runoff coefficient.
+    key = (
+        rainfall_cell(lat, lon),
+        year,
+        rooftop_area_m2,
+        c_runoff,
+        depth_m,
+        None if return_period_years is None else (return_period_years, idf_years, distribution),
+        None if demand_l_per_day is None else (demand_l_per_day, target_reliability, storage_years),
+    )
+    core = design_memo.get(key)
+    if core is None:
+        # the archive downloads (daily + hourly in one request, plus the daily
+        # record for storage sizing) run concurrently
+        storage_task = None
+        if demand_l_per_day is not None:
+            storage_task = asyncio.ensure_future(_storage_sizing(
+                lat, lon, year, storage_years, c_runoff, rooftop_area_m2,
+                demand_l_per_day, DEFAULT_FIRST_FLUSH_MM, target_reliability,
+            ))
+        try:
+            idf = None
+            if return_period_years is None:
+                daily_rain, hourly_rain = await timed("rainfall", fetch_rainfall_stats_async(lat=lat, lon=lon, year=year))
+            else:
+                periods = sorted(set(IDF_RETURN_PERIODS) | {return_period_years})
+                idf = await timed("idf", fetch_idf_async(
+                    lat, lon, year, idf_years, return_periods=periods, distribution=distribution
+                ))
+                daily_rain, hourly_rain = design_storm_results(idf, year, return_period_years)
+            max_daily_mm, max_hourly_mm = _rainfall_maxima(daily_rain, hourly_rain)
+        except BaseException:
+            if storage_task is not None:
+                storage_task.cancel()
+            raise
+
+        with stage("design"):
+            arrays = compute_design_arrays(
+                np.array([rooftop_area_m2]),
+                np.array([c_runoff]),
+                np.array([max_daily_mm]),
+                np.array([max_hourly_mm]),
+                np.array([depth_m]),
+            )
+            core = design_result(arrays, 0, inputs, gw_info, daily_rain, hourly_rain, c_runoff)
+        del core["input"], core["groundwater"]
+        if idf is not None:
+            core["rainfall"]["idf"] = idf
+        if storage_task is not None:
+            core["design"]["storage_tank_sizing"] = await storage_task
+        design_memo.put(key, core, ttl_for_year(year))
+
+    result = {"input": inputs, "groundwater": gw_info, **core}
+    return _design_response(request, _shape_result(result, paths, compact), year)
+
+
+# ---------- batch design ----------
+BATCH_MAX_ITEMS = 10000
+# cells one batch may have queued at the archive dispatcher at once; two
+# full multi-location requests' worth
+BATCH_MAX_CONCURRENT_FETCHES = 100
+
+
+class RooftopInput(BaseModel):
+    rooftop_area_m2: float = Field(..., gt=0)
+    rooftop_type: str
+    lat: float
+    lon: float
+    year: int = 2024
+    max_radius_km: float = 50.0
+
+
+def _parse_batch_body(body: bytes) -> List[object]:
+    """A JSON array, or one JSON object per line. Bad lines become per-item errors."""
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Batch body must be UTF-8 JSON or JSONL")
+
+    if text.lstrip().startswith("["):
+        try:
+            items = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid JSON array: {e}")
+        return items
+
+    items: List[object] = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError as e:
+            items.append(HTTPException(status_code=400, detail=f"Invalid JSON line: {e}"))
+    return items
+
+
+def _ndjson(obj: Dict[str, object]) -> bytes:
+    return fast_json.dumps(obj) + b"\n"
+
+
+def _batch_error(index: int, status_code: int, detail: object) -> bytes:
+    return _ndjson({"index": index, "error": {"status_code": status_code, "detail": detail}})
+
+
+def _design_group_lines(
+    members: List[Tuple[int, RooftopInput, Dict[str, object]]],
+    rain: object,
+    paths: Optional[List[Tuple[str, ...]]] = None,
+    compact: bool = False,
+) -> List[bytes]:
+    if isinstance(rain, HTTPException):
+        return [_batch_error(index, rain.status_code, rain.detail) for index, _, _ in members]
+
+    daily_rain, hourly_rain = rain
+    try:
+        max_daily_mm, max_hourly_mm = _rainfall_maxima(daily_rain, hourly_rain)
+    except HTTPException as e:
+        return [_batch_error(index, e.status_code, e.detail) for index, _, _ in members]
+
+    n = len(members)
+    c_runoff = [get_runoff_coefficient(item.rooftop_type) for _, item, _ in members]
+    arrays = compute_design_arrays(
+        np.array([item.rooftop_area_m2 for _, item, _ in members]),
+        np.array(c_runoff),
+        np.full(n, max_daily_mm),
+        np.full(n, max_hourly_mm),
+        np.array([gw_info["depth_m_below_ground"] for _, _, gw_info in members]),
+    )
+
+    lines = []
+    for k, (index, item, gw_info) in enumerate(members):
+        inputs = {
+            "rooftop_area_m2": item.rooftop_area_m2,
+            "rooftop_type": item.rooftop_type,
+            "latitude": item.lat,
+            "longitude": item.lon,
+            "year": item.year,
+        }
+        result = design_result(arrays, k, inputs, gw_info, daily_rain, hourly_rain, c_runoff[k])
+        lines.append(_ndjson({"index": index, "result": _shape_result(result, paths, compact)}))
+    return lines
+
+
+async def _design_batch_lines(
+    items: List[object], paths: Optional[List[Tuple[str, ...]]] = None, compact: bool = False
+) -> AsyncIterator[bytes]:
+    # Group everything before touching upstream: rooftops sharing a rainfall
+    # cell and year share one archive fetch. Stations for all distinct
+    # coordinates are resolved together, off the event loop. Invalid items
+    # are reported straight away.
+    valid: List[Tuple[int, RooftopInput]] = []
+    for index, raw in enumerate(items):
+        if isinstance(raw, HTTPException):
+            yield _batch_error(index, raw.status_code, raw.detail)
+            continue
+        try:
+            item = RooftopInput.model_validate(raw)
+        except ValidationError as e:
+            yield _batch_error(index, 422, e.errors(include_url=False, include_context=False))
+            continue
+        valid.append((index, item))
+
+    points = list(dict.fromkeys((item.lat, item.lon, item.max_radius_km) for _, item in valid))
+    stations = await asyncio.to_thread(get_india_depths_for_points, points) if points else {}
+
+    groups: Dict[Tuple[Tuple[float, float], int], List[Tuple[int, RooftopInput, Dict[str, object]]]] = {}
+    for index, item in valid:
+        gw_info = stations[(item.lat, item.lon, item.max_radius_km)]
+        if isinstance(gw_info, HTTPException):
+            yield _batch_error(index, gw_info.status_code, gw_info.detail)
+            continue
+        groups.setdefault((rainfall_cell(item.lat, item.lon), item.year), []).append(
+            (index, item, gw_info)
+        )
+
+    limiter = asyncio.Semaphore(BATCH_MAX_CONCURRENT_FETCHES)
+
+    async def fetch_group(cell: Tuple[float, float], year: int, members):
+        async with limiter:
+            try:
+                rain = await timed("rainfall", fetch_rainfall_stats_async(lat=cell[0], lon=cell[1], year=year))
+            except HTTPException as e:
+                rain = e
+        return members, rain
+
+    tasks = [
+        asyncio.ensure_future(fetch_group(cell, year, members))
+        for (cell, year), members in groups.items()
+    ]
+    try:
+        # stream each group as soon as its rainfall is known, as one chunk
+        # (one gzip flush per group rather than per line)
+        for next_done in asyncio.as_completed(tasks):
+            members, rain = await next_done
+            with stage("design"):
+                lines = _design_group_lines(members, rain, paths, compact)
+            yield b"".join(lines)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+@app.post("/rwh-design/batch")
+async def rwh_design_batch(
+    request: Request,
+    fields: Optional[str] = Query(None, description="Comma-separated result paths to return per rooftop"),
+    compact: bool = Query(False, description="Leave out explanatory notes and legacy duplicate keys"),
+):
+    paths = _parse_fields(fields)
+    items = _parse_batch_body(await request.body())
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Batch body must be a JSON array or JSONL")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413, detail=f"Batch has {len(items)} items; the limit is {BATCH_MAX_ITEMS}"
+        )
+    return StreamingResponse(_design_batch_lines(items, paths, compact), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8001, reload=True)
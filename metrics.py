@@ -0,0 +1,312 @@
+"""
+In-process metrics: counters and fixed-bucket histograms rendered in the
+Prometheus text format, per-request stage timings reported in a
+Server-Timing header, and an opt-in sampling profiler.
+
+Stage timings go to the current request through a context variable, so
+tasks and threadpool calls started by a handler add to the same request.
+Work shared between requests (the archive dispatcher's multi-location
+calls) only feeds the global histograms.
+"""
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from starlette.responses import JSONResponse
+
+import fast_json
+
+T = TypeVar("T")
+
+# seconds; upper bounds of the histogram buckets (+Inf is implicit)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Sampling profiler: requests sent with "X-Profile: 1" are sampled only when
+# PROFILE_DIR is set; the collapsed stacks land in that directory.
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+PROFILE_INTERVAL_S = float(os.environ.get("PROFILE_INTERVAL_S", "0.005"))
+# leaf functions of threads that are merely waiting; left out of profiles
+_IDLE_LEAVES = {"select", "poll", "wait", "sleep", "_worker", "accept", "epoll"}
+
+Sample = Tuple[Dict[str, str], Optional[float]]
+
+
+def _label_text(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            lines.append(f"{self.name}{_label_text(dict(zip(self.labelnames, values)))} {_number(total)}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # per label set: bucket counts (last = +Inf), sum
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        slot = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][slot] += 1
+            series[1][0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, (list(c), s[0])) for k, (c, s) in self._series.items())
+        for values, (counts, total) in items:
+            labels = dict(zip(self.labelnames, values))
+            running = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                running += count
+                le = _label_text(dict(labels, le=_number(bound)))
+                lines.append(f"{self.name}_bucket{le} {running}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {running}")
+        return lines
+
+
+REQUEST_SECONDS = Histogram(
+    "rtrwh_request_duration_seconds", "HTTP request latency by route template", ("route", "method", "status")
+)
+STAGE_SECONDS = Histogram("rtrwh_stage_duration_seconds", "Time spent per request stage", ("stage",))
+UPSTREAM_SECONDS = Histogram("rtrwh_upstream_duration_seconds", "Open-Meteo request latency", ("kind",))
+UPSTREAM_REQUESTS = Counter(
+    "rtrwh_upstream_requests_total",
+    "Open-Meteo requests by kind and HTTP status (or transport error class)",
+    ("kind", "status"),
+)
+_METRICS = [REQUEST_SECONDS, STAGE_SECONDS, UPSTREAM_SECONDS, UPSTREAM_REQUESTS]
+
+# (name, type, help, collect) read at scrape time from the existing stats()
+_collectors: List[Tuple[str, str, str, Callable[[], List[Sample]]]] = []
+
+
+def register_collector(name: str, kind: str, help: str, collect: Callable[[], List[Sample]]) -> None:
+    """kind is "gauge" or "counter"; collect() returns (labels, value) samples, None values are skipped."""
+    _collectors.append((name, kind, help, collect))
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    for name, kind, help, collect in _collectors:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in collect():
+            if value is not None:
+                lines.append(f"{name}{_label_text(labels)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+# ---------- per-request stage timings ----------
+
+_request_timings: "contextvars.ContextVar[Optional[List[Tuple[str, float]]]]" = contextvars.ContextVar(
+    "rtrwh_request_timings", default=None
+)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, name)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+async def timed(name: str, awaitable: Awaitable[T]) -> T:
+    """Await under a stage name."""
+    t0 = time.perf_counter()
+    try:
+        return await awaitable
+    finally:
+        record_stage(name, time.perf_counter() - t0)
+
+
+def server_timing(timings: List[Tuple[str, float]], total_s: float) -> str:
+    # repeated stages (batch items) are summed, with the count as description
+    merged: Dict[str, List[float]] = {}
+    for name, seconds in timings:
+        entry = merged.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += 1
+    parts = [
+        f'{name};dur={seconds * 1000:.3f}' + (f';desc="n={int(count)}"' if count > 1 else "")
+        for name, (seconds, count) in merged.items()
+    ]
+    parts.append(f"total;dur={total_s * 1000:.3f}")
+    return ", ".join(parts)
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONResponse encoded with fast_json, its encoding time reported as the "json" stage."""
+
+    def render(self, content) -> bytes:
+        with stage("json"):
+            return fast_json.dumps(content)
+
+
+# ---------- sampling profiler ----------
+
+class SamplingProfiler:
+    """
+    Samples the stacks of all threads every interval_s on a daemon thread
+    and counts them as collapsed stacks ("outer;...;inner count"), the input
+    format of flamegraph.pl / speedscope. Idle threads are skipped.
+    """
+
+    def __init__(self, interval_s: float = PROFILE_INTERVAL_S):
+        self.interval_s = interval_s
+        self.stacks: _Tally = _Tally()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="rtrwh-profiler", daemon=True)
+
+    def start(self) -> "SamplingProfiler":
+        self._thread.start()
+        return self
+
+    def stop(self, wait: bool = True) -> None:
+        self._stop.set()
+        if wait:
+            self._thread.join()
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval_s):
+            self.samples += 1
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_name in _IDLE_LEAVES:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(names))] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def save(self, path: str) -> None:
+        """Stop, then write the stacks to path; blocks, so run it off the event loop."""
+        self.stop()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.write(path)
+
+
+# ---------- ASGI middleware ----------
+
+class TimingMiddleware:
+    """
+    Times every HTTP request into REQUEST_SECONDS, collects its stage timings
+    and adds them as a Server-Timing header. With PROFILE_DIR set, a request
+    carrying "X-Profile: 1" is sampled until its response starts; the file
+    name is returned in X-Profile-File and the file is written in a worker
+    thread once the response has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        t0 = time.perf_counter()
+        timings: List[Tuple[str, float]] = []
+        token = _request_timings.set(timings)
+        status = [500]
+        profiler: Optional[SamplingProfiler] = None
+        profile_path: Optional[str] = None
+        if PROFILE_DIR and (b"x-profile", b"1") in scope.get("headers", ()):
+            profiler = SamplingProfiler().start()
+
+        async def send_with_timing(message):
+            nonlocal profile_path
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing(timings, time.perf_counter() - t0).encode("latin-1")))
+                if profiler is not None:
+                    # only signal the sampler here; joining it and writing wait for the end
+                    profiler.stop(wait=False)
+                    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{int(t0 * 1e6) % 1000000:06d}.folded"
+                    profile_path = os.path.join(PROFILE_DIR, name)
+                    headers.append((b"x-profile-file", name.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _request_timings.reset(token)
+            route = scope.get("route")
+            REQUEST_SECONDS.observe(
+                time.perf_counter() - t0,
+                getattr(route, "path", "unmatched"),
+                scope.get("method", ""),
+                str(status[0]),
+            )
+            if profile_path is not None:
+                await asyncio.to_thread(profiler.save, profile_path)
+            elif profiler is not None:
+                await asyncio.to_thread(profiler.stop)
@@ -0,0 +1,262 @@
+"""
+Local stand-in for the Open-Meteo archive API (/v1/archive), for tests and
+load runs without network access.
+
+    uvicorn openmeteo_stub:app --port 8002
+    OPEN_METEO_URL=http://127.0.0.1:8002/v1/archive uvicorn main:app --port 8001
+
+Series are synthetic but deterministic per (latitude, longitude, date range),
+so repeated runs see the same maxima. Comma-separated latitude/longitude
+lists are answered with a JSON list, like the real API. Request counts and
+locations-per-request are served at /stub/stats.
+
+Recorded fixtures: with STUB_FIXTURES_DIR set, a location whose request
+matches a fixture file there is answered from it instead of the synthetic
+series. With STUB_RECORD_URL also set (e.g. the real archive URL), missing
+locations are fetched from it once and saved as fixtures, so a later
+offline run replays the same payloads.
+
+Fault injection, to see how the API behaves under a slow or flaky upstream:
+STUB_LATENCY_MS (+- STUB_JITTER_MS, uniform) delays every archive response,
+and a STUB_ERROR_RATE fraction of them fails with STUB_ERROR_STATUS. Draws
+come from a generator seeded with STUB_SEED. All four can be changed at
+runtime through POST /stub/config.
+"""
+import asyncio
+import datetime
+import json
+import os
+import random
+import zlib
+from collections import Counter
+from typing import Dict, List, Optional
+
+import httpx
+import numpy as np
+from fastapi import FastAPI, Query
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+
+STUB_FIXTURES_DIR = os.environ.get("STUB_FIXTURES_DIR")
+STUB_RECORD_URL = os.environ.get("STUB_RECORD_URL")
+
+app = FastAPI(title="Open-Meteo archive stub")
+
+_requests = Counter()
+_locations_per_request = Counter()
+_fixtures: Optional[Dict[str, Dict[str, object]]] = None
+
+
+class StubConfig(BaseModel):
+    latency_ms: float = Field(0.0, ge=0)
+    jitter_ms: float = Field(0.0, ge=0)
+    error_rate: float = Field(0.0, ge=0, le=1)
+    error_status: int = Field(503, ge=400, le=599)
+    seed: int = 0
+
+
+_config = StubConfig(
+    latency_ms=float(os.environ.get("STUB_LATENCY_MS", "0")),
+    jitter_ms=float(os.environ.get("STUB_JITTER_MS", "0")),
+    error_rate=float(os.environ.get("STUB_ERROR_RATE", "0")),
+    error_status=int(os.environ.get("STUB_ERROR_STATUS", "503")),
+    seed=int(os.environ.get("STUB_SEED", "0")),
+)
+_rng = random.Random(_config.seed)
+
+
+def synthetic_hourly(lat: float, lon: float, start: datetime.date, end: datetime.date) -> List[float]:
+    """Wet-season-weighted hourly precipitation (mm), 0.1 mm resolution like the archive."""
+    hours = ((end - start).days + 1) * 24
+    seed = zlib.crc32(f"{lat:.4f},{lon:.4f},{start},{end}".encode())
+    rng = np.random.default_rng(seed)
+
+    # rough Indian monsoon: wet hours peak around day 200 (mid-July)
+    doy = (np.arange(hours) // 24 + (start - datetime.date(start.year, 1, 1)).days) % 365
+    monsoon = 0.02 + 0.18 * np.exp(-(((doy - 200) / 40.0) ** 2))
+    wet = rng.random(hours) < monsoon
+    amounts = rng.gamma(0.8, 4.0, hours)
+    return np.round(np.where(wet, amounts, 0.0), 1).tolist()
+
+
+def location_payload(
+    lat: float,
+    lon: float,
+    start: datetime.date,
+    end: datetime.date,
+    daily: Optional[str],
+    hourly: Optional[str],
+) -> Dict[str, object]:
+    values = synthetic_hourly(lat, lon, start, end)
+    t0 = datetime.datetime.combine(start, datetime.time())
+    times = [(t0 + datetime.timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(len(values))]
+
+    payload: Dict[str, object] = {
+        "latitude": lat,
+        "longitude": lon,
+        "generationtime_ms": 0.1,
+        "utc_offset_seconds": 19800,
+        "timezone": "Asia/Kolkata",
+        "timezone_abbreviation": "IST",
+        "elevation": 10.0,
+    }
+    if hourly:
+        payload["hourly_units"] = {"time": "iso8601", "precipitation": "mm"}
+        payload["hourly"] = {"time": times, "precipitation": values}
+    if daily:
+        sums = np.round(np.asarray(values).reshape(-1, 24).sum(axis=1), 1).tolist()
+        payload["daily_units"] = {"time": "iso8601", "precipitation_sum": "mm"}
+        payload["daily"] = {"time": [t[:10] for t in times[::24]], "precipitation_sum": sums}
+    return payload
+
+
+# ---------- recorded fixtures ----------
+
+def fixture_key(
+    lat: float,
+    lon: float,
+    start: datetime.date,
+    end: datetime.date,
+    daily: Optional[str],
+    hourly: Optional[str],
+    timezone: Optional[str],
+) -> str:
+    return f"{lat:.4f},{lon:.4f},{start},{end},{daily or ''},{hourly or ''},{timezone or ''}"
+
+
+def _fixture_path(key: str) -> str:
+    return os.path.join(STUB_FIXTURES_DIR, f"{zlib.crc32(key.encode()):08x}.json")
+
+
+def load_fixtures() -> Dict[str, Dict[str, object]]:
+    """Fixture payloads by fixture_key(), read from STUB_FIXTURES_DIR once."""
+    global _fixtures
+    if _fixtures is None:
+        fixtures: Dict[str, Dict[str, object]] = {}
+        if STUB_FIXTURES_DIR and os.path.isdir(STUB_FIXTURES_DIR):
+            for name in sorted(os.listdir(STUB_FIXTURES_DIR)):
+                if name.endswith(".json"):
+                    with open(os.path.join(STUB_FIXTURES_DIR, name), encoding="utf-8") as f:
+                        record = json.load(f)
+                    fixtures[record["key"]] = record["response"]
+        _fixtures = fixtures
+    return _fixtures
+
+
+async def record_fixture(key: str, params: Dict[str, str]) -> Dict[str, object]:
+    """Fetch one location from STUB_RECORD_URL and save it as a fixture."""
+    async with httpx.AsyncClient(timeout=60.0) as client:
+        r = await client.get(STUB_RECORD_URL, params=params)
+    r.raise_for_status()
+    response = r.json()
+    os.makedirs(STUB_FIXTURES_DIR, exist_ok=True)
+    with open(_fixture_path(key), "w", encoding="utf-8") as f:
+        json.dump({"key": key, "params": params, "response": response}, f)
+    load_fixtures()[key] = response
+    return response
+
+
+async def _location(
+    lat: float,
+    lon: float,
+    start: datetime.date,
+    end: datetime.date,
+    daily: Optional[str],
+    hourly: Optional[str],
+    timezone: Optional[str],
+) -> Dict[str, object]:
+    key = fixture_key(lat, lon, start, end, daily, hourly, timezone)
+    recorded = load_fixtures().get(key)
+    if recorded is not None:
+        _requests["fixture"] += 1
+        return recorded
+    if STUB_FIXTURES_DIR and STUB_RECORD_URL:
+        params = {"latitude": str(lat), "longitude": str(lon), "start_date": str(start), "end_date": str(end)}
+        for name, value in (("daily", daily), ("hourly", hourly), ("timezone", timezone)):
+            if value:
+                params[name] = value
+        _requests["recorded"] += 1
+        return await record_fixture(key, params)
+    _requests["synthetic"] += 1
+    return await run_in_threadpool(location_payload, lat, lon, start, end, daily, hourly)
+
+
+@app.get("/v1/archive")
+async def archive(
+    latitude: str = Query(...),
+    longitude: str = Query(...),
+    start_date: datetime.date = Query(...),
+    end_date: datetime.date = Query(...),
+    daily: Optional[str] = Query(None),
+    hourly: Optional[str] = Query(None),
+    timezone: Optional[str] = Query(None),
+):
+    try:
+        lats = [float(v) for v in latitude.split(",")]
+        lons = [float(v) for v in longitude.split(",")]
+    except ValueError:
+        return JSONResponse({"error": True, "reason": "Invalid coordinate list"}, status_code=400)
+    if len(lats) != len(lons):
+        return JSONResponse(
+            {"error": True, "reason": "Parameter 'latitude' and 'longitude' must have the same number of elements"},
+            status_code=400,
+        )
+    if end_date < start_date:
+        return JSONResponse({"error": True, "reason": "end_date is before start_date"}, status_code=400)
+
+    _requests["archive"] += 1
+    _locations_per_request[len(lats)] += 1
+
+    config = _config
+    delay_ms = config.latency_ms
+    if config.jitter_ms:
+        delay_ms += _rng.uniform(-config.jitter_ms, config.jitter_ms)
+    fail = config.error_rate > 0 and _rng.random() < config.error_rate
+    if delay_ms > 0:
+        await asyncio.sleep(delay_ms / 1000.0)
+    if fail:
+        _requests["injected_errors"] += 1
+        return JSONResponse({"error": True, "reason": "Injected stub error"}, status_code=config.error_status)
+
+    payloads = [
+        await _location(lat, lon, start_date, end_date, daily, hourly, timezone)
+        for lat, lon in zip(lats, lons)
+    ]
+    return payloads if len(payloads) > 1 else payloads[0]
+
+
+@app.get("/stub/stats")
+def stub_stats():
+    return {
+        "requests": dict(_requests),
+        "locations_per_request": {str(k): v for k, v in sorted(_locations_per_request.items())},
+        "fixtures": len(load_fixtures()),
+        "config": _config.model_dump(),
+    }
+
+
+@app.get("/stub/config")
+def get_stub_config():
+    return _config.model_dump()
+
+
+@app.post("/stub/config")
+def set_stub_config(config: StubConfig):
+    # a new seed restarts the latency/error sequence
+    global _config, _rng
+    _config = config
+    _rng = random.Random(config.seed)
+    return _config.model_dump()
+
+
+@app.post("/stub/reset")
+def stub_reset():
+    _requests.clear()
+    _locations_per_request.clear()
+    return {"ok": True}
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("openmeteo_stub:app", host="127.0.0.1", port=8002)
@@ -0,0 +1,491 @@
+"""
+Rainfall statistics from the Open-Meteo archive.
+
+One archive request per (grid cell, year) asks for both the daily
+precipitation_sum and the hourly precipitation series; the yearly maxima
+are then derived locally. When a payload carries only the hourly series,
+daily totals are summed from it per local calendar day (the archive is
+queried with timezone=auto, so hourly timestamps are already local).
+
+Lookups try, in order: the precomputed raster (rainfall_raster.py, if
+RAINFALL_RASTER_FILE exists), the cache, then Open-Meteo. Async lookups that
+reach Open-Meteo go through ArchiveDispatcher, which coalesces identical
+requests and merges nearby cells into multi-location archive calls.
+"""
+import asyncio
+import bisect
+import logging
+import os
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import httpx
+import numpy as np
+import requests
+from fastapi import HTTPException
+
+import metrics
+import upstream
+from idf import IDF_DEFAULT_YEARS, IDF_RETURN_PERIODS, idf_table
+from rainfall_cache import RainfallCache, rainfall_cell, ttl_for_year
+from rainfall_dispatch import ArchiveDispatcher
+from rainfall_raster import RainfallRaster, open_raster
+
+logger = logging.getLogger("new_rtrwh")
+
+# overridable so the API can be pointed at openmeteo_stub.py
+OPEN_METEO_URL = os.environ.get("OPEN_METEO_URL", "https://archive-api.open-meteo.com/v1/archive")
+
+# Archive lookups keyed by (rainfall grid cell, year, variable); the SQLite
+# file is shared by all workers.
+RAINFALL_CACHE_FILE = os.environ.get("RAINFALL_CACHE_FILE", "rainfall_cache.sqlite3")
+rainfall_cache = RainfallCache(RAINFALL_CACHE_FILE)
+
+# Offline maxima built by build_rainfall_raster.py; cells/years it does not
+# cover, and years that are not final yet, fall through to the cache and
+# Open-Meteo.
+RAINFALL_RASTER_FILE = os.environ.get("RAINFALL_RASTER_FILE", "rainfall_raster.bin")
+rainfall_raster: Optional[RainfallRaster] = None
+
+DAILY_VARIABLE = "precipitation_sum"
+HOURLY_VARIABLE = "precipitation"
+# cache variable for a year's full hourly series (float32, NaN = missing)
+HOURLY_SERIES_VARIABLE = "precipitation_hourly_f32"
+# first year of the ERA5 reanalysis behind the archive
+ARCHIVE_FIRST_YEAR = 1940
+
+
+def archive_params(cells: Sequence[Tuple[float, float]], year: int) -> Dict[str, object]:
+    # several cells become comma-separated lists (one multi-location request)
+    return {
+        "latitude": ",".join(str(lat) for lat, _ in cells),
+        "longitude": ",".join(str(lon) for _, lon in cells),
+        "start_date": f"{year}-01-01",
+        "end_date": f"{year}-12-31",
+        "daily": DAILY_VARIABLE,
+        "hourly": HOURLY_VARIABLE,
+        "timezone": "auto",
+    }
+
+
+def daily_totals_from_hourly(
+    times: Sequence[str], values: Sequence[Optional[float]]
+) -> Tuple[List[str], List[Optional[float]]]:
+    """Sum an hourly series into local calendar days ("YYYY-MM-DDTHH:MM" -> "YYYY-MM-DD")."""
+    days: List[str] = []
+    totals: List[Optional[float]] = []
+    for t, v in zip(times, values):
+        day = t[:10]
+        if not days or days[-1] != day:
+            days.append(day)
+            totals.append(None)
+        if v is not None:
+            totals[-1] = (totals[-1] or 0.0) + v
+    return days, [None if v is None else round(v, 2) for v in totals]
+
+
+def _max_with_time(values: Sequence[Optional[float]], times: Sequence[str]) -> Tuple[float, str]:
+    best_i = -1
+    best_v = None
+    for i, v in enumerate(values):
+        # first occurrence wins, like list.index(max(...))
+        if v is not None and (best_v is None or v > best_v):
+            best_i, best_v = i, v
+    return float(best_v), times[best_i]
+
+
+def daily_result(year: int, max_mm: float, date: str) -> Dict[str, object]:
+    return {
+        "year": year,
+        "max_daily_precip_mm": float(max_mm),
+        "max_daily_precip_date": date,
+        "note": "Max daily rainfall depth from Open-Meteo archive (mm/day)",
+    }
+
+
+def hourly_result(year: int, max_mm: float, time: str) -> Dict[str, object]:
+    # RETURN both key variants to be defensive / backwards-compatible
+    return {
+        "year": year,
+        "max_hourly_precip_mm": float(max_mm),
+        "max_hourly_prec_mm": float(max_mm),  # legacy/alt key
+        "max_hourly_precip_time": time,
+        "note": "Max hourly rainfall intensity from Open-Meteo archive (mm/hour)",
+    }
+
+
+def _check_lengths(kind: str, times: Sequence[str], values: Sequence[Optional[float]]) -> None:
+    # zip() would silently drop the tail and misdate the maxima
+    if len(times) != len(values):
+        raise HTTPException(
+            status_code=500,
+            detail=f"Malformed {kind} response: {len(times)} timestamps for {len(values)} values",
+        )
+
+
+def rainfall_stats_from_payload(
+    data: Dict[str, object], year: int
+) -> Tuple[Dict[str, object], Dict[str, object]]:
+    """(daily, hourly) results from one archive payload, same shape as the old fetchers."""
+    try:
+        hourly = data["hourly"]
+        hourly_values = hourly[HOURLY_VARIABLE]
+        hourly_times = hourly["time"]
+    except (KeyError, TypeError) as e:
+        raise HTTPException(status_code=500, detail=f"Missing key in hourly response: {e}")
+
+    _check_lengths("hourly", hourly_times, hourly_values)
+
+    daily = data.get("daily")
+    if daily is None:
+        daily_times, daily_values = daily_totals_from_hourly(hourly_times, hourly_values)
+    else:
+        try:
+            daily_values = daily[DAILY_VARIABLE]  # mm/day
+            daily_times = daily["time"]
+        except (KeyError, TypeError) as e:
+            raise HTTPException(status_code=500, detail=f"Missing key in daily response: {e}")
+        _check_lengths("daily", daily_times, daily_values)
+
+    if not any(v is not None for v in daily_values):
+        raise HTTPException(
+            status_code=404, detail="No daily precipitation data returned from Open-Meteo"
+        )
+    if not any(v is not None for v in hourly_values):
+        raise HTTPException(
+            status_code=404, detail="No hourly precipitation data returned from Open-Meteo"
+        )
+
+    return (
+        daily_result(year, *_max_with_time(daily_values, daily_times)),
+        hourly_result(year, *_max_with_time(hourly_values, hourly_times)),
+    )
+
+
+def _payloads_from_response(resp) -> List[Dict[str, object]]:
+    if resp.status_code != 200:
+        raise HTTPException(
+            status_code=resp.status_code,
+            detail=f"Open-Meteo returned status {resp.status_code}",
+        )
+
+    try:
+        data = resp.json()
+    except ValueError:
+        raise HTTPException(status_code=500, detail="Failed to parse JSON from Open-Meteo")
+
+    # a multi-location request answers with a list, one object per location
+    payloads = data if isinstance(data, list) else [data]
+    if not payloads:
+        raise HTTPException(status_code=500, detail="Open-Meteo returned no locations")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "Open-Meteo archive response: %d location(s), keys %s",
+            len(payloads), list(payloads[0].keys()) if payloads else [],
+        )
+    return payloads
+
+
+def _count_upstream(kind: str, t0: float, status: str) -> None:
+    metrics.UPSTREAM_SECONDS.observe(time.perf_counter() - t0, kind)
+    metrics.UPSTREAM_REQUESTS.inc(kind, status)
+
+
+async def _archive_get(kind: str, params: Dict[str, object]) -> httpx.Response:
+    t0 = time.perf_counter()
+    try:
+        resp = await upstream.get_async_client().get(OPEN_METEO_URL, params=params)
+    except httpx.HTTPError as e:
+        _count_upstream(kind, t0, type(e).__name__)
+        raise HTTPException(status_code=502, detail=f"Error calling Open-Meteo: {e}")
+    _count_upstream(kind, t0, str(resp.status_code))
+    return resp
+
+
+def load_rainfall_raster(path: str = RAINFALL_RASTER_FILE) -> Optional[RainfallRaster]:
+    """Map the raster file if present; a missing or unreadable file leaves live serving on."""
+    global rainfall_raster
+    if not os.path.exists(path):
+        return None
+    try:
+        rainfall_raster = open_raster(path)
+    except (OSError, ValueError) as e:
+        logger.error("Rainfall raster '%s' not loaded: %s", path, e)
+        return None
+    logger.info("Loaded rainfall raster %s: %s", path, rainfall_raster.stats())
+    return rainfall_raster
+
+
+def _raster_stats(
+    cell_lat: float, cell_lon: float, year: int
+) -> Optional[Tuple[Dict[str, object], Dict[str, object]]]:
+    # a raster built during a year would pin that year's partial maxima
+    if rainfall_raster is None or ttl_for_year(year) is not None:
+        return None
+    entry = rainfall_raster.lookup(cell_lat, cell_lon, year)
+    if entry is None:
+        return None
+    daily_mm, date, hourly_mm, time = entry
+    return daily_result(year, daily_mm, date), hourly_result(year, hourly_mm, time)
+
+
+def _cached_stats(
+    cell_lat: float, cell_lon: float, year: int
+) -> Optional[Tuple[Dict[str, object], Dict[str, object]]]:
+    stats = _raster_stats(cell_lat, cell_lon, year)
+    if stats is not None:
+        return stats
+
+    daily = rainfall_cache.get(cell_lat, cell_lon, year, DAILY_VARIABLE)
+    if daily is None:
+        return None
+    hourly = rainfall_cache.get(cell_lat, cell_lon, year, HOURLY_VARIABLE)
+    if hourly is None:
+        return None
+    return dict(daily), dict(hourly)
+
+
+async def _cached_stats_async(
+    cell_lat: float, cell_lon: float, year: int
+) -> Optional[Tuple[Dict[str, object], Dict[str, object]]]:
+    # same lookups as _cached_stats; disk reads run off the event loop
+    stats = _raster_stats(cell_lat, cell_lon, year)
+    if stats is not None:
+        return stats
+
+    daily = await rainfall_cache.get_async(cell_lat, cell_lon, year, DAILY_VARIABLE)
+    if daily is None:
+        return None
+    hourly = await rainfall_cache.get_async(cell_lat, cell_lon, year, HOURLY_VARIABLE)
+    if hourly is None:
+        return None
+    return dict(daily), dict(hourly)
+
+
+def _store_stats(
+    cell_lat: float, cell_lon: float, year: int,
+    stats: Tuple[Dict[str, object], Dict[str, object]],
+) -> Tuple[Dict[str, object], Dict[str, object]]:
+    rainfall_cache.put(cell_lat, cell_lon, year, DAILY_VARIABLE, stats[0])
+    rainfall_cache.put(cell_lat, cell_lon, year, HOURLY_VARIABLE, stats[1])
+    return dict(stats[0]), dict(stats[1])
+
+
+def _store_batch(
+    year: int, fetched: Sequence[Tuple[float, float, Tuple[Dict[str, object], Dict[str, object]]]]
+) -> None:
+    for cell_lat, cell_lon, stats in fetched:
+        _store_stats(cell_lat, cell_lon, year, stats)
+
+
+def fetch_rainfall_stats(
+    lat: float, lon: float, year: int = 2024
+) -> Tuple[Dict[str, object], Dict[str, object]]:
+    """(max daily, max hourly) rainfall for the grid cell of (lat, lon)."""
+    cell_lat, cell_lon = rainfall_cell(lat, lon)
+    cached = _cached_stats(cell_lat, cell_lon, year)
+    if cached is not None:
+        return cached
+
+    params = archive_params([(cell_lat, cell_lon)], year)
+    t0 = time.perf_counter()
+    try:
+        resp = upstream.get_session().get(OPEN_METEO_URL, params=params, timeout=upstream.sync_timeout())
+    except requests.RequestException as e:
+        _count_upstream("archive", t0, type(e).__name__)
+        raise HTTPException(status_code=502, detail=f"Error calling Open-Meteo: {e}")
+    _count_upstream("archive", t0, str(resp.status_code))
+
+    stats = rainfall_stats_from_payload(_payloads_from_response(resp)[0], year)
+    return _store_stats(cell_lat, cell_lon, year, stats)
+
+
+async def _resolve_cells(
+    year: int, cells: List[Tuple[float, float]]
+) -> List[Union[Tuple[Dict[str, object], Dict[str, object]], HTTPException]]:
+    """Dispatcher resolver: one archive request for all cells, results cached per cell."""
+    resp = await _archive_get("archive", archive_params(cells, year))
+
+    results: List[Union[Tuple[Dict[str, object], Dict[str, object]], HTTPException]] = []
+    fetched = []
+    for (cell_lat, cell_lon), payload in zip(cells, _payloads_from_response(resp)):
+        try:
+            stats = rainfall_stats_from_payload(payload, year)
+        except HTTPException as e:
+            results.append(e)
+            continue
+        fetched.append((cell_lat, cell_lon, stats))
+        results.append(stats)
+    # one worker thread writes the whole batch to the cache
+    await asyncio.to_thread(_store_batch, year, fetched)
+    return results
+
+
+archive_dispatcher = ArchiveDispatcher(
+    _resolve_cells,
+    window_s=upstream.DISPATCH_WINDOW_S,
+    max_batch=upstream.DISPATCH_MAX_BATCH,
+    max_pending=upstream.DISPATCH_MAX_PENDING,
+)
+
+
+async def fetch_rainfall_stats_async(
+    lat: float, lon: float, year: int = 2024
+) -> Tuple[Dict[str, object], Dict[str, object]]:
+    cell_lat, cell_lon = rainfall_cell(lat, lon)
+    cached = await _cached_stats_async(cell_lat, cell_lon, year)
+    if cached is not None:
+        return cached
+
+    # results are shared by every coalesced caller; hand out copies
+    daily, hourly = await archive_dispatcher.fetch((cell_lat, cell_lon), year)
+    return dict(daily), dict(hourly)
+
+
+# ---------- multi-year hourly series (IDF) ----------
+
+def series_params(cell: Tuple[float, float], first_year: int, last_year: int) -> Dict[str, object]:
+    return {
+        "latitude": cell[0],
+        "longitude": cell[1],
+        "start_date": f"{first_year}-01-01",
+        "end_date": f"{last_year}-12-31",
+        "hourly": HOURLY_VARIABLE,
+        "timezone": "auto",
+    }
+
+
+def split_hourly_by_year(
+    payload: Dict[str, object], first_year: int, last_year: int
+) -> Dict[int, np.ndarray]:
+    """Cut one multi-year hourly payload into per-year float32 arrays."""
+    try:
+        times = payload["hourly"]["time"]
+        values = np.array(payload["hourly"][HOURLY_VARIABLE], dtype=np.float32)
+    except (KeyError, TypeError) as e:
+        raise HTTPException(status_code=500, detail=f"Missing key in hourly response: {e}")
+
+    # timestamps are sorted ISO strings, so year boundaries are a bisect away
+    bounds = [bisect.bisect_left(times, f"{y}-01-01") for y in range(first_year, last_year + 2)]
+    return {
+        year: values[bounds[k]: bounds[k + 1]]
+        for k, year in enumerate(range(first_year, last_year + 1))
+        if bounds[k + 1] > bounds[k]
+    }
+
+
+def _missing_year_runs(years: Sequence[int]) -> List[Tuple[int, int]]:
+    runs: List[Tuple[int, int]] = []
+    for year in years:
+        if runs and runs[-1][1] == year - 1:
+            runs[-1] = (runs[-1][0], year)
+        else:
+            runs.append((year, year))
+    return runs
+
+
+async def _download_series(cell: Tuple[float, float], first_year: int, last_year: int) -> Dict[int, np.ndarray]:
+    resp = await _archive_get("series", series_params(cell, first_year, last_year))
+    series = split_hourly_by_year(_payloads_from_response(resp)[0], first_year, last_year)
+    for year, values in series.items():
+        await rainfall_cache.put_async(cell[0], cell[1], year, HOURLY_SERIES_VARIABLE, values)
+    return series
+
+
+_series_inflight: Dict[Tuple[Tuple[float, float], int, int], "asyncio.Future[Dict[int, np.ndarray]]"] = {}
+
+
+async def fetch_hourly_series_async(
+    lat: float, lon: float, first_year: int, last_year: int
+) -> Dict[int, np.ndarray]:
+    """
+    Hourly precipitation per year for the grid cell of (lat, lon). Cached years
+    are reused; each run of missing years is one archive request, shared with
+    any concurrent caller asking for the same run.
+    """
+    cell = rainfall_cell(lat, lon)
+    series: Dict[int, np.ndarray] = {}
+    missing: List[int] = []
+    for year in range(first_year, last_year + 1):
+        values = await rainfall_cache.get_async(cell[0], cell[1], year, HOURLY_SERIES_VARIABLE)
+        if values is None:
+            missing.append(year)
+        else:
+            series[year] = values
+
+    futures = []
+    for run in _missing_year_runs(missing):
+        key = (cell,) + run
+        future = _series_inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(_download_series(cell, *run))
+            _series_inflight[key] = future
+            future.add_done_callback(lambda _, key=key: _series_inflight.pop(key, None))
+        futures.append(asyncio.shield(future))
+    for downloaded in await asyncio.gather(*futures):
+        series.update(downloaded)
+    return series
+
+
+async def fetch_daily_series_async(lat: float, lon: float, first_year: int, last_year: int) -> np.ndarray:
+    """Consecutive local-day totals (mm, NaN where no hour was reported) built from the hourly series."""
+    series = await fetch_hourly_series_async(lat, lon, first_year, last_year)
+    days = []
+    for year in sorted(series):
+        hours = series[year]
+        hours = hours[: len(hours) // 24 * 24].reshape(-1, 24)
+        totals = np.nansum(hours, axis=1, dtype=np.float64)
+        totals[np.isnan(hours).all(axis=1)] = np.nan
+        days.append(totals)
+    if not days:
+        raise HTTPException(status_code=404, detail="No hourly precipitation data returned from Open-Meteo")
+    return np.concatenate(days)
+
+
+async def fetch_idf_async(
+    lat: float,
+    lon: float,
+    last_year: int,
+    n_years: int = IDF_DEFAULT_YEARS,
+    return_periods: Sequence[float] = IDF_RETURN_PERIODS,
+    distribution: str = "gumbel",
+) -> Dict[str, object]:
+    """IDF table (see idf.idf_table) over the n_years ending with last_year."""
+    first_year = max(ARCHIVE_FIRST_YEAR, last_year - n_years + 1)
+    series = await fetch_hourly_series_async(lat, lon, first_year, last_year)
+    if not series:
+        raise HTTPException(status_code=404, detail="No hourly precipitation data returned from Open-Meteo")
+    try:
+        return idf_table(series, return_periods=return_periods, distribution=distribution)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=f"Cannot fit IDF curve: {e}")
+
+
+def design_storm_results(
+    idf: Dict[str, object], year: int, return_period_years: float
+) -> Tuple[Dict[str, object], Dict[str, object]]:
+    """
+    (daily, hourly) rainfall blocks for /rwh-design holding the T-year 24-hour
+    depth and 1-hour intensity, under the same keys as the single-year maxima.
+    """
+    row = idf["return_periods_years"].index(return_period_years)
+    durations = idf["durations_h"]
+    depth_24h = idf["depth_mm"][row][durations.index(24)]
+    intensity_1h = idf["intensity_mm_per_hr"][row][durations.index(1)]
+    fit = {
+        "year": year,
+        "return_period_years": return_period_years,
+        "fit_years": idf["years"],
+        "distribution": idf["distribution"],
+    }
+    daily = dict(fit, max_daily_precip_mm=depth_24h, duration_h=24)
+    daily["note"] = (
+        f"{return_period_years:g}-year 24-hour rainfall depth from an IDF fit to "
+        f"{idf['n_years']} years of Open-Meteo hourly data (mm/day)"
+    )
+    hourly = dict(fit, max_hourly_precip_mm=intensity_1h, max_hourly_prec_mm=intensity_1h, duration_h=1)
+    hourly["note"] = (
+        f"{return_period_years:g}-year 1-hour rainfall intensity from an IDF fit to "
+        f"{idf['n_years']} years of Open-Meteo hourly data (mm/hour)"
+    )
+    return daily, hourly
@@ -0,0 +1,316 @@
+import asyncio
+import datetime
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+# Open-Meteo's archive serves ERA5-Land on a 0.1 deg grid; every coordinate
+# snapped to the same node gets the same series from upstream.
+RAINFALL_CELL_DEG = 0.1
+
+# Archive data for the running year is still being appended (a few days behind).
+CURRENT_YEAR_TTL_S = 6 * 3600
+
+# least recently used rows looked at per eviction step
+EVICT_BATCH_ROWS = 64
+
+
+def rainfall_cell(lat: float, lon: float) -> Tuple[float, float]:
+    """Snap a coordinate to the centre of its rainfall grid cell."""
+    return (
+        round(round(lat / RAINFALL_CELL_DEG) * RAINFALL_CELL_DEG, 4),
+        round(round(lon / RAINFALL_CELL_DEG) * RAINFALL_CELL_DEG, 4),
+    )
+
+
+def cache_key(cell_lat: float, cell_lon: float, year: int, variable: str) -> str:
+    return f"{cell_lat:.4f},{cell_lon:.4f}|{year}|{variable}"
+
+
+def ttl_for_year(year: int) -> Optional[float]:
+    """Past years are immutable (no expiry); the current and future years expire."""
+    if year < datetime.datetime.now(datetime.timezone.utc).year:
+        return None
+    return CURRENT_YEAR_TTL_S
+
+
+class RainfallCache:
+    """
+    Two-tier cache for Open-Meteo archive results keyed by
+    (grid cell, year, variable).
+
+    - memory: per-process LRU bounded by entry count and by value bytes
+              (array nbytes, or the JSON size of other values)
+    - disk:   SQLite file shared by all workers (WAL mode), bounded by total
+              value bytes (a running total kept in a meta row, updated in
+              the same transaction as the rows); least recently used rows
+              are evicted first
+
+    Values are JSON-compatible objects or float32 arrays (hourly series).
+    Only entries for the current year carry an expiry; expired entries count
+    as misses. get_async()/put_async() answer memory hits inline and run the
+    disk tier in a worker thread, for callers on the event loop.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str],
+        max_memory_entries: int = 2048,
+        max_memory_bytes: int = 32 * 1024 * 1024,
+        max_disk_bytes: int = 256 * 1024 * 1024,
+    ):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        # key -> (value, expires_at, size in bytes)
+        self._memory: "OrderedDict[str, Tuple[Any, Optional[float], int]]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "disk_evictions": 0,
+            "disk_errors": 0,
+        }
+
+    # ---------- disk tier ----------
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if self.path is None:
+            return None
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rainfall_cache ("
+                " key TEXT PRIMARY KEY,"
+                " encoding TEXT NOT NULL,"
+                " value BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " expires_at REAL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS rainfall_cache_accessed"
+                " ON rainfall_cache (accessed_at)"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS rainfall_cache_meta ("
+                " name TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL)"
+            )
+            # files from before the running total: sum once
+            db.execute(
+                "INSERT OR IGNORE INTO rainfall_cache_meta (name, value)"
+                " SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM rainfall_cache"
+            )
+            db.commit()
+            self._db = db
+        return self._db
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._db_lock:
+            db = self._connect()
+            if db is None:
+                return None
+            row = db.execute(
+                "SELECT encoding, value, expires_at FROM rainfall_cache WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            encoding, blob, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                return None
+            db.execute("UPDATE rainfall_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            db.commit()
+        return _decode(encoding, blob), expires_at
+
+    def _disk_put(self, key: str, value: Any, expires_at: Optional[float], now: float) -> None:
+        encoding, blob = _encode(value)
+        with self._db_lock:
+            db = self._connect()
+            if db is None:
+                return
+            # write lock up front: the old size read below must not go stale
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                row = db.execute("SELECT size FROM rainfall_cache WHERE key = ?", (key,)).fetchone()
+                db.execute(
+                    "INSERT OR REPLACE INTO rainfall_cache"
+                    " (key, encoding, value, size, expires_at, accessed_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, encoding, blob, len(blob), expires_at, now),
+                )
+                total = _add_total_bytes(db, len(blob) - (row[0] if row else 0))
+                if total > self.max_disk_bytes:
+                    evicted, freed = self._evict(db, total)
+                    _add_total_bytes(db, -freed)
+                    self._counters["disk_evictions"] += evicted
+                db.commit()
+            except BaseException:
+                db.rollback()
+                raise
+
+    def _evict(self, db: sqlite3.Connection, total: int) -> Tuple[int, int]:
+        """Delete least recently used rows until under 90% of the limit; returns (rows, bytes) removed."""
+        # trim to 90% so a full cache does not evict on every insert
+        target = int(self.max_disk_bytes * 0.9)
+        evicted = freed = 0
+        while total - freed > target:
+            sizes = db.execute(
+                "SELECT size FROM rainfall_cache ORDER BY accessed_at LIMIT ?", (EVICT_BATCH_ROWS,)
+            ).fetchall()
+            if not sizes:
+                break
+            n = 0
+            for (size,) in sizes:
+                n += 1
+                freed += size
+                if total - freed <= target:
+                    break
+            db.execute(
+                "DELETE FROM rainfall_cache WHERE key IN"
+                " (SELECT key FROM rainfall_cache ORDER BY accessed_at LIMIT ?)",
+                (n,),
+            )
+            evicted += n
+        return evicted, freed
+
+    # ---------- public API ----------
+
+    def _memory_get(self, key: str, now: float) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, expires_at, _ = entry
+                if expires_at is None or expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                self._forget(key)
+        return None
+
+    def _lookup_disk(self, key: str, now: float) -> Optional[Any]:
+        try:
+            entry = self._disk_get(key, now)
+        except sqlite3.Error:
+            self._counters["disk_errors"] += 1
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["disk_hits"] += 1
+            self._remember(key, entry)
+        return entry[0]
+
+    def _store(self, key: str, year: int, value: Any) -> Tuple[Optional[float], float]:
+        now = time.time()
+        ttl = ttl_for_year(year)
+        expires_at = None if ttl is None else now + ttl
+        with self._lock:
+            self._counters["stores"] += 1
+            self._remember(key, (value, expires_at))
+        return expires_at, now
+
+    def _store_disk(self, key: str, value: Any, expires_at: Optional[float], now: float) -> None:
+        try:
+            self._disk_put(key, value, expires_at, now)
+        except sqlite3.Error:
+            self._counters["disk_errors"] += 1
+
+    def get(self, cell_lat: float, cell_lon: float, year: int, variable: str) -> Optional[Any]:
+        key = cache_key(cell_lat, cell_lon, year, variable)
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        return self._lookup_disk(key, now)
+
+    async def get_async(self, cell_lat: float, cell_lon: float, year: int, variable: str) -> Optional[Any]:
+        key = cache_key(cell_lat, cell_lon, year, variable)
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            return value
+        if self.path is None:
+            return self._lookup_disk(key, now)
+        return await asyncio.to_thread(self._lookup_disk, key, now)
+
+    def put(self, cell_lat: float, cell_lon: float, year: int, variable: str, value: Any) -> None:
+        key = cache_key(cell_lat, cell_lon, year, variable)
+        expires_at, now = self._store(key, year, value)
+        self._store_disk(key, value, expires_at, now)
+
+    async def put_async(self, cell_lat: float, cell_lon: float, year: int, variable: str, value: Any) -> None:
+        key = cache_key(cell_lat, cell_lon, year, variable)
+        expires_at, now = self._store(key, year, value)
+        if self.path is not None:
+            await asyncio.to_thread(self._store_disk, key, value, expires_at, now)
+
+    def _remember(self, key: str, entry: Tuple[Any, Optional[float]]) -> None:
+        self._forget(key)
+        size = _memory_size(entry[0])
+        # larger than the whole tier: served from disk only
+        if size > self.max_memory_bytes:
+            return
+        self._memory[key] = (entry[0], entry[1], size)
+        self._memory_bytes += size
+        while len(self._memory) > self.max_memory_entries or self._memory_bytes > self.max_memory_bytes:
+            _, (_, _, evicted) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted
+
+    def _forget(self, key: str) -> None:
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._counters)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = (
+            round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else None
+        )
+        return stats
+
+
+def _add_total_bytes(db: sqlite3.Connection, delta: int) -> int:
+    db.execute("UPDATE rainfall_cache_meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+    return db.execute("SELECT value FROM rainfall_cache_meta WHERE name = 'total_bytes'").fetchone()[0]
+
+
+def _memory_size(value: Any) -> int:
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return len(json.dumps(value, separators=(",", ":")))
+
+
+def _encode(value: Any) -> Tuple[str, bytes]:
+    if isinstance(value, np.ndarray):
+        # hourly series: raw little-endian float32, a quarter of the JSON size
+        return "f32", value.astype("<f4").tobytes()
+    return "json", json.dumps(value, separators=(",", ":")).encode("utf-8")
+
+
+def _decode(encoding: str, blob: bytes) -> Any:
+    if encoding == "json":
+        return json.loads(blob)
+    if encoding == "f32":
+        return np.frombuffer(blob, dtype="<f4")
+    raise ValueError(f"Unknown rainfall cache encoding '{encoding}'")
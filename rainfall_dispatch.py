@@ -0,0 +1,132 @@
+"""
+Upstream dispatcher in front of the Open-Meteo archive.
+
+- single-flight: concurrent requests for the same (cell, year) share one future
+- micro-batching: distinct cells for the same year that arrive within a short
+  window are resolved by one multi-location archive request
+  (latitude=a,b,...&longitude=c,d,...) and fanned back out
+
+The dispatcher knows nothing about HTTP; it is handed a resolver coroutine
+that takes a year and a list of cells and returns one result (or an
+exception) per cell, in order.
+"""
+import asyncio
+from collections import Counter
+from typing import Awaitable, Callable, Dict, List, Set, Tuple, Union
+
+from fastapi import HTTPException
+
+Cell = Tuple[float, float]
+Resolver = Callable[[int, List[Cell]], Awaitable[List[Union[object, BaseException]]]]
+
+
+class ArchiveDispatcher:
+    def __init__(
+        self,
+        resolver: Resolver,
+        window_s: float = 0.01,
+        max_batch: int = 50,
+        max_pending: int = 2000,
+    ):
+        self.resolver = resolver
+        self.window_s = window_s
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+
+        self._inflight: Dict[Tuple[Cell, int], asyncio.Future] = {}
+        self._queued: Dict[int, List[Cell]] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._batch_sizes: Counter = Counter()
+        # the event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+        self._counters = {
+            "requests": 0,
+            "coalesced": 0,
+            "rejected": 0,
+            "batches": 0,
+            "upstream_errors": 0,
+        }
+
+    async def fetch(self, cell: Cell, year: int) -> object:
+        self._counters["requests"] += 1
+        key = (cell, year)
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._counters["coalesced"] += 1
+        else:
+            if len(self._inflight) >= self.max_pending:
+                self._counters["rejected"] += 1
+                raise HTTPException(
+                    status_code=503, detail="Too many Open-Meteo requests queued; retry shortly"
+                )
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._inflight[key] = future
+            self._enqueue(loop, cell, year)
+
+        # shield: one caller giving up must not cancel the shared result
+        return await asyncio.shield(future)
+
+    def _enqueue(self, loop: asyncio.AbstractEventLoop, cell: Cell, year: int) -> None:
+        queue = self._queued.setdefault(year, [])
+        queue.append(cell)
+        if len(queue) >= self.max_batch:
+            self._flush(year)
+        elif year not in self._timers:
+            self._timers[year] = loop.call_later(self.window_s, self._flush, year)
+
+    def _flush(self, year: int) -> None:
+        timer = self._timers.pop(year, None)
+        if timer is not None:
+            timer.cancel()
+        queue = self._queued.pop(year, [])
+        while queue:
+            batch, queue = queue[: self.max_batch], queue[self.max_batch:]
+            task = asyncio.ensure_future(self._run(year, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, year: int, cells: List[Cell]) -> None:
+        self._counters["batches"] += 1
+        self._batch_sizes[len(cells)] += 1
+        try:
+            results = await self.resolver(year, cells)
+        except asyncio.CancelledError:
+            for cell in cells:
+                future = self._inflight.pop((cell, year), None)
+                if future is not None and not future.done():
+                    future.cancel()
+            raise
+        except Exception as e:
+            self._counters["upstream_errors"] += 1
+            results = [e] * len(cells)
+
+        if len(results) != len(cells):
+            error = HTTPException(
+                status_code=502,
+                detail=f"Open-Meteo returned {len(results)} locations for {len(cells)} requested",
+            )
+            results = [error] * len(cells)
+
+        for cell, result in zip(cells, results):
+            future = self._inflight.pop((cell, year), None)
+            if future is None or future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+                # every caller may have gone away; do not warn about it
+                future.exception()
+            else:
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, object]:
+        stats: Dict[str, object] = dict(self._counters)
+        stats["inflight"] = len(self._inflight)
+        stats["queued"] = sum(len(q) for q in self._queued.values())
+        stats["batch_size_histogram"] = {str(k): v for k, v in sorted(self._batch_sizes.items())}
+        batches = self._counters["batches"]
+        stats["mean_batch_size"] = (
+            round(sum(k * v for k, v in self._batch_sizes.items()) / batches, 3) if batches else None
+        )
+        return stats
@@ -0,0 +1,203 @@
+"""
+Precomputed rainfall maxima on the 0.1 deg rainfall grid, for serving
+/rwh-design without calling Open-Meteo.
+
+The raster holds, per (year, cell), the max daily precipitation with its
+date and the max hourly intensity with its time. Arrays are laid out as
+(year, lat row, lon column) in a memory-mapped file (same framing as the
+station snapshot), so a lookup is index arithmetic plus four array reads.
+
+    depth values: int32 hundredths of a mm (-1 = cell/year not in raster)
+    daily date:   int16 days since Jan 1
+    hourly time:  int32 minutes since Jan 1 00:00 (local time, like the archive)
+
+Built offline by build_rainfall_raster.py.
+"""
+import datetime
+import json
+import mmap
+import os
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from rainfall_cache import RAINFALL_CELL_DEG
+
+RASTER_MAGIC = b"RTRWHRNF"
+RASTER_VERSION = 1
+RASTER_MISSING = -1
+_ALIGN = 64
+
+RASTER_ARRAYS = (
+    ("daily_mm_x100", np.int32),
+    ("daily_day", np.int16),
+    ("hourly_mm_x100", np.int32),
+    ("hourly_minute", np.int32),
+)
+
+# (max daily mm, date "YYYY-MM-DD", max hourly mm, time "YYYY-MM-DDTHH:MM")
+RasterEntry = Tuple[float, str, float, str]
+
+
+def _node(value: float, cell_deg: float) -> int:
+    return int(round(value / cell_deg))
+
+
+def encode_entry(year: int, entry: RasterEntry) -> Tuple[int, int, int, int]:
+    """Pack one entry into the raster's integer fields; raises ValueError on odd timestamps."""
+    daily_mm, date, hourly_mm, time = entry
+    jan1 = datetime.datetime(year, 1, 1)
+    day = (datetime.datetime.strptime(date, "%Y-%m-%d") - jan1).days
+    minute = int((datetime.datetime.strptime(time, "%Y-%m-%dT%H:%M") - jan1).total_seconds() // 60)
+    if not 0 <= day < 366 or not 0 <= minute < 366 * 24 * 60:
+        raise ValueError(f"timestamps {date} / {time} are outside {year}")
+    return int(round(daily_mm * 100)), day, int(round(hourly_mm * 100)), minute
+
+
+class RainfallRaster:
+    def __init__(
+        self,
+        header: Dict[str, object],
+        arrays: Dict[str, np.ndarray],
+        source: Optional[str] = None,
+        keepalive: object = None,
+    ):
+        self.header = header
+        self.cell_deg = float(header["cell_deg"])
+        self.lat_node0 = int(header["lat_node0"])
+        self.lon_node0 = int(header["lon_node0"])
+        self.year0 = int(header["year0"])
+        self.shape = (int(header["n_years"]), int(header["n_lat"]), int(header["n_lon"]))
+        self.arrays = {name: arr.reshape(self.shape) for name, arr in arrays.items()}
+        self.source = source
+        # the mmap backing the arrays when opened from a file
+        self._keepalive = keepalive
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_entries(
+        cls,
+        entries: Iterable[Tuple[float, float, int, RasterEntry]],
+        cell_deg: float = RAINFALL_CELL_DEG,
+    ) -> "RainfallRaster":
+        """Build from (cell_lat, cell_lon, year, entry) tuples; later duplicates win."""
+        packed = {}
+        for cell_lat, cell_lon, year, entry in entries:
+            key = (_node(cell_lat, cell_deg), _node(cell_lon, cell_deg), int(year))
+            packed[key] = encode_entry(int(year), entry)
+        if not packed:
+            raise ValueError("no rainfall entries to build a raster from")
+
+        keys = np.array(list(packed.keys()), dtype=np.int64)
+        values = np.array(list(packed.values()), dtype=np.int64)
+        lat_node0, lon_node0, year0 = keys.min(axis=0)
+        n_lat, n_lon, n_years = keys.max(axis=0) - keys.min(axis=0) + 1
+        rows = (keys[:, 2] - year0, keys[:, 0] - lat_node0, keys[:, 1] - lon_node0)
+
+        arrays = {}
+        for k, (name, dtype) in enumerate(RASTER_ARRAYS):
+            arr = np.full((n_years, n_lat, n_lon), RASTER_MISSING, dtype=dtype)
+            arr[rows] = values[:, k]
+            arrays[name] = arr
+        header = {
+            "version": RASTER_VERSION,
+            "cell_deg": cell_deg,
+            "lat_node0": int(lat_node0),
+            "lon_node0": int(lon_node0),
+            "year0": int(year0),
+            "n_lat": int(n_lat),
+            "n_lon": int(n_lon),
+            "n_years": int(n_years),
+            "entries": len(packed),
+        }
+        return cls(header, arrays)
+
+    def lookup(self, cell_lat: float, cell_lon: float, year: int) -> Optional[RasterEntry]:
+        """Entry for a snapped cell (see rainfall_cell) and year, or None if not covered."""
+        y = year - self.year0
+        i = _node(cell_lat, self.cell_deg) - self.lat_node0
+        j = _node(cell_lon, self.cell_deg) - self.lon_node0
+        n_years, n_lat, n_lon = self.shape
+        if not (0 <= y < n_years and 0 <= i < n_lat and 0 <= j < n_lon):
+            self.misses += 1
+            return None
+        daily = int(self.arrays["daily_mm_x100"][y, i, j])
+        if daily == RASTER_MISSING:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        jan1 = datetime.datetime(year, 1, 1)
+        date = jan1 + datetime.timedelta(days=int(self.arrays["daily_day"][y, i, j]))
+        time = jan1 + datetime.timedelta(minutes=int(self.arrays["hourly_minute"][y, i, j]))
+        return (
+            daily / 100,
+            date.strftime("%Y-%m-%d"),
+            int(self.arrays["hourly_mm_x100"][y, i, j]) / 100,
+            time.strftime("%Y-%m-%dT%H:%M"),
+        )
+
+    def stats(self) -> Dict[str, object]:
+        n_years, n_lat, n_lon = self.shape
+        return {
+            "source": self.source,
+            "entries": self.header["entries"],
+            "years": [self.year0, self.year0 + n_years - 1],
+            "lat_range": [round(self.lat_node0 * self.cell_deg, 4),
+                          round((self.lat_node0 + n_lat - 1) * self.cell_deg, 4)],
+            "lon_range": [round(self.lon_node0 * self.cell_deg, 4),
+                          round((self.lon_node0 + n_lon - 1) * self.cell_deg, 4)],
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def write_raster(raster: RainfallRaster, out_path: str) -> int:
+    """Write the raster file atomically; returns its size in bytes."""
+    arrays = {name: np.ascontiguousarray(raster.arrays[name]).ravel() for name, _ in RASTER_ARRAYS}
+    layout = {}
+    pos = 0
+    for name, arr in arrays.items():
+        pos = -(-pos // _ALIGN) * _ALIGN
+        layout[name] = [arr.dtype.str, pos, int(arr.size)]
+        pos += arr.nbytes
+
+    header = dict(raster.header)
+    header["arrays"] = layout
+    header_bytes = json.dumps(header).encode("utf-8")
+    prefix = RASTER_MAGIC + len(header_bytes).to_bytes(4, "little") + header_bytes
+    data_start = -(-len(prefix) // _ALIGN) * _ALIGN
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name][1])
+            f.write(arr.tobytes())
+        f.truncate(data_start + pos)
+    os.replace(tmp_path, out_path)
+    return data_start + pos
+
+
+def open_raster(path: str) -> RainfallRaster:
+    """Memory-map a raster file; pages are shared by every worker that opens it."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mm[: len(RASTER_MAGIC)] != RASTER_MAGIC:
+        mm.close()
+        raise ValueError(f"'{path}' is not a rainfall raster")
+    header_len = int.from_bytes(mm[len(RASTER_MAGIC): len(RASTER_MAGIC) + 4], "little")
+    header_end = len(RASTER_MAGIC) + 4 + header_len
+    header = json.loads(mm[len(RASTER_MAGIC) + 4: header_end].decode("utf-8"))
+    if header.get("version") != RASTER_VERSION:
+        mm.close()
+        raise ValueError(f"Unsupported rainfall raster version {header.get('version')}")
+    data_start = -(-header_end // _ALIGN) * _ALIGN
+
+    arrays = {
+        name: np.frombuffer(mm, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+        for name, (dtype, offset, count) in header.pop("arrays").items()
+    }
+    return RainfallRaster(header, arrays, source=path, keepalive=mm)
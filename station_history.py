@@ -0,0 +1,170 @@
+"""
+Per-station reading histories for CSV exports with many rows per well.
+
+Rows are grouped by station_id; each station keeps one representative row
+(its latest reading with a depth) in the station table, and every dated
+reading with a depth goes into CSR arrays: history_offsets (n_stations + 1)
+delimiting each station's slice of history_day (int32 days since
+1970-01-01, ascending) and history_depth.
+
+Pre- and post-monsoon trends (IMD seasons) are fitted once at load: the
+readings of a season are averaged per year, and a least-squares line through
+those annual means gives the slope in metres per year (positive = the water
+table is falling).
+"""
+import datetime
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+HISTORY_ARRAYS = ("history_offsets", "history_day", "history_depth")
+
+PRE_MONSOON_MONTHS = (3, 4, 5)
+POST_MONSOON_MONTHS = (10, 11, 12)
+SEASONS = {"pre_monsoon": PRE_MONSOON_MONTHS, "post_monsoon": POST_MONSOON_MONTHS}
+# fewer seasonal years than this leave the slope undefined (NaN)
+TREND_MIN_YEARS = 3
+TREND_FIELDS = tuple(
+    f"trend_{season}_{stat}" for season in SEASONS for stat in ("slope", "years", "mean")
+)
+
+# day value of an unparsable or missing date
+NO_DAY = np.iinfo(np.int32).min
+_DATE_FORMATS = ("%d-%m-%Y", "%d/%m/%Y", "%Y/%m/%d", "%Y-%m")
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def parse_day(text: Optional[str]) -> Optional[int]:
+    """Days since 1970-01-01 of an ISO (or d-m-Y / d/m/Y / Y/m/d / Y-m) date."""
+    if not text:
+        return None
+    text = text.strip()
+    try:
+        return (datetime.date.fromisoformat(text[:10]) - _EPOCH).days
+    except ValueError:
+        pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return (datetime.datetime.strptime(text, fmt).date() - _EPOCH).days
+        except ValueError:
+            continue
+    return None
+
+
+def format_day(day: int) -> str:
+    return (_EPOCH + datetime.timedelta(days=int(day))).isoformat()
+
+
+def _year_month(day: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    d = day.astype("datetime64[D]")
+    months = d.astype("datetime64[M]").astype(np.int64)
+    return months // 12 + 1970, months % 12 + 1
+
+
+def group_readings(
+    station_codes: np.ndarray, day: np.ndarray, depth: np.ndarray
+) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+    """
+    Representative row of every station, in order of first appearance, and
+    the history arrays. Rows without a station_id each count as a station.
+    """
+    n = len(station_codes)
+    key = station_codes.astype(np.int64)
+    anonymous = key == 0
+    key[anonymous] = key.max(initial=0) + 1 + np.arange(int(anonymous.sum()))
+
+    _, first_row, group = np.unique(key, return_index=True, return_inverse=True)
+    rank = np.empty(len(first_row), dtype=np.int64)
+    rank[np.argsort(first_row, kind="stable")] = np.arange(len(first_row))
+    station = rank[group.ravel()]
+    n_stations = len(first_row)
+
+    has_depth = np.isfinite(depth)
+    # per station: readings without depth first, then by date, then file order
+    order = np.lexsort((np.arange(n), day, has_depth, station))
+    ends = np.cumsum(np.bincount(station, minlength=n_stations))
+    representative = order[ends - 1]
+
+    dated = order[(has_depth & (day != NO_DAY))[order]]
+    offsets = np.zeros(n_stations + 1, dtype=np.int64)
+    np.cumsum(np.bincount(station[dated], minlength=n_stations), out=offsets[1:])
+    return representative, {
+        "history_offsets": offsets,
+        "history_day": day[dated].astype(np.int32),
+        "history_depth": depth[dated].astype(np.float64),
+    }
+
+
+def seasonal_trends(offsets: np.ndarray, day: np.ndarray, depth: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per-station slope (m/year), number of seasonal years and mean depth for each season."""
+    n_stations = len(offsets) - 1
+    station = np.repeat(np.arange(n_stations), np.diff(offsets))
+    year, month = _year_month(day)
+    trends: Dict[str, np.ndarray] = {}
+    for season, months in SEASONS.items():
+        sel = np.isin(month, months)
+        # annual seasonal means, so quarterly and monthly wells weigh the same
+        pair = station[sel] * 10000 + year[sel]
+        pairs, inverse = np.unique(pair, return_inverse=True)
+        inverse = inverse.ravel()
+        annual = np.bincount(inverse, weights=depth[sel]) / np.bincount(inverse)
+        s, t = pairs // 10000, (pairs % 10000).astype(np.float64)
+
+        n = np.bincount(s, minlength=n_stations).astype(np.float64)
+        st = np.bincount(s, weights=t, minlength=n_stations)
+        sy = np.bincount(s, weights=annual, minlength=n_stations)
+        stt = np.bincount(s, weights=t * t, minlength=n_stations)
+        sty = np.bincount(s, weights=t * annual, minlength=n_stations)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            slope = (n * sty - st * sy) / (n * stt - st * st)
+            mean = sy / n
+        slope[n < TREND_MIN_YEARS] = np.nan
+        trends[f"trend_{season}_slope"] = slope
+        trends[f"trend_{season}_years"] = n.astype(np.int32)
+        trends[f"trend_{season}_mean"] = mean
+    return trends
+
+
+class StationHistory:
+    """Read access to the CSR history arrays of a StationStore."""
+
+    def __init__(self, offsets: np.ndarray, day: np.ndarray, depth: np.ndarray):
+        self.offsets = offsets
+        self.day = day
+        self.depth = depth
+        self._first_day: Optional[np.ndarray] = None
+        self._keys: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.day)
+
+    def first_day(self) -> np.ndarray:
+        """Day of every station's first reading (int32 max where it has none)."""
+        if self._first_day is None:
+            starts = self.offsets[:-1]
+            has = self.offsets[1:] > starts
+            first = np.full(len(starts), np.iinfo(np.int32).max, dtype=np.int64)
+            first[has] = self.day[starts[has]]
+            self._first_day = first
+        return self._first_day
+
+    def series(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        return self.day[start:end], self.depth[start:end]
+
+    def _sorted_keys(self) -> np.ndarray:
+        # (station, day) packed so that all slices search as one sorted array
+        if self._keys is None:
+            station = np.repeat(np.arange(len(self.offsets) - 1, dtype=np.int64), np.diff(self.offsets))
+            self._keys = (station << 32) | (self.day.astype(np.int64) - NO_DAY)
+        return self._keys
+
+    def as_of(self, rows: Sequence[int], day: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Depth and day of each row's latest reading on or before day (NaN / NO_DAY if none)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        probe = (np.maximum(rows, 0) << 32) | (np.int64(day) - NO_DAY)
+        pos = np.searchsorted(self._sorted_keys(), probe, side="right") - 1
+        found = (rows >= 0) & (pos >= self.offsets[np.maximum(rows, 0)])
+        depth = np.where(found, self.depth[np.maximum(pos, 0)] if len(self.depth) else np.nan, np.nan)
+        days = np.where(found, self.day[np.maximum(pos, 0)] if len(self.day) else NO_DAY, NO_DAY)
+        return depth, days
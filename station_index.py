@@ -0,0 +1,331 @@
+import math
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from geo import EARTH_RADIUS_KM, MAX_GREAT_CIRCLE_KM, haversine_km, haversine_km_array
+
+# Cell edge of the lat/lon bucket grid. 0.25 deg is ~28 km at the equator, so the
+# default 50 km search touches a handful of buckets.
+DEFAULT_CELL_DEG = 0.25
+
+# Bounding boxes are padded by this much so that rounding in haversine_km can
+# never report a station as "inside the radius" while it sits outside the box.
+_BBOX_PAD_DEG = 1e-6
+
+# Upper bound on the side of the query blocks k_nearest() batches together.
+_MAX_QUERY_BLOCK_DEG = 2.0
+
+# Sparse query sets get blocks wide enough to hold about this many points.
+_QUERIES_PER_BLOCK = 16
+
+# Names of the arrays that fully describe a built index (see arrays()/from_arrays()).
+INDEX_ARRAYS = ("order", "cell_keys", "cell_start", "cell_end", "stray")
+
+
+def _unit_vectors(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    return _unit_vectors_rad(np.radians(lats), np.radians(lons))
+
+
+def _unit_vectors_rad(lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=1)
+
+
+class StationGridIndex:
+    """
+    Lat/lon bucket grid over station coordinates for nearest-station queries.
+
+    Buckets are stored CSR-style: station rows sorted by bucket key plus the
+    start/end of every occupied bucket, so a built index is a handful of flat
+    arrays that can be written to (and memory-mapped from) a snapshot.
+
+    Results are identical to a linear scan with haversine_km: the nearest
+    station wins and exact distance ties go to the lowest row index.
+    Coordinates that are not finite are never returned (the old scan skipped
+    rows it could not parse); coordinates outside the valid lat/lon range are
+    kept in a small overflow list that every query checks.
+    """
+
+    def __init__(
+        self,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        cell_deg: float = DEFAULT_CELL_DEG,
+        arrays: Optional[Dict[str, np.ndarray]] = None,
+        radians: Optional[Tuple[np.ndarray, np.ndarray]] = None,
+    ):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        if self.lats.shape != self.lons.shape:
+            raise ValueError("lats and lons must have the same length")
+        # the store's precomputed lat/lon radians, if it has them
+        self._radians = radians
+
+        self.cell_deg = float(cell_deg)
+        self._n_lat_cells = int(math.ceil(180.0 / cell_deg))
+        self._n_lon_cells = int(math.ceil(360.0 / cell_deg))
+        self._start_radius_km = math.radians(cell_deg) * EARTH_RADIUS_KM
+
+        if arrays is None:
+            arrays = self._build()
+        self._order = arrays["order"]
+        self._cell_keys = arrays["cell_keys"]
+        self._cell_start = arrays["cell_start"]
+        self._cell_end = arrays["cell_end"]
+        self._stray = arrays["stray"]
+        # unit vectors for k_nearest(), built on first use
+        self._xyz: Optional[np.ndarray] = None
+
+    def _build(self) -> Dict[str, np.ndarray]:
+        finite = np.isfinite(self.lats) & np.isfinite(self.lons)
+        in_range = (
+            finite
+            & (self.lats >= -90.0) & (self.lats <= 90.0)
+            & (self.lons >= -180.0) & (self.lons <= 180.0)
+        )
+        rows = np.flatnonzero(in_range)
+        lat_cell = np.clip(
+            np.floor((self.lats[rows] + 90.0) / self.cell_deg), 0, self._n_lat_cells - 1
+        ).astype(np.int64)
+        lon_cell = np.floor((self.lons[rows] + 180.0) / self.cell_deg).astype(np.int64) % self._n_lon_cells
+        keys = lat_cell * self._n_lon_cells + lon_cell
+
+        # stable sort keeps rows ascending inside each bucket
+        perm = np.argsort(keys, kind="stable")
+        sorted_keys = keys[perm]
+        cell_keys, cell_start = np.unique(sorted_keys, return_index=True)
+        cell_end = np.append(cell_start[1:], len(sorted_keys))
+        return {
+            "order": rows[perm].astype(np.int64),
+            "cell_keys": cell_keys.astype(np.int64),
+            "cell_start": cell_start.astype(np.int64),
+            "cell_end": cell_end.astype(np.int64),
+            "stray": np.flatnonzero(finite & ~in_range).astype(np.int64),
+        }
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {
+            "order": self._order,
+            "cell_keys": self._cell_keys,
+            "cell_start": self._cell_start,
+            "cell_end": self._cell_end,
+            "stray": self._stray,
+        }
+
+    def __len__(self) -> int:
+        return len(self.lats)
+
+    def _lat_cell(self, lat: float) -> int:
+        return min(max(int(math.floor((lat + 90.0) / self.cell_deg)), 0), self._n_lat_cells - 1)
+
+    def _candidates(self, lat: float, lon: float, radius_km: float) -> np.ndarray:
+        dlat = math.degrees(radius_km / EARTH_RADIUS_KM) + _BBOX_PAD_DEG
+        lat_min = lat - dlat
+        lat_max = lat + dlat
+
+        full_lon = True
+        if lat_min > -90.0 and lat_max < 90.0:
+            # Widest longitude offset reached by the search circle (the circle
+            # does not contain a pole, so this is well defined).
+            ratio = math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+            if ratio < 1.0:
+                dlon = math.degrees(math.asin(ratio)) + _BBOX_PAD_DEG
+                full_lon = dlon >= 180.0
+
+        r0 = self._lat_cell(max(lat_min, -90.0))
+        r1 = self._lat_cell(min(lat_max, 90.0))
+        if full_lon:
+            c0, n_lon = 0, self._n_lon_cells
+        else:
+            c0 = int(math.floor((lon - dlon + 180.0) / self.cell_deg))
+            c1 = int(math.floor((lon + dlon + 180.0) / self.cell_deg))
+            n_lon = min(c1 - c0 + 1, self._n_lon_cells)
+
+        parts = self._bucket_rows(r0, r1, c0, n_lon)
+        if len(self._stray):
+            parts.append(self._stray)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(parts)
+
+    def _bucket_rows(self, r0: int, r1: int, c0: int, n_lon: int) -> List[np.ndarray]:
+        """Station rows of the occupied buckets in lat rows r0..r1 and n_lon columns from c0."""
+        if (r1 - r0 + 1) * n_lon > len(self._cell_keys):
+            # Large boxes (huge radii, polar queries) are cheaper to answer by
+            # filtering the occupied buckets than by probing every empty one.
+            rows = self._cell_keys // self._n_lon_cells
+            cols = self._cell_keys % self._n_lon_cells
+            hit = np.flatnonzero(
+                (rows >= r0) & (rows <= r1) & ((cols - c0) % self._n_lon_cells < n_lon)
+            )
+        else:
+            probe_rows = np.arange(r0, r1 + 1, dtype=np.int64)
+            probe_cols = (c0 + np.arange(n_lon, dtype=np.int64)) % self._n_lon_cells
+            probes = (probe_rows[:, None] * self._n_lon_cells + probe_cols[None, :]).ravel()
+            pos = np.searchsorted(self._cell_keys, probes)
+            found = pos < len(self._cell_keys)
+            found[found] = self._cell_keys[pos[found]] == probes[found]
+            hit = pos[found]
+        return [self._order[s:e] for s, e in zip(self._cell_start[hit], self._cell_end[hit])]
+
+    def in_bbox(self, south: float, west: float, north: float, east: float) -> np.ndarray:
+        """Rows inside a lat/lon box (west > east crosses the antimeridian), ascending."""
+        r0 = self._lat_cell(max(south, -90.0))
+        r1 = self._lat_cell(min(north, 90.0))
+        c0 = int(math.floor((west + 180.0) / self.cell_deg)) % self._n_lon_cells
+        c1 = int(math.floor((min(east, 180.0) + 180.0) / self.cell_deg)) % self._n_lon_cells
+        n_lon = (c1 - c0) % self._n_lon_cells + 1
+        if west <= east and east - west >= 360.0:
+            c0, n_lon = 0, self._n_lon_cells
+
+        parts = self._bucket_rows(r0, r1, c0, n_lon)
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        cand = np.concatenate(parts)
+
+        lat, lon = self.lats[cand], self.lons[cand]
+        inside = (lat >= south) & (lat <= north)
+        if west <= east:
+            inside &= (lon >= west) & (lon <= east)
+        else:
+            inside &= (lon >= west) | (lon <= east)
+        return np.sort(cand[inside])
+
+    def _best_within(
+        self, lat: float, lon: float, radius_km: float
+    ) -> Optional[Tuple[int, float]]:
+        best_i = -1
+        best_d = math.inf
+        cand = self._candidates(lat, lon, radius_km)
+        for i, s_lat, s_lon in zip(cand.tolist(), self.lats[cand].tolist(), self.lons[cand].tolist()):
+            d = haversine_km(lat, lon, s_lat, s_lon)
+            if d < best_d or (d == best_d and i < best_i):
+                best_i, best_d = i, d
+        if best_i < 0 or best_d > radius_km:
+            return None
+        return best_i, best_d
+
+    def nearest(
+        self, lat: float, lon: float, max_radius_km: float
+    ) -> Optional[Tuple[int, float]]:
+        """Return (row index, distance km) of the nearest station within max_radius_km."""
+        limit = min(max_radius_km, MAX_GREAT_CIRCLE_KM)
+        if not limit >= 0.0:
+            return None
+
+        # Grow the search circle until it holds a station. Any station closer
+        # than the best one found lies inside the same circle, so the first
+        # hit is the global nearest.
+        radius = min(self._start_radius_km, limit)
+        while True:
+            best = self._best_within(lat, lon, radius)
+            if best is not None:
+                return best
+            if radius >= limit:
+                return None
+            radius = min(radius * 2.0, limit)
+
+    def _unit_xyz(self) -> np.ndarray:
+        if self._xyz is None:
+            if self._radians is None:
+                self._xyz = _unit_vectors(self.lats, self.lons)
+            else:
+                self._xyz = _unit_vectors_rad(*self._radians)
+        return self._xyz
+
+    def k_nearest(
+        self,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        k: int,
+        max_radius_km: float,
+        mask: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Up to k nearest stations within max_radius_km of every query point.
+        Returns (rows, distances), both (n_points, k) and sorted by distance;
+        unused slots hold -1 / inf. mask, if given, restricts the stations
+        that may be returned.
+
+        Query points are grouped into lat/lon blocks; each block shares one
+        candidate set (the search circle around the block centre, widened by
+        the block's spread) and one candidate-ranking matrix product.
+        """
+        q_lat = np.asarray(lats, dtype=np.float64).ravel()
+        q_lon = np.asarray(lons, dtype=np.float64).ravel()
+        rows_out = np.full((len(q_lat), k), -1, dtype=np.int64)
+        dist_out = np.full((len(q_lat), k), np.inf)
+        limit = min(max_radius_km, MAX_GREAT_CIRCLE_KM)
+        if not limit >= 0.0 or k < 1:
+            return rows_out, dist_out
+
+        # Blocks about as wide as the search radius: much smaller and the
+        # per-block overhead dominates, much larger and the dense distance
+        # blocks fill up with far-away candidates. Points scattered thinly
+        # over a wide area (batch lookups) would mostly get a block each, so
+        # blocks also grow to hold about _QUERIES_PER_BLOCK points.
+        queries = np.flatnonzero(np.isfinite(q_lat) & np.isfinite(q_lon))
+        block_deg = max(self.cell_deg, math.degrees(limit / EARTH_RADIUS_KM))
+        if len(queries) > _QUERIES_PER_BLOCK:
+            lat_span = max(float(np.ptp(q_lat[queries])), self.cell_deg)
+            lon_span = max(float(np.ptp(q_lon[queries])), self.cell_deg)
+            area = lat_span * lon_span
+            block_deg = max(block_deg, math.sqrt(area * _QUERIES_PER_BLOCK / len(queries)))
+        block_deg = min(block_deg, _MAX_QUERY_BLOCK_DEG)
+        n_lat_blocks = int(math.ceil(180.0 / block_deg))
+        n_lon_blocks = int(math.ceil(360.0 / block_deg))
+
+        q_xyz = _unit_vectors(q_lat, q_lon)
+        lat_block = np.clip(np.floor((q_lat[queries] + 90.0) / block_deg), 0, n_lat_blocks - 1)
+        lon_block = np.floor((q_lon[queries] + 180.0) / block_deg) % n_lon_blocks
+        keys = (lat_block * n_lon_blocks + lon_block).astype(np.int64)
+        order = queries[np.argsort(keys, kind="stable")]
+        group_keys, group_start = np.unique(np.sort(keys, kind="stable"), return_index=True)
+        group_end = np.append(group_start[1:], len(order))
+
+        for key, start, end in zip(group_keys.tolist(), group_start.tolist(), group_end.tolist()):
+            points = order[start:end]
+            c_lat = min((key // n_lon_blocks + 0.5) * block_deg - 90.0, 90.0)
+            c_lon = (key % n_lon_blocks + 0.5) * block_deg - 180.0
+            spread = float(haversine_km_array(c_lat, c_lon, q_lat[points], q_lon[points]).max())
+            cand = self._candidates(c_lat, c_lon, min(limit + spread, MAX_GREAT_CIRCLE_KM))
+            if mask is not None:
+                cand = cand[mask[cand]]
+            if len(cand) == 0:
+                continue
+
+            # rank by dot product of unit vectors (one matrix product, same
+            # order as great-circle distance), then measure the k kept exactly
+            closeness = q_xyz[points] @ self._unit_xyz()[cand].T
+            line = np.arange(len(points))[:, None]
+            if len(cand) > k:
+                nearest = np.argpartition(-closeness, k - 1, axis=1)[:, :k]
+            else:
+                nearest = np.broadcast_to(np.arange(len(cand)), closeness.shape)
+            cand_rows = cand[nearest]
+            d = haversine_km_array(
+                q_lat[points, None], q_lon[points, None], self.lats[cand_rows], self.lons[cand_rows]
+            )
+            d[~(d <= limit)] = np.inf
+            by_dist = np.argsort(d, axis=1, kind="stable")
+            d = d[line, by_dist]
+            cand_rows = np.where(np.isfinite(d), cand_rows[line, by_dist], -1)
+            rows_out[points, : d.shape[1]] = cand_rows
+            dist_out[points, : d.shape[1]] = d
+        return rows_out, dist_out
+
+    def nearest_bruteforce(
+        self, lat: float, lon: float, max_radius_km: float
+    ) -> Optional[Tuple[int, float]]:
+        """Reference linear scan, kept for verification and benchmarks."""
+        best_i = -1
+        best_d = math.inf
+        for i, (s_lat, s_lon) in enumerate(zip(self.lats.tolist(), self.lons.tolist())):
+            if not (math.isfinite(s_lat) and math.isfinite(s_lon)):
+                continue
+            d = haversine_km(lat, lon, s_lat, s_lon)
+            if d < best_d:
+                best_i, best_d = i, d
+        if best_i < 0 or best_d > max_radius_km:
+            return None
+        return best_i, best_d
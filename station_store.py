@@ -0,0 +1,447 @@
+import csv
+import io
+import json
+import mmap
+import os
+import threading
+import time
+import zlib
+from array import array
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from station_history import (
+    HISTORY_ARRAYS,
+    NO_DAY,
+    TREND_FIELDS,
+    StationHistory,
+    group_readings,
+    parse_day,
+    seasonal_trends,
+)
+from station_index import DEFAULT_CELL_DEG, INDEX_ARRAYS, StationGridIndex
+
+STATION_FIELDS = (
+    "station_id", "station_name", "latitude", "longitude",
+    "depth_m_bgl", "date", "state", "district",
+)
+NUMERIC_FIELDS = ("latitude", "longitude", "depth_m_bgl")
+TEXT_FIELDS = ("station_id", "station_name", "date", "state", "district")
+
+# parse unit of StationCsvLoader; a reload re-parses only units whose bytes changed
+CSV_CHUNK_BYTES = 1 << 20
+
+SNAPSHOT_MAGIC = b"RTRWHSTN"
+SNAPSHOT_VERSION = 2
+_ALIGN = 64
+
+
+class StringTable:
+    """
+    Interned strings shared by all text columns. Code 0 is reserved for a
+    missing value (None). Backed either by a Python list (built from CSV) or
+    by a UTF-8 blob + offsets that live in a memory-mapped snapshot and are
+    decoded on access.
+    """
+
+    def __init__(
+        self,
+        strings: Optional[List[Optional[str]]] = None,
+        blob: Optional[np.ndarray] = None,
+        offsets: Optional[np.ndarray] = None,
+    ):
+        self._strings = strings
+        self._blob = blob
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        if self._strings is not None:
+            return len(self._strings)
+        return len(self._offsets) - 1
+
+    def __getitem__(self, code: int) -> Optional[str]:
+        if code == 0:
+            return None
+        if self._strings is not None:
+            return self._strings[code]
+        start, end = int(self._offsets[code]), int(self._offsets[code + 1])
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def encoded(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._strings is None:
+            return self._blob, self._offsets
+        parts = [b""] + [s.encode("utf-8") for s in self._strings[1:]]
+        offsets = np.zeros(len(parts) + 1, dtype=np.uint64)
+        np.cumsum([len(p) for p in parts], out=offsets[1:])
+        return np.frombuffer(b"".join(parts), dtype=np.uint8), offsets
+
+
+class StationStore:
+    """
+    Columnar station table: float64 lat/lon/depth (NaN where the CSV value is
+    missing or unparsable), precomputed radians, and uint32 codes into a
+    shared StringTable for the text columns. One row per station (its latest
+    reading); all readings are in .history and seasonal trends in .trends.
+    Carries its spatial index.
+    """
+
+    def __init__(
+        self,
+        columns: Dict[str, np.ndarray],
+        strings: StringTable,
+        index: StationGridIndex,
+        source: str,
+        keepalive: Optional[mmap.mmap] = None,
+    ):
+        self.lat = columns["latitude"]
+        self.lon = columns["longitude"]
+        self.depth = columns["depth_m_bgl"]
+        self.lat_rad = columns["lat_rad"]
+        self.lon_rad = columns["lon_rad"]
+        self.codes = {name: columns[name] for name in TEXT_FIELDS}
+        self.history = StationHistory(*(columns[name] for name in HISTORY_ARRAYS))
+        self.trends = {name: columns[name] for name in TREND_FIELDS}
+        self.strings = strings
+        self.index = index
+        self.source = source
+        self._keepalive = keepalive
+        self._rows_by_id: Optional[Dict[str, int]] = None
+        self._version: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self.lat)
+
+    def text(self, field: str, i: int) -> Optional[str]:
+        return self.strings[int(self.codes[field][i])]
+
+    @property
+    def version(self) -> str:
+        """Content id of the columns, readings and strings (stable across CSV and snapshot loads)."""
+        if self._version is None:
+            crc = 0
+            arrays = [self.lat, self.lon, self.depth, self.history.offsets, self.history.day, self.history.depth]
+            arrays += [self.codes[name] for name in TEXT_FIELDS]
+            arrays += self.strings.encoded()
+            for arr in arrays:
+                crc = zlib.crc32(np.ascontiguousarray(arr).tobytes(), crc)
+            self._version = f"{len(self):x}-{len(self.history):x}-{crc:08x}"
+        return self._version
+
+    def row_for_id(self, station_id: str) -> Optional[int]:
+        if self._rows_by_id is None:
+            self._rows_by_id = {
+                self.strings[int(code)]: i for i, code in enumerate(self.codes["station_id"].tolist()) if code
+            }
+        return self._rows_by_id.get(station_id)
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        cols = {
+            "latitude": self.lat,
+            "longitude": self.lon,
+            "depth_m_bgl": self.depth,
+            "lat_rad": self.lat_rad,
+            "lon_rad": self.lon_rad,
+        }
+        cols.update(self.codes)
+        cols.update(zip(HISTORY_ARRAYS, (self.history.offsets, self.history.day, self.history.depth)))
+        cols.update(self.trends)
+        return cols
+
+
+def _parse_float(value: Optional[str]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+def _build_store(
+    readings: Dict[str, np.ndarray], strings: List[Optional[str]], cell_deg: float, source: str
+) -> StationStore:
+    # dates are interned, so each distinct date string is parsed once
+    date_codes, date_inverse = np.unique(readings["date"], return_inverse=True)
+    parsed = [parse_day(strings[int(code)]) for code in date_codes]
+    day_of_code = np.array([NO_DAY if d is None else d for d in parsed], dtype=np.int64)
+    day = day_of_code[date_inverse.ravel()]
+
+    rows, history = group_readings(readings["station_id"], day, readings["depth_m_bgl"])
+    columns: Dict[str, np.ndarray] = {name: values[rows] for name, values in readings.items()}
+    columns["lat_rad"] = np.radians(columns["latitude"])
+    columns["lon_rad"] = np.radians(columns["longitude"])
+    columns.update(history)
+    columns.update(seasonal_trends(history["history_offsets"], history["history_day"], history["history_depth"]))
+
+    index = StationGridIndex(
+        columns["latitude"], columns["longitude"], cell_deg=cell_deg,
+        radians=(columns["lat_rad"], columns["lon_rad"]),
+    )
+    return StationStore(columns, StringTable(strings=strings), index, source=source)
+
+
+class StationCsvLoader:
+    """
+    Streams the station CSV in newline-aligned chunks of about chunk_bytes
+    and keeps each chunk's parsed columns keyed by its CRC, so loading the
+    file again only re-parses chunks whose bytes changed (appended readings
+    touch the last chunk; an edited row touches its own chunk and, if its
+    length changed, the ones after it). Text codes point into one string
+    table shared by all chunks; after every load it is rebuilt from the
+    strings the live chunks still use, numbered in order of first use, so it
+    does not grow with edits and the same file always gets the same codes.
+    Assumes no quoted field spans a line break. load() holds a lock, so
+    concurrent callers (lazy first load, reloads) run one at a time.
+    """
+
+    def __init__(self, path: str, cell_deg: float = DEFAULT_CELL_DEG, chunk_bytes: int = CSV_CHUNK_BYTES):
+        self.path = path
+        self.cell_deg = cell_deg
+        self.chunk_bytes = chunk_bytes
+        self.stamp: Optional[Dict[str, int]] = None
+        self._header: Optional[List[str]] = None
+        self._chunks: Dict[Tuple[int, int], Dict[str, np.ndarray]] = {}
+        self._interned: Dict[Optional[str], int] = {None: 0}
+        self._strings: List[Optional[str]] = [None]
+        self._lock = threading.Lock()
+
+    def current_stamp(self) -> Optional[Dict[str, int]]:
+        """Size and mtime of the CSV now (None if it is missing)."""
+        return _source_stamp(self.path)
+
+    def _read_chunks(self, f: io.BufferedReader) -> Iterator[bytes]:
+        rest = b""
+        while True:
+            block = f.read(self.chunk_bytes)
+            if not block:
+                if rest:
+                    yield rest
+                return
+            block = rest + block
+            cut = block.rfind(b"\n") + 1
+            if cut == 0:
+                rest = block
+                continue
+            yield block[:cut]
+            rest = block[cut:]
+
+    def _parse_chunk(self, data: bytes, header: List[str]) -> Dict[str, np.ndarray]:
+        numeric = {name: array("d") for name in NUMERIC_FIELDS}
+        text = {name: array("I") for name in TEXT_FIELDS}
+        interned, strings = self._interned, self._strings
+        intern = interned.get
+
+        # absent columns read position `width`, which every record pads with None
+        width = len(header)
+        pos = {name: i for i, name in enumerate(header)}
+        numeric_cols = [(pos.get(name, width), numeric[name].append) for name in NUMERIC_FIELDS]
+        text_cols = [(pos.get(name, width), text[name].append) for name in TEXT_FIELDS]
+        padding = [None] * (width + 1)
+
+        for record in csv.reader(io.StringIO(data.decode("utf-8"), newline="")):
+            if not record:
+                continue
+            record += padding[len(record):]
+            for i, append in numeric_cols:
+                append(_parse_float(record[i]))
+            for i, append in text_cols:
+                value = record[i]
+                code = intern(value)
+                if code is None:
+                    code = interned[value] = len(strings)
+                    strings.append(value)
+                append(code)
+
+        columns = {name: np.frombuffer(values, dtype=np.float64) for name, values in numeric.items()}
+        for name, codes in text.items():
+            columns[name] = np.frombuffer(codes, dtype=np.uint32)
+        return columns
+
+    def _compact_strings(self, readings: Dict[str, np.ndarray]) -> None:
+        """Renumber the string table to the strings readings use, by first use; remap chunks and readings."""
+        codes = np.stack([readings[name] for name in TEXT_FIELDS], axis=1).ravel()
+        used, first = np.unique(codes, return_index=True)
+        keep = first[used != 0]
+        used = used[used != 0][np.argsort(keep, kind="stable")]
+        if len(used) == len(self._strings) - 1 and np.array_equal(used, np.arange(1, len(self._strings))):
+            # appends and fresh loads already number strings by first use
+            return
+
+        remap = np.zeros(len(self._strings), dtype=np.uint32)
+        remap[used] = np.arange(1, len(used) + 1, dtype=np.uint32)
+        strings = self._strings
+        self._strings = [None] + [strings[code] for code in used.tolist()]
+        self._interned = {value: code for code, value in enumerate(self._strings)}
+        for columns in self._chunks.values():
+            for name in TEXT_FIELDS:
+                columns[name] = remap[columns[name]]
+        for name in TEXT_FIELDS:
+            readings[name] = remap[readings[name]]
+
+    def load(self) -> Tuple[StationStore, Dict[str, object]]:
+        """
+        Parse the CSV (reusing unchanged chunks) into a new StationStore.
+        Raises FileNotFoundError/ValueError; returns the store and load counters.
+        """
+        with self._lock:
+            return self._load()
+
+    def _load(self) -> Tuple[StationStore, Dict[str, object]]:
+        t0 = time.perf_counter()
+        stamp = self.current_stamp()
+        parts: List[Dict[str, np.ndarray]] = []
+        chunks: Dict[Tuple[int, int], Dict[str, np.ndarray]] = {}
+        reused = parsed_rows = 0
+        with open(self.path, "rb") as f:
+            header_line = f.readline()
+            header = next(csv.reader([header_line.decode("utf-8")]), None) if header_line else None
+            if header is None:
+                raise ValueError("CSV has no rows")
+            if header != self._header:
+                # columns moved: nothing parsed so far lines up
+                self._header = header
+                self._chunks = {}
+            for data in self._read_chunks(f):
+                key = (zlib.crc32(data), len(data))
+                columns = chunks.get(key) or self._chunks.get(key)
+                if columns is None:
+                    columns = self._parse_chunk(data, header)
+                    parsed_rows += len(columns["latitude"])
+                else:
+                    reused += 1
+                chunks[key] = columns
+                parts.append(columns)
+        self._chunks = chunks
+        n_rows = sum(len(p["latitude"]) for p in parts)
+        if n_rows == 0:
+            raise ValueError("CSV has no rows")
+        t1 = time.perf_counter()
+
+        readings = {name: np.concatenate([p[name] for p in parts]) for name in parts[0]}
+        self._compact_strings(readings)
+        store = _build_store(readings, list(self._strings), self.cell_deg, source=self.path)
+        t2 = time.perf_counter()
+        self.stamp = stamp
+        return store, {
+            "rows": n_rows,
+            "rows_parsed": parsed_rows,
+            "chunks": len(parts),
+            "chunks_reused": reused,
+            "parse_ms": round((t1 - t0) * 1000, 1),
+            "build_ms": round((t2 - t1) * 1000, 1),
+        }
+
+
+def read_station_csv(path: str, cell_deg: float = DEFAULT_CELL_DEG) -> StationStore:
+    """
+    Stream the station CSV into a StationStore (raises FileNotFoundError/ValueError).
+    Rows sharing a station_id are readings of one station.
+    """
+    return StationCsvLoader(path, cell_deg).load()[0]
+
+
+def _source_stamp(path: str) -> Optional[Dict[str, int]]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def write_snapshot(store: StationStore, out_path: str, csv_path: Optional[str] = None) -> int:
+    """Write store (columns, strings, index) as a snapshot file; returns its size in bytes."""
+    blob, offsets = store.strings.encoded()
+    arrays: Dict[str, np.ndarray] = dict(store.columns())
+    arrays["strings_blob"] = blob
+    arrays["strings_offsets"] = offsets
+    for name, arr in store.index.arrays().items():
+        arrays["index_" + name] = arr
+
+    layout = {}
+    pos = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        pos = -(-pos // _ALIGN) * _ALIGN
+        layout[name] = [arr.dtype.str, pos, int(arr.size)]
+        pos += arr.nbytes
+
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "rows": len(store),
+        "cell_deg": store.index.cell_deg,
+        "source": _source_stamp(csv_path or store.source),
+        "arrays": layout,
+    }).encode("utf-8")
+    prefix = SNAPSHOT_MAGIC + len(header).to_bytes(4, "little") + header
+    data_start = -(-len(prefix) // _ALIGN) * _ALIGN
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(prefix)
+        for name, arr in arrays.items():
+            f.seek(data_start + layout[name][1])
+            f.write(arr.tobytes())
+        f.truncate(data_start + pos)
+    # readers never see a half-written snapshot
+    os.replace(tmp_path, out_path)
+    return data_start + pos
+
+
+def open_snapshot(path: str) -> Tuple[StationStore, Optional[Dict[str, int]]]:
+    """
+    Memory-map a snapshot. Arrays are read-only views over the mapping, so
+    every worker that opens the same file shares its pages.
+    Returns the store and the CSV stamp recorded when the snapshot was built.
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if mm[: len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+        mm.close()
+        raise ValueError(f"'{path}' is not a station snapshot")
+    header_len = int.from_bytes(mm[len(SNAPSHOT_MAGIC): len(SNAPSHOT_MAGIC) + 4], "little")
+    header_end = len(SNAPSHOT_MAGIC) + 4 + header_len
+    header = json.loads(mm[len(SNAPSHOT_MAGIC) + 4: header_end].decode("utf-8"))
+    if header.get("version") != SNAPSHOT_VERSION:
+        mm.close()
+        raise ValueError(f"Unsupported station snapshot version {header.get('version')}")
+    data_start = -(-header_end // _ALIGN) * _ALIGN
+
+    arrays = {
+        name: np.frombuffer(mm, dtype=np.dtype(dtype), count=count, offset=data_start + offset)
+        for name, (dtype, offset, count) in header["arrays"].items()
+    }
+    index = StationGridIndex(
+        arrays["latitude"],
+        arrays["longitude"],
+        cell_deg=header["cell_deg"],
+        arrays={name: arrays["index_" + name] for name in INDEX_ARRAYS},
+        radians=(arrays["lat_rad"], arrays["lon_rad"]),
+    )
+    strings = StringTable(blob=arrays["strings_blob"], offsets=arrays["strings_offsets"])
+    store = StationStore(arrays, strings, index, source=path, keepalive=mm)
+    return store, header.get("source")
+
+
+def load_station_store(
+    csv_path: str, snapshot_path: Optional[str] = None, loader: Optional[StationCsvLoader] = None
+) -> StationStore:
+    """
+    Prefer the snapshot when it was compiled from the current CSV (same size
+    and mtime) or when the CSV is absent; otherwise parse the CSV (through
+    loader when given, so later reloads can reuse its parsed chunks).
+    """
+    if snapshot_path and os.path.exists(snapshot_path):
+        current = _source_stamp(csv_path)
+        try:
+            store, stamp = open_snapshot(snapshot_path)
+        except ValueError:
+            # written by an older build; the CSV is the source of truth
+            if current is None:
+                raise
+        else:
+            if current is None or current == stamp:
+                return store
+    if loader is not None:
+        return loader.load()[0]
+    return read_station_csv(csv_path)
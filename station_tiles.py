@@ -0,0 +1,193 @@
+"""
+Station clusters per web-map zoom level, for /stations/tiles/{z}/{x}/{y}.
+
+Every station gets a Morton (Z-order) code of its Web Mercator position at
+zoom FINE_ZOOM. A Z-order code interleaves the x and y bits, so everything
+inside one XYZ tile is a single contiguous code range; with the codes sorted,
+a tile is two searchsorted calls.
+
+At load, stations are aggregated for every zoom up to MAX_CLUSTER_ZOOM into
+cluster cells CLUSTER_BITS levels finer than the tile (64 x 64 per tile):
+count, depth mean/min/max and member centroid, kept sorted by cell code so a
+tile's clusters are again one slice. Above MAX_CLUSTER_ZOOM tiles list the
+stations themselves.
+"""
+import math
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Tuple
+
+import numpy as np
+
+from station_store import StationStore
+
+MAX_CLUSTER_ZOOM = 12
+CLUSTER_BITS = 6
+FINE_ZOOM = 24
+MAX_TILE_ZOOM = FINE_ZOOM
+# Web Mercator is cut off here (square world at zoom 0)
+MAX_MERCATOR_LAT = 85.0511287798066
+# rendered responses kept per station store (key includes tile and format),
+# bounded by count and by total body bytes
+TILE_CACHE_SIZE = 4096
+TILE_CACHE_BYTES = 64 * 1024 * 1024
+# larger bodies (wide /stations listings) are rendered every time instead of
+# pushing dozens of tiles out of the cache
+TILE_CACHE_MAX_BODY_BYTES = 1024 * 1024
+
+_tiles: "weakref.WeakKeyDictionary[StationStore, StationTiles]" = weakref.WeakKeyDictionary()
+
+
+def _spread_bits(v: np.ndarray) -> np.ndarray:
+    """Insert a zero bit between each of the low 32 bits of v."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for shift, mask in (
+        (16, 0x0000FFFF0000FFFF),
+        (8, 0x00FF00FF00FF00FF),
+        (4, 0x0F0F0F0F0F0F0F0F),
+        (2, 0x3333333333333333),
+        (1, 0x5555555555555555),
+    ):
+        v = (v | (v << np.uint64(shift))) & np.uint64(mask)
+    return v
+
+
+def morton(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    return _spread_bits(x) | (_spread_bits(y) << np.uint64(1))
+
+
+def mercator_xy(lat: np.ndarray, lon: np.ndarray, zoom: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Integer XYZ tile coordinates (y from the north) of lat/lon at a zoom level."""
+    n = 1 << zoom
+    lat_r = np.radians(np.clip(lat, -MAX_MERCATOR_LAT, MAX_MERCATOR_LAT))
+    x = (np.asarray(lon) + 180.0) / 360.0 * n
+    y = (1.0 - np.arcsinh(np.tan(lat_r)) / math.pi) / 2.0 * n
+    return (
+        np.clip(np.floor(x), 0, n - 1).astype(np.uint64),
+        np.clip(np.floor(y), 0, n - 1).astype(np.uint64),
+    )
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of an XYZ tile."""
+    n = 1 << z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return lat(y + 1), x / n * 360.0 - 180.0, lat(y), (x + 1) / n * 360.0 - 180.0
+
+
+class StationTiles:
+    def __init__(self, store: StationStore):
+        self.store = store
+        valid = np.flatnonzero(np.isfinite(store.lat) & np.isfinite(store.lon))
+        fx, fy = mercator_xy(store.lat[valid], store.lon[valid], FINE_ZOOM)
+        codes = morton(fx, fy)
+        order = np.argsort(codes, kind="stable")
+        self.codes = codes[order]
+        self.rows = valid[order]
+
+        # tiles of an unchanged station table keep their ETags across reloads
+        self.version = store.version
+
+        self.clusters: Dict[int, Dict[str, np.ndarray]] = {
+            z: self._aggregate(z) for z in range(MAX_CLUSTER_ZOOM + 1)
+        }
+        self._rendered: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._rendered_bytes = 0
+        self._rendered_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _aggregate(self, z: int) -> Dict[str, np.ndarray]:
+        shift = np.uint64(2 * (FINE_ZOOM - z - CLUSTER_BITS))
+        cell = self.codes >> shift
+        if len(cell) == 0:
+            empty = np.empty(0)
+            return {"code": cell, "count": empty.astype(np.int64), "depth_count": empty.astype(np.int64),
+                    "lat": empty, "lon": empty, "mean_depth": empty, "min_depth": empty, "max_depth": empty}
+        starts = np.flatnonzero(np.concatenate(([True], cell[1:] != cell[:-1])))
+        count = np.diff(np.append(starts, len(cell)))
+
+        lat = self.store.lat[self.rows]
+        lon = self.store.lon[self.rows]
+        depth = self.store.depth[self.rows]
+        has_depth = np.isfinite(depth)
+        depth_count = np.add.reduceat(has_depth.astype(np.int64), starts)
+        depth_sum = np.add.reduceat(np.where(has_depth, depth, 0.0), starts)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_depth = depth_sum / depth_count
+        return {
+            "code": cell[starts],
+            "count": count,
+            "depth_count": depth_count,
+            "lat": np.add.reduceat(lat, starts) / count,
+            "lon": np.add.reduceat(lon, starts) / count,
+            "mean_depth": mean_depth,
+            # fmin/fmax skip NaN; all-NaN cells stay NaN
+            "min_depth": np.fmin.reduceat(depth, starts),
+            "max_depth": np.fmax.reduceat(depth, starts),
+        }
+
+    @staticmethod
+    def _tile_range(z: int, x: int, y: int, level: int) -> Tuple[np.uint64, np.uint64]:
+        shift = np.uint64(2 * (level - z))
+        code = morton(np.array([x]), np.array([y]))[0]
+        return code << shift, (code + np.uint64(1)) << shift
+
+    def tile_clusters(self, z: int, x: int, y: int) -> Dict[str, np.ndarray]:
+        """Cluster columns for a tile at z <= MAX_CLUSTER_ZOOM."""
+        clusters = self.clusters[z]
+        lo, hi = self._tile_range(z, x, y, z + CLUSTER_BITS)
+        a, b = np.searchsorted(clusters["code"], [lo, hi])
+        return {name: col[a:b] for name, col in clusters.items() if name != "code"}
+
+    def tile_rows(self, z: int, x: int, y: int) -> np.ndarray:
+        """Station rows inside a tile, in Z-order."""
+        lo, hi = self._tile_range(z, x, y, FINE_ZOOM)
+        a, b = np.searchsorted(self.codes, [lo, hi])
+        return self.rows[a:b]
+
+    def cached(self, key: Hashable, render: Callable[[], bytes]) -> bytes:
+        """LRU of rendered response bodies; render() runs outside the lock."""
+        with self._rendered_lock:
+            body = self._rendered.get(key)
+            if body is not None:
+                self._rendered.move_to_end(key)
+                self.hits += 1
+                return body
+            self.misses += 1
+        body = render()
+        if len(body) > TILE_CACHE_MAX_BODY_BYTES:
+            return body
+        with self._rendered_lock:
+            old = self._rendered.pop(key, None)
+            if old is not None:
+                self._rendered_bytes -= len(old)
+            self._rendered[key] = body
+            self._rendered_bytes += len(body)
+            while len(self._rendered) > TILE_CACHE_SIZE or self._rendered_bytes > TILE_CACHE_BYTES:
+                self._rendered_bytes -= len(self._rendered.popitem(last=False)[1])
+        return body
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "version": self.version,
+            "stations": int(len(self.rows)),
+            "clusters_per_zoom": {z: int(len(c["code"])) for z, c in self.clusters.items()},
+            "rendered_cached": len(self._rendered),
+            "rendered_bytes": self._rendered_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+def tiles_for(store: StationStore) -> StationTiles:
+    """Clusters for a station store, built once and kept as long as the store is."""
+    tiles = _tiles.get(store)
+    if tiles is None:
+        tiles = StationTiles(store)
+        _tiles[store] = tiles
+    return tiles
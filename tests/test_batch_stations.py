@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+from fastapi import HTTPException
+
+import main
+from station_store import STATION_FIELDS, read_station_csv
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    lat, lon = rng.uniform(8, 35, 2000), rng.uniform(68, 97, 2000)
+    lines = [",".join(STATION_FIELDS) + "\n"]
+    for i in range(2000):
+        depth = "" if i % 97 == 0 else f"{rng.uniform(1, 30):.2f}"
+        lines.append(f"S{i},Station {i},{lat[i]:.4f},{lon[i]:.4f},{depth},2023-05-01,State,District\n")
+    # stations sharing coordinates: the lowest row must win, as in nearest()
+    lines += [f"D{i},Duplicate {i},{lat[i]:.4f},{lon[i]:.4f},5.00,2023-05-01,State,District\n" for i in range(200)]
+    path = tmp_path / "stations.csv"
+    path.write_text("".join(lines))
+    store = read_station_csv(str(path))
+    monkeypatch.setattr(main, "india_store", store)
+    return store
+
+
+def _single(point):
+    try:
+        return main.get_india_depth_for_point(*point)
+    except HTTPException as e:
+        return e.status_code, e.detail
+
+
+def test_batch_lookup_matches_single_lookups(store):
+    rng = np.random.default_rng(2)
+    points = [
+        (float(a), float(b), float(r))
+        for a, b, r in zip(rng.uniform(5, 38, 3000), rng.uniform(65, 100, 3000), rng.choice([5.0, 50.0], 3000))
+    ]
+    points += [(float(store.lat[i]), float(store.lon[i]), 10.0) for i in range(0, 400, 3)]
+    points += [(95.0, 77.0, 50.0), (20.0, 77.0, -1.0), (20.0, 77.0, 0.0), (0.0, 0.0, 1e9)]
+
+    results = main.get_india_depths_for_points(points)
+    assert set(results) == set(points)
+    for point in points:
+        got = results[point]
+        if isinstance(got, HTTPException):
+            got = got.status_code, got.detail
+        assert got == _single(point), point
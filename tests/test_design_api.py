@@ -0,0 +1,95 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+
+import main
+from design import DesignMemo
+from rainfall import rainfall_stats_from_payload
+from station_store import read_station_csv
+
+client = TestClient(main.app)
+PARAMS = {"rooftop_area_m2": 120, "rooftop_type": "concrete", "lat": 22.57, "lon": 88.36, "year": 2020}
+
+
+def _payload():
+    times = [f"2020-07-{d:02d}T{h:02d}:00" for d in range(1, 4) for h in range(24)]
+    values = [0.0] * len(times)
+    values[30] = 12.5
+    values[31] = 30.0
+    return {"hourly": {"time": times, "precipitation": values}}
+
+
+@pytest.fixture
+def fetches(monkeypatch):
+    calls = []
+
+    async def fake_fetch(lat, lon, year=2024):
+        calls.append((lat, lon, year))
+        return rainfall_stats_from_payload(_payload(), year)
+
+    monkeypatch.setattr(main, "india_store", read_station_csv(main.INDIA_GW_FILE))
+    monkeypatch.setattr(main, "design_memo", DesignMemo())
+    monkeypatch.setattr(main, "fetch_rainfall_stats_async", fake_fetch)
+    return calls
+
+
+def test_repeat_request_is_served_from_memo(fetches):
+    first = client.get("/rwh-design", params=PARAMS)
+    assert first.status_code == 200
+    assert first.json()["rainfall"]["daily"]["max_daily_precip_mm"] == 42.5
+    second = client.get("/rwh-design", params=PARAMS)
+    assert second.content == first.content
+    assert len(fetches) == 1
+    assert main.design_memo.stats()["hits"] == 1
+
+
+def test_if_none_match_returns_304(fetches):
+    etag = client.get("/rwh-design", params=PARAMS).headers["etag"]
+    for header in (etag, f'"other", W/{etag}', "*", f' "x" ,{etag} '):
+        r = client.get("/rwh-design", params=PARAMS, headers={"If-None-Match": header})
+        assert r.status_code == 304, header
+        assert r.headers["etag"] == etag
+    # a tag that merely contains, or is contained in, ours is a different tag
+    for header in (etag[:-2] + '"', '"x' + etag[1:], etag.strip('"')):
+        r = client.get("/rwh-design", params=PARAMS, headers={"If-None-Match": header})
+        assert r.status_code == 200, header
+
+
+def test_fields_project_nested_paths(fetches):
+    r = client.get(
+        "/rwh-design",
+        params={**PARAMS, "fields": "rainfall.daily.max_daily_precip_mm, input.year,groundwater"},
+    )
+    assert r.status_code == 200
+    body = r.json()
+    assert set(body) == {"rainfall", "input", "groundwater"}
+    assert body["rainfall"] == {"daily": {"max_daily_precip_mm": 42.5}}
+    assert body["input"] == {"year": 2020}
+    assert "depth_m_below_ground" in body["groundwater"]
+
+
+@pytest.mark.parametrize("fields", ["nonsense", "rainfall..note", ",", "design,bogus.x"])
+def test_unknown_field_is_a_client_error(fetches, fields):
+    r = client.get("/rwh-design", params={**PARAMS, "fields": fields})
+    assert r.status_code == 400
+    assert not fetches
+
+
+def _request(header):
+    headers = [] if header is None else [(b"if-none-match", header.encode())]
+    return Request({"type": "http", "headers": headers})
+
+
+@pytest.mark.parametrize("header,match", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"x", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+    ('"ab"', False),
+    ('"xabc", "abc-1"', False),
+    ("abc", False),
+])
+def test_etag_matching_compares_whole_tags(header, match):
+    assert main._etag_matches(_request(header), '"abc"') is match
@@ -0,0 +1,116 @@
+import math
+
+import numpy as np
+import pytest
+
+from idf import (
+    IDF_DURATIONS_H,
+    IDF_MIN_YEARS,
+    annual_maxima,
+    gev_return_levels,
+    gumbel_return_levels,
+    idf_table,
+)
+
+
+def _hourly_years(seed, n_years, hours=24 * 40):
+    rng = np.random.default_rng(seed)
+    series = []
+    for _ in range(n_years):
+        x = np.where(rng.random(hours) < 0.2, rng.gamma(0.8, 4.0, hours), 0.0)
+        x[rng.integers(0, hours, 10)] = np.nan
+        series.append(x.astype(np.float32))
+    return series
+
+
+def naive_maxima(series, durations, breaks):
+    """Scan every window start; a window may continue into the next series unless it breaks."""
+    out = np.empty((len(series), len(durations)))
+    for y, s in enumerate(series):
+        follow = np.concatenate(series[y:]) if not breaks[y] else s
+        follow = np.where(np.isnan(follow), 0.0, follow).astype(np.float64)
+        for k, d in enumerate(durations):
+            best = -math.inf
+            for start in range(len(s)):
+                if start + d <= len(follow):
+                    best = max(best, float(follow[start: start + d].sum()))
+            out[y, k] = best
+    return out
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rolling_maxima_match_naive_scan(seed):
+    series = _hourly_years(seed, 4)
+    maxima, coverage = annual_maxima(series)
+    expected = naive_maxima(series, IDF_DURATIONS_H, [False, False, False, True])
+    np.testing.assert_allclose(maxima, expected, rtol=1e-9, atol=1e-6)
+    np.testing.assert_allclose(coverage, [1 - np.isnan(s).mean() for s in series])
+
+
+def test_windows_do_not_cross_a_gap():
+    a = np.zeros(48, dtype=np.float32)
+    a[-1] = 5.0
+    b = np.zeros(48, dtype=np.float32)
+    b[:23] = 10.0
+    # consecutive: the last hour of a starts a 24 h window reaching into b
+    joined, _ = annual_maxima([a, b], durations_h=(24,), breaks=[False, True])
+    assert joined[0, 0] == pytest.approx(5.0 + 230.0)
+    gapped, _ = annual_maxima([a, b], durations_h=(24,), breaks=[True, True])
+    assert gapped[0, 0] == pytest.approx(5.0)
+    assert gapped[1, 0] == joined[1, 0] == pytest.approx(230.0)
+
+
+def test_idf_table_splits_at_missing_years():
+    years = [2000, 2001, 2002, 2004, 2005, 2006]
+    series = dict(zip(years, _hourly_years(7, len(years), hours=24 * 366)))
+    series[2002][-1] = 500.0
+    series[2004][:3] = 400.0
+    table = idf_table(series, return_periods=(2, 10), durations_h=(1, 24))
+    assert table["n_years"] == 6
+    assert table["years"] == [2000, 2006]
+
+    breaks = [False, False, True, False, False, True]
+    maxima, _ = annual_maxima([series[y] for y in years], (1, 24), breaks)
+    expected = gumbel_return_levels(maxima, (2, 10))
+    np.testing.assert_allclose(table["depth_mm"], np.round(expected, 2))
+    # 2002's 24 h maximum is its own last hour, not 2002 + 2004's first hours
+    assert maxima[2, 1] < 500.0 + 400.0
+
+
+def test_idf_table_needs_enough_years():
+    series = dict(zip(range(2000, 2000 + IDF_MIN_YEARS - 1), _hourly_years(1, IDF_MIN_YEARS - 1)))
+    with pytest.raises(ValueError):
+        idf_table(series)
+    series[1999] = np.zeros(10, dtype=np.float32)
+    with pytest.raises(ValueError):
+        idf_table(series)
+
+
+def _gumbel_level(xi, alpha, t):
+    return xi - alpha * math.log(-math.log(1 - 1 / t))
+
+
+def test_gumbel_recovers_known_parameters():
+    rng = np.random.default_rng(0)
+    xi, alpha = 60.0, 15.0
+    sample = rng.gumbel(xi, alpha, (20000, 1))
+    periods = (2, 10, 100)
+    levels = gumbel_return_levels(sample, periods)[:, 0]
+    np.testing.assert_allclose(levels, [_gumbel_level(xi, alpha, t) for t in periods], rtol=0.02)
+
+
+@pytest.mark.parametrize("k", [-0.15, 0.0, 0.2])
+def test_gev_recovers_known_parameters(k):
+    rng = np.random.default_rng(1)
+    xi, alpha = 50.0, 12.0
+    u = rng.random((40000, 1))
+    y = -np.log(u)
+    # Hosking's parametrisation: x = xi + alpha / k * (1 - (-ln F)^k)
+    sample = xi - alpha * np.log(y) if k == 0 else xi + alpha / k * (1 - y ** k)
+    periods = (2, 10, 50)
+    levels = gev_return_levels(sample, periods)[:, 0]
+    expected = []
+    for t in periods:
+        yt = -math.log(1 - 1 / t)
+        expected.append(xi - alpha * math.log(yt) if k == 0 else xi + alpha / k * (1 - yt ** k))
+    np.testing.assert_allclose(levels, expected, rtol=0.03)
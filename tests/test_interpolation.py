@@ -0,0 +1,122 @@
+import numpy as np
+import pytest
+
+from geo import haversine_km
+from interpolation import (
+    idw_weights,
+    interpolate_depth,
+    kriging_chunk,
+    kriging_weights,
+    variogram_for,
+)
+from station_store import STATION_FIELDS, read_station_csv
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    rng = np.random.default_rng(4)
+    n = 400
+    lat, lon = rng.uniform(18, 24, n), rng.uniform(74, 80, n)
+    # smooth field plus noise so the variogram has structure
+    depth = 10 + 3 * np.sin(lat) + 2 * np.cos(lon) + rng.normal(0, 0.5, n)
+    lines = [",".join(STATION_FIELDS) + "\n"]
+    lines += [
+        f"S{i},Station {i},{lat[i]:.5f},{lon[i]:.5f},{depth[i]:.2f},2023-05-01,State,District\n"
+        for i in range(n)
+    ]
+    path = tmp_path_factory.mktemp("interp") / "stations.csv"
+    path.write_text("".join(lines))
+    return read_station_csv(str(path))
+
+
+def test_idw_weights_sum_to_one():
+    rng = np.random.default_rng(0)
+    dist = rng.uniform(0.5, 40, (50, 6))
+    dist[::7, 3:] = np.inf
+    w = idw_weights(dist, 2.0)
+    np.testing.assert_allclose(w.sum(axis=1), 1.0)
+    assert np.all(w[np.isinf(dist)] == 0)
+    # nearer stations weigh more
+    order = np.argsort(dist[1])
+    assert np.all(np.diff(w[1][order]) <= 0)
+
+
+def test_idw_weights_empty_and_exact_rows():
+    dist = np.array([[np.inf, np.inf], [0.0, 5.0], [3.0, 0.0]])
+    w = idw_weights(dist)
+    np.testing.assert_array_equal(w, [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+
+
+@pytest.mark.parametrize("method", ["idw", "kriging"])
+def test_interpolation_reproduces_station_values(store, method):
+    rows = np.arange(0, 400, 37)
+    result = interpolate_depth(store, store.lat[rows], store.lon[rows], method, k=8, max_radius_km=100)
+    # idw returns the station's depth; kriging is off by the tiny nugget only
+    atol = 1e-9 if method == "idw" else 1e-3
+    np.testing.assert_allclose(result["depth"], store.depth[rows], atol=atol)
+
+
+def test_kriging_matches_per_point_solve(store):
+    rng = np.random.default_rng(1)
+    lat, lon = rng.uniform(18.5, 23.5, 40), rng.uniform(74.5, 79.5, 40)
+    rows, dist = store.index.k_nearest(lat, lon, 6, 60.0)
+    dist[::9, 4:] = np.inf
+    rows[::9, 4:] = -1
+    weights = kriging_weights(store, rows, dist)
+
+    nugget, psill, range_km = variogram_for(store)
+
+    def cov(h):
+        return psill * np.exp(-3.0 * np.asarray(h) / range_km)
+
+    for p in range(len(lat)):
+        used = np.flatnonzero(rows[p] >= 0)
+        m = len(used)
+        r = rows[p, used]
+        a = np.zeros((m + 1, m + 1))
+        for i in range(m):
+            for j in range(m):
+                h = haversine_km(store.lat[r[i]], store.lon[r[i]], store.lat[r[j]], store.lon[r[j]])
+                a[i, j] = nugget + psill if i == j else cov(h)
+        a[:m, m] = a[m, :m] = 1.0
+        b = np.append(cov(dist[p, used]), 1.0)
+        expected = np.linalg.solve(a, b)[:m]
+        np.testing.assert_allclose(weights[p, used], expected, rtol=1e-6, atol=1e-9)
+        assert np.all(weights[p, rows[p] < 0] == 0)
+        assert weights[p].sum() == pytest.approx(1.0)
+
+
+@pytest.mark.parametrize("method", ["idw", "kriging"])
+def test_fewer_stations_than_k_in_radius(store, method):
+    # an isolated station far from the others, and a point with nothing near
+    i = 0
+    lat = np.array([store.lat[i] + 0.01, 10.0])
+    lon = np.array([store.lon[i], 60.0])
+    result = interpolate_depth(store, lat, lon, method, k=8, max_radius_km=2.0)
+    rows = result["rows"]
+    found = rows[0][rows[0] >= 0]
+    assert 1 <= len(found) < 8
+    assert result["weights"][0][rows[0] < 0].sum() == 0
+    assert result["weights"][0].sum() == pytest.approx(1.0)
+    assert np.isnan(result["depth"][1])
+    assert np.all(rows[1] == -1)
+    if len(found) == 1:
+        assert result["depth"][0] == pytest.approx(store.depth[found[0]])
+
+
+def test_kriging_chunk_is_bounded_by_k():
+    assert kriging_chunk(8) > kriging_chunk(32) >= 1
+    assert kriging_chunk(32) * 33 ** 2 * 8 <= 16 * 1024 * 1024
+
+
+def test_chunked_kriging_matches_single_solve(store, monkeypatch):
+    import interpolation
+
+    rng = np.random.default_rng(2)
+    lat, lon = rng.uniform(18.5, 23.5, 300), rng.uniform(74.5, 79.5, 300)
+    whole = interpolate_depth(store, lat, lon, "kriging", k=8, max_radius_km=80)
+    monkeypatch.setattr(interpolation, "_KRIGING_CHUNK_BYTES", 81 * 8 * 7)
+    assert interpolation.kriging_chunk(8) == 7
+    chunked = interpolate_depth(store, lat, lon, "kriging", k=8, max_radius_km=80)
+    assert chunked["method"] == whole["method"] == "kriging"
+    np.testing.assert_allclose(chunked["depth"], whole["depth"], rtol=1e-12, equal_nan=True)
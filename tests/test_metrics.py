@@ -0,0 +1,95 @@
+import os
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+import metrics
+from metrics import Counter, Histogram, TimingMiddleware, register_collector, render_prometheus, stage
+
+
+def test_histogram_renders_cumulative_buckets():
+    h = Histogram("t_seconds", "Test latency", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        h.observe(value, "/a")
+    h.observe(0.2, 'say "hi"\n')
+    lines = h.render()
+    assert lines[:2] == ["# HELP t_seconds Test latency", "# TYPE t_seconds histogram"]
+    assert 't_seconds_bucket{route="/a",le="0.1"} 2' in lines
+    assert 't_seconds_bucket{route="/a",le="1.0"} 3' in lines
+    assert 't_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 't_seconds_sum{route="/a"} 3.65' in lines
+    assert 't_seconds_count{route="/a"} 4' in lines
+    assert 't_seconds_count{route="say \\"hi\\"\\n"} 1' in lines
+
+
+def test_render_prometheus_includes_collectors(monkeypatch):
+    c = Counter("t_total", "Things", ("kind",))
+    c.inc("a")
+    c.inc("a", amount=2.5)
+    monkeypatch.setattr(metrics, "_METRICS", [c])
+    monkeypatch.setattr(metrics, "_collectors", [])
+    register_collector("t_ratio", "gauge", "A ratio", lambda: [({"cache": "x"}, 0.5), ({"cache": "y"}, None)])
+
+    assert render_prometheus() == (
+        "# HELP t_total Things\n"
+        "# TYPE t_total counter\n"
+        't_total{kind="a"} 3.5\n'
+        "# HELP t_ratio A ratio\n"
+        "# TYPE t_ratio gauge\n"
+        't_ratio{cache="x"} 0.5\n'
+    )
+
+
+def _timed_app():
+    app = FastAPI()
+    app.add_middleware(TimingMiddleware)
+
+    @app.get("/work/{n}")
+    def work(n: int):
+        for _ in range(n):
+            with stage("step"):
+                pass
+        with stage("once"):
+            pass
+        return {"n": n}
+
+    return app
+
+
+def test_server_timing_header():
+    client = TestClient(_timed_app())
+    r = client.get("/work/3")
+    parts = [p.strip() for p in r.headers["server-timing"].split(",")]
+    assert [p.split(";")[0] for p in parts] == ["step", "once", "total"]
+    assert parts[0].endswith(';desc="n=3"')
+    assert "desc" not in parts[1]
+    assert all(float(p.split("dur=")[1].split(";")[0]) >= 0 for p in parts)
+
+    rendered = render_prometheus()
+    assert 'rtrwh_request_duration_seconds_count{route="/work/{n}",method="GET",status="200"}' in rendered
+    assert 'rtrwh_stage_duration_seconds_count{stage="step"}' in rendered
+
+
+def test_profile_file_is_written_after_the_response(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, "PROFILE_DIR", str(tmp_path / "profiles"))
+    client = TestClient(_timed_app())
+    assert "x-profile-file" not in client.get("/work/1").headers
+    r = client.get("/work/1", headers={"X-Profile": "1"})
+    assert r.status_code == 200
+    name = r.headers["x-profile-file"]
+    assert os.path.exists(tmp_path / "profiles" / name)
+
+
+def test_metrics_endpoint(monkeypatch):
+    monkeypatch.setattr(main, "india_store", None)
+    client = TestClient(main.app)
+    client.get("/")
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "server-timing" in r.headers
+    body = r.text
+    for name in ("rtrwh_request_duration_seconds", "rtrwh_cache_hit_ratio", "rtrwh_rainfall_lookups_total"):
+        assert f"# TYPE {name} " in body
+    assert 'route="/",method="GET",status="200"' in body
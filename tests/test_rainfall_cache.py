@@ -0,0 +1,99 @@
+import asyncio
+import json
+import sqlite3
+
+import numpy as np
+
+from rainfall_cache import RainfallCache
+
+
+def _disk_totals(path):
+    with sqlite3.connect(path) as db:
+        meta = db.execute("SELECT value FROM rainfall_cache_meta WHERE name = 'total_bytes'").fetchone()[0]
+        actual = db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM rainfall_cache").fetchone()
+    return meta, actual
+
+
+def test_running_total_and_eviction(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = RainfallCache(path, max_memory_entries=4, max_disk_bytes=100_000)
+    for i in range(60):
+        cache.put(float(i), 0.0, 2020, "series", np.full(1000, i, dtype=np.float32))
+    # replacing a key counts only the size difference
+    cache.put(59.0, 0.0, 2020, "series", {"max_mm": 1.0})
+
+    meta, (actual, rows) = _disk_totals(path)
+    assert meta == actual
+    assert actual <= 100_000
+    assert cache.stats()["disk_evictions"] == 60 - rows
+
+    # least recently used go first
+    fresh = RainfallCache(path)
+    assert fresh.get(0.0, 0.0, 2020, "series") is None
+    assert fresh.get(58.0, 0.0, 2020, "series")[0] == 58.0
+    assert fresh.get(59.0, 0.0, 2020, "series") == {"max_mm": 1.0}
+
+
+def test_total_is_rebuilt_for_older_files(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    RainfallCache(path).put(1.0, 2.0, 2020, "daily", {"max_mm": 3.0})
+    with sqlite3.connect(path) as db:
+        db.execute("DROP TABLE rainfall_cache_meta")
+
+    RainfallCache(path).put(1.0, 2.5, 2020, "daily", {"max_mm": 4.0})
+    meta, (actual, rows) = _disk_totals(path)
+    assert (meta, rows) == (actual, 2)
+
+
+def test_async_lookups(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+
+    async def run():
+        cache = RainfallCache(path)
+        assert await cache.get_async(1.0, 2.0, 2020, "daily") is None
+        await cache.put_async(1.0, 2.0, 2020, "daily", {"max_mm": 3.0})
+        assert await cache.get_async(1.0, 2.0, 2020, "daily") == {"max_mm": 3.0}
+        # a second process only has the disk tier
+        other = RainfallCache(path)
+        assert await other.get_async(1.0, 2.0, 2020, "daily") == {"max_mm": 3.0}
+        return cache.stats(), other.stats()
+
+    stats, other = asyncio.run(run())
+    assert (stats["memory_hits"], stats["misses"], other["disk_hits"]) == (1, 1, 1)
+
+
+def test_memory_tier_is_bounded_by_bytes():
+    # 10 KB arrays against a 35 KB budget: three fit, whatever the entry limit
+    cache = RainfallCache(None, max_memory_entries=100, max_memory_bytes=35_000)
+    for i in range(8):
+        cache.put(float(i), 0.0, 2020, "series", np.full(2500, i, dtype=np.float32))
+    stats = cache.stats()
+    assert (stats["memory_entries"], stats["memory_bytes"]) == (3, 30_000)
+    assert cache.get(4.0, 0.0, 2020, "series") is None
+    assert cache.get(5.0, 0.0, 2020, "series")[0] == 5.0
+
+    # small dicts are counted by their JSON size and push out the oldest array
+    small = {"max_daily_precip_mm": 12.5, "max_daily_precip_date": "2020-07-01"}
+    size = len(json.dumps(small, separators=(",", ":")))
+    n = 5000 // size + 1
+    for i in range(n):
+        cache.put(float(i), 1.0, 2020, "daily", small)
+    stats = cache.stats()
+    assert (stats["memory_entries"], stats["memory_bytes"]) == (n + 2, 20_000 + n * size)
+    # 5 was read after 6 was stored, so 6 is the least recently used
+    assert cache.get(6.0, 0.0, 2020, "series") is None
+    assert cache.get(5.0, 0.0, 2020, "series") is not None
+    assert cache.get(0.0, 1.0, 2020, "daily") == small
+
+    # replacing a key releases the old value's bytes
+    cache.put(7.0, 0.0, 2020, "series", np.zeros(10, dtype=np.float32))
+    assert cache.stats()["memory_bytes"] == stats["memory_bytes"] - 10_000 + 40
+
+
+def test_oversized_values_skip_memory(tmp_path):
+    cache = RainfallCache(str(tmp_path / "cache.sqlite3"), max_memory_bytes=1000)
+    big = np.arange(1000, dtype=np.float32)
+    cache.put(1.0, 2.0, 2020, "series", big)
+    assert cache.stats()["memory_entries"] == 0
+    np.testing.assert_array_equal(cache.get(1.0, 2.0, 2020, "series"), big)
+    assert cache.stats()["disk_hits"] == 1
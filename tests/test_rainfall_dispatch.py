@@ -0,0 +1,200 @@
+import asyncio
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+import rainfall
+import upstream
+from rainfall_cache import RainfallCache
+from rainfall_dispatch import ArchiveDispatcher
+
+
+class FakeResolver:
+    """Records every call; answers each cell with (year, cell) after an optional gate."""
+
+    def __init__(self, drop=0, error=None):
+        self.calls = []
+        self.drop = drop
+        self.error = error
+        self.gate = None
+
+    async def __call__(self, year, cells):
+        self.calls.append((year, list(cells)))
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.error is not None:
+            raise self.error
+        return [(year, cell) for cell in cells][: len(cells) - self.drop]
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_identical_requests_share_one_call():
+    resolver = FakeResolver()
+
+    async def scenario():
+        dispatcher = ArchiveDispatcher(resolver, window_s=0.01)
+        results = await asyncio.gather(*(dispatcher.fetch((22.6, 88.4), 2020) for _ in range(10)))
+        return dispatcher, results
+
+    dispatcher, results = run(scenario())
+    assert resolver.calls == [(2020, [(22.6, 88.4)])]
+    assert results == [(2020, (22.6, 88.4))] * 10
+    stats = dispatcher.stats()
+    assert (stats["requests"], stats["coalesced"], stats["batches"], stats["inflight"]) == (10, 9, 1, 0)
+
+
+def test_distinct_cells_batch_within_max_batch():
+    resolver = FakeResolver()
+    cells = [(20.0 + i / 10, 77.0) for i in range(23)]
+
+    async def scenario():
+        dispatcher = ArchiveDispatcher(resolver, window_s=0.05, max_batch=10)
+        results = await asyncio.gather(
+            *(dispatcher.fetch(cell, 2021) for cell in cells),
+            dispatcher.fetch(cells[0], 2022),
+        )
+        return dispatcher, results
+
+    dispatcher, results = run(scenario())
+    assert results == [(2021, cell) for cell in cells] + [(2022, cells[0])]
+    by_year = {}
+    for year, batch in resolver.calls:
+        by_year.setdefault(year, []).append(batch)
+    # a full batch flushes at once, the rest when the window closes
+    assert [len(b) for b in by_year[2021]] == [10, 10, 3]
+    assert [c for b in by_year[2021] for c in b] == cells
+    assert by_year[2022] == [[cells[0]]]
+    assert all(len(batch) <= 10 for _, batch in resolver.calls)
+    assert dispatcher.stats()["batch_size_histogram"] == {"1": 1, "3": 1, "10": 2}
+
+
+def test_rejects_when_max_pending_reached():
+    resolver = FakeResolver()
+
+    async def scenario():
+        resolver.gate = asyncio.Event()
+        dispatcher = ArchiveDispatcher(resolver, window_s=0.0, max_pending=3)
+        pending = [asyncio.ensure_future(dispatcher.fetch((10.0 + i, 77.0), 2020)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        with pytest.raises(HTTPException) as rejected:
+            await dispatcher.fetch((50.0, 77.0), 2020)
+        # a request already in flight still coalesces
+        shared = asyncio.ensure_future(dispatcher.fetch((10.0, 77.0), 2020))
+        await asyncio.sleep(0)
+        resolver.gate.set()
+        results = await asyncio.gather(*pending, shared)
+        # capacity is back once the batch is done
+        after = await dispatcher.fetch((50.0, 77.0), 2020)
+        return dispatcher, rejected.value, results, after
+
+    dispatcher, rejected, results, after = run(scenario())
+    assert rejected.status_code == 503
+    assert results[-1] == results[0] == (2020, (10.0, 77.0))
+    assert after == (2020, (50.0, 77.0))
+    assert dispatcher.stats()["rejected"] == 1
+
+
+@pytest.mark.parametrize(
+    "resolver, status_code",
+    [
+        (FakeResolver(drop=1), 502),
+        (FakeResolver(error=HTTPException(status_code=504, detail="timeout")), 504),
+        (FakeResolver(error=RuntimeError("boom")), None),
+    ],
+)
+def test_every_future_fails_with_short_or_failed_batch(resolver, status_code):
+    cells = [(20.0, 77.0 + i / 10) for i in range(4)]
+
+    async def scenario():
+        dispatcher = ArchiveDispatcher(resolver, window_s=0.01)
+        results = await asyncio.gather(*(dispatcher.fetch(cell, 2020) for cell in cells), return_exceptions=True)
+        return dispatcher, results
+
+    dispatcher, results = run(scenario())
+    assert len(resolver.calls) == 1
+    assert all(isinstance(r, Exception) for r in results)
+    if status_code is None:
+        assert all(isinstance(r, RuntimeError) for r in results)
+    else:
+        assert all(isinstance(r, HTTPException) and r.status_code == status_code for r in results)
+    assert dispatcher.stats()["inflight"] == 0
+
+
+def test_per_cell_errors_stay_per_cell():
+    async def resolver(year, cells):
+        bad = HTTPException(status_code=500, detail="bad payload")
+        return [bad if i == 1 else (year, cell) for i, cell in enumerate(cells)]
+
+    async def scenario():
+        dispatcher = ArchiveDispatcher(resolver, window_s=0.01)
+        return await asyncio.gather(
+            *(dispatcher.fetch((20.0, 77.0 + i), 2020) for i in range(3)), return_exceptions=True
+        )
+
+    ok, failed, ok2 = run(scenario())
+    assert ok == (2020, (20.0, 77.0)) and ok2 == (2020, (20.0, 79.0))
+    assert isinstance(failed, HTTPException) and failed.status_code == 500
+
+
+def _archive_payload(lat, peak):
+    times = [f"2020-08-01T{h:02d}:00" for h in range(24)]
+    values = [None] * 24 if peak is None else [0.0] * 23 + [peak]
+    return {"latitude": lat, "hourly": {"time": times, "precipitation": values}}
+
+
+@pytest.fixture
+def archive(tmp_path, monkeypatch):
+    """Open-Meteo behind an httpx.MockTransport; the peak hourly value of a cell is its latitude."""
+    requests = []
+
+    def handler(request):
+        params = request.url.params
+        requests.append(params)
+        lats = [float(v) for v in params["latitude"].split(",")]
+        payloads = [_archive_payload(lat, None if lat < 0 else lat) for lat in lats]
+        return httpx.Response(200, json=payloads if len(payloads) > 1 else payloads[0])
+
+    monkeypatch.setattr(upstream, "_async_client", httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(rainfall, "rainfall_cache", RainfallCache(str(tmp_path / "cache.sqlite3")))
+    return requests
+
+
+def test_resolve_cells_builds_one_multi_location_request(archive):
+    cells = [(22.6, 88.4), (-5.0, 80.1), (12.9, 77.6)]
+    results = run(rainfall._resolve_cells(2020, cells))
+
+    assert len(archive) == 1
+    params = archive[0]
+    assert params["latitude"] == "22.6,-5.0,12.9"
+    assert params["longitude"] == "88.4,80.1,77.6"
+    assert (params["start_date"], params["end_date"]) == ("2020-01-01", "2020-12-31")
+    assert params["hourly"] == rainfall.HOURLY_VARIABLE
+
+    # each cell gets its own location's result; a location without data fails alone
+    assert results[0][1]["max_hourly_precip_mm"] == 22.6
+    assert isinstance(results[1], HTTPException) and results[1].status_code == 404
+    assert results[2][1]["max_hourly_precip_mm"] == 12.9
+    assert rainfall._cached_stats(22.6, 88.4, 2020) == results[0]
+    assert rainfall._cached_stats(-5.0, 80.1, 2020) is None
+
+
+def test_resolve_cells_single_location_response(archive):
+    [(daily, hourly)] = run(rainfall._resolve_cells(2020, [(22.6, 88.4)]))
+    assert archive[0]["latitude"] == "22.6"
+    assert daily["max_daily_precip_mm"] == hourly["max_hourly_precip_mm"] == 22.6
+
+
+def test_dispatcher_splits_merged_response_per_caller(archive):
+    cells = [(20.0 + i / 10, 77.0) for i in range(5)]
+
+    async def scenario():
+        dispatcher = ArchiveDispatcher(rainfall._resolve_cells, window_s=0.02)
+        return await asyncio.gather(*(dispatcher.fetch(cell, 2020) for cell in cells))
+
+    results = run(scenario())
+    assert len(archive) == 1
+    assert [hourly["max_hourly_precip_mm"] for _, hourly in results] == [cell[0] for cell in cells]
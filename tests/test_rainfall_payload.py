@@ -0,0 +1,76 @@
+import pytest
+from fastapi import HTTPException
+
+from rainfall import daily_totals_from_hourly, rainfall_stats_from_payload
+
+
+def _hours(day, values):
+    return [f"{day}T{h:02d}:00" for h in range(len(values))], list(values)
+
+
+def _payload(daily=True):
+    t1, v1 = _hours("2020-07-01", [0.0, 1.5, None, 2.25] + [0.0] * 20)
+    t2, v2 = _hours("2020-07-02", [None] * 24)
+    t3, v3 = _hours("2020-07-03", [3.0, None, 9.5, 0.5] + [None] * 20)
+    payload = {"hourly": {"time": t1 + t2 + t3, "precipitation": v1 + v2 + v3}}
+    if daily:
+        payload["daily"] = {"time": ["2020-07-01", "2020-07-02", "2020-07-03"], "precipitation_sum": [3.8, None, 13.0]}
+    return payload
+
+
+def test_daily_totals_skip_null_hours():
+    hourly = _payload(daily=False)["hourly"]
+    days, totals = daily_totals_from_hourly(hourly["time"], hourly["precipitation"])
+    assert days == ["2020-07-01", "2020-07-02", "2020-07-03"]
+    # a day without any reported hour stays None rather than 0
+    assert totals == [3.75, None, 13.0]
+
+
+def test_daily_totals_round_and_keep_order():
+    times = ["2020-12-31T23:00", "2021-01-01T00:00", "2021-01-01T01:00"]
+    assert daily_totals_from_hourly(times, [0.105, 0.1, 0.2]) == (["2020-12-31", "2021-01-01"], [0.1, 0.3])
+    assert daily_totals_from_hourly([], []) == ([], [])
+
+
+@pytest.mark.parametrize("daily", [True, False])
+def test_stats_from_payload(daily):
+    d, h = rainfall_stats_from_payload(_payload(daily), 2020)
+    assert d["year"] == h["year"] == 2020
+    assert d["max_daily_precip_mm"] == 13.0
+    assert d["max_daily_precip_date"] == "2020-07-03"
+    assert h["max_hourly_precip_mm"] == h["max_hourly_prec_mm"] == 9.5
+    assert h["max_hourly_precip_time"] == "2020-07-03T02:00"
+
+
+def test_first_maximum_wins():
+    times, values = _hours("2020-01-05", [None, 4.0, 1.0, 4.0])
+    _, h = rainfall_stats_from_payload({"hourly": {"time": times, "precipitation": values}}, 2020)
+    assert h["max_hourly_precip_time"] == "2020-01-05T01:00"
+
+
+@pytest.mark.parametrize("payload,status", [
+    ({}, 500),
+    ({"hourly": {"time": []}}, 500),
+    ({"hourly": {"time": ["2020-01-01T00:00"], "precipitation": [1.0]}, "daily": {"time": []}}, 500),
+    ({"hourly": {"time": ["2020-01-01T00:00"], "precipitation": [None]}}, 404),
+    ({"hourly": {"time": ["2020-01-01T00:00"], "precipitation": [1.0]},
+      "daily": {"time": ["2020-01-01"], "precipitation_sum": [None]}}, 404),
+])
+def test_bad_payloads(payload, status):
+    with pytest.raises(HTTPException) as e:
+        rainfall_stats_from_payload(payload, 2020)
+    assert e.value.status_code == status
+
+
+def test_mismatched_time_lengths_are_rejected():
+    payload = _payload()
+    payload["hourly"]["time"] = payload["hourly"]["time"][:-5]
+    with pytest.raises(HTTPException) as e:
+        rainfall_stats_from_payload(payload, 2020)
+    assert "67 timestamps for 72 values" in e.value.detail
+
+    payload = _payload()
+    payload["daily"]["precipitation_sum"].append(99.0)
+    with pytest.raises(HTTPException) as e:
+        rainfall_stats_from_payload(payload, 2020)
+    assert "daily" in e.value.detail
@@ -0,0 +1,94 @@
+import asyncio
+import datetime
+
+import numpy as np
+import pytest
+
+import rainfall
+from rainfall_cache import RainfallCache
+from rainfall_raster import RASTER_MISSING, RainfallRaster, open_raster, write_raster
+
+PAST = 2020
+CURRENT = datetime.datetime.now(datetime.timezone.utc).year
+
+ENTRIES = [
+    (22.6, 88.4, PAST, (123.456, "2020-07-14", 41.004, "2020-07-14T03:00")),
+    (22.7, 88.6, PAST, (0.004, "2020-01-01", 0.0, "2020-01-01T00:00")),
+    (22.6, 88.4, PAST - 1, (87.0, "2019-12-31", 19.995, "2019-12-31T23:00")),
+    (22.6, 88.4, CURRENT, (55.5, f"{CURRENT}-01-10", 9.9, f"{CURRENT}-01-10T05:00")),
+]
+
+
+@pytest.fixture
+def raster_path(tmp_path):
+    path = str(tmp_path / "rain.bin")
+    write_raster(RainfallRaster.from_entries(ENTRIES), path)
+    return path
+
+
+def test_write_open_round_trip(raster_path):
+    built = RainfallRaster.from_entries(ENTRIES)
+    opened = open_raster(raster_path)
+    assert opened.header == built.header
+    for name, arr in built.arrays.items():
+        assert opened.arrays[name].dtype == arr.dtype
+        np.testing.assert_array_equal(opened.arrays[name], arr)
+
+    # depths are stored as int32 hundredths of a mm
+    y, i, j = PAST - opened.year0, 226 - opened.lat_node0, 884 - opened.lon_node0
+    assert opened.arrays["daily_mm_x100"].dtype == np.int32
+    assert opened.arrays["daily_mm_x100"][y, i, j] == 12346
+    assert opened.arrays["hourly_mm_x100"][y, i, j] == 4100
+    assert opened.lookup(22.6, 88.4, PAST) == (123.46, "2020-07-14", 41.0, "2020-07-14T03:00")
+    assert opened.lookup(22.7, 88.6, PAST) == (0.0, "2020-01-01", 0.0, "2020-01-01T00:00")
+    assert opened.lookup(22.6, 88.4, PAST - 1) == (87.0, "2019-12-31", 20.0, "2019-12-31T23:00")
+
+
+def test_uncovered_cells_and_years_miss(raster_path):
+    raster = open_raster(raster_path)
+    # inside the bounding box but never written
+    assert raster.arrays["daily_mm_x100"][PAST - raster.year0, 0, 1] == RASTER_MISSING
+    assert raster.lookup(22.6, 88.5, PAST) is None
+    # outside the box or the year range
+    assert raster.lookup(30.0, 88.4, PAST) is None
+    assert raster.lookup(22.6, 88.4, PAST - 5) is None
+    assert raster.stats()["misses"] == 3
+
+
+@pytest.fixture
+def serving(raster_path, tmp_path, monkeypatch):
+    cache = RainfallCache(str(tmp_path / "cache.sqlite3"))
+    monkeypatch.setattr(rainfall, "rainfall_raster", open_raster(raster_path))
+    monkeypatch.setattr(rainfall, "rainfall_cache", cache)
+    return cache
+
+
+def test_off_grid_points_fall_through_to_cache(serving):
+    cached = ({"max_daily_precip_mm": 1.0}, {"max_hourly_precip_mm": 0.5})
+    serving.put(22.6, 88.5, PAST, rainfall.DAILY_VARIABLE, cached[0])
+    serving.put(22.6, 88.5, PAST, rainfall.HOURLY_VARIABLE, cached[1])
+
+    assert rainfall._cached_stats(22.6, 88.4, PAST)[0]["max_daily_precip_mm"] == 123.46
+    assert rainfall._cached_stats(22.6, 88.5, PAST) == cached
+    assert asyncio.run(rainfall._cached_stats_async(22.6, 88.5, PAST)) == cached
+    assert rainfall._cached_stats(30.0, 88.4, PAST) is None
+
+
+def test_off_grid_and_current_year_reach_network(serving, monkeypatch):
+    fetched = []
+
+    class FakeDispatcher:
+        async def fetch(self, cell, year):
+            fetched.append((cell, year))
+            return {"max_daily_precip_mm": 2.0}, {"max_hourly_precip_mm": 1.0}
+
+    monkeypatch.setattr(rainfall, "archive_dispatcher", FakeDispatcher())
+    daily, _ = asyncio.run(rainfall.fetch_rainfall_stats_async(22.61, 88.39, PAST))
+    assert daily["max_daily_precip_mm"] == 123.46 and not fetched
+
+    asyncio.run(rainfall.fetch_rainfall_stats_async(30.0, 88.4, PAST))
+    # the raster has an entry for this year, but it is not final yet
+    assert rainfall.rainfall_raster.lookup(22.6, 88.4, CURRENT) is not None
+    daily, _ = asyncio.run(rainfall.fetch_rainfall_stats_async(22.6, 88.4, CURRENT))
+    assert daily["max_daily_precip_mm"] == 2.0
+    assert fetched == [((30.0, 88.4), PAST), ((22.6, 88.4), CURRENT)]
@@ -0,0 +1,113 @@
+import numpy as np
+import pytest
+
+from station_history import (
+    NO_DAY,
+    TREND_MIN_YEARS,
+    StationHistory,
+    group_readings,
+    parse_day,
+    seasonal_trends,
+)
+
+
+def _day(text):
+    return parse_day(text)
+
+
+def _readings():
+    # station code, date, depth; code 0 has no station_id
+    rows = [
+        (7, "2021-05-01", 4.0),
+        (3, "2020-01-01", 9.0),
+        (7, "2019-03-01", 6.0),
+        (0, "2020-02-02", 1.0),
+        (3, "2022-01-01", np.nan),   # latest but no depth
+        (7, None, 2.0),               # undated
+        (3, "2021-01-01", 8.0),
+        (0, "2020-02-02", 1.5),
+        (5, "2020-06-01", np.nan),   # never has a depth
+    ]
+    codes = np.array([r[0] for r in rows], dtype=np.int32)
+    day = np.array([NO_DAY if r[1] is None else _day(r[1]) for r in rows], dtype=np.int32)
+    depth = np.array([r[2] for r in rows], dtype=np.float64)
+    return codes, day, depth
+
+
+def test_group_readings_groups_and_sorts_per_station():
+    codes, day, depth = _readings()
+    representative, history = group_readings(codes, day, depth)
+    offsets = history["history_offsets"]
+    # stations in order of first appearance; each anonymous row is its own station
+    assert [int(codes[r]) for r in representative] == [7, 3, 0, 0, 5]
+    hist = StationHistory(offsets, history["history_day"], history["history_depth"])
+    series = [hist.series(i) for i in range(len(offsets) - 1)]
+    assert [list(d) for _, d in series] == [[6.0, 4.0], [9.0, 8.0], [1.0], [1.5], []]
+    for days, _ in series:
+        assert np.all(np.diff(days) >= 0)
+        assert np.all(days != NO_DAY)
+    assert offsets[-1] == len(history["history_day"]) == 6
+
+
+def test_representative_row_is_latest_reading_with_depth():
+    codes, day, depth = _readings()
+    representative, _ = group_readings(codes, day, depth)
+    # 7: 2021-05-01 beats the older and the undated readings; 3: 2022 has no depth
+    assert representative.tolist() == [0, 6, 3, 7, 8]
+
+
+def test_as_of_returns_reading_at_or_before_day():
+    codes, day, depth = _readings()
+    _, history = group_readings(codes, day, depth)
+    hist = StationHistory(history["history_offsets"], history["history_day"], history["history_depth"])
+    rows = [0, 0, 0, 1, 4, -1]
+    probe = _day("2021-05-01")
+    got, days = hist.as_of(rows, probe)
+    np.testing.assert_array_equal(got[:4], [4.0, 4.0, 4.0, 8.0])
+    assert np.isnan(got[4]) and np.isnan(got[5])
+
+    got, days = hist.as_of([0, 1], _day("2020-12-31"))
+    assert got.tolist() == [6.0, 9.0]
+    assert days.tolist() == [_day("2019-03-01"), _day("2020-01-01")]
+
+    # before the first reading there is nothing to return
+    got, days = hist.as_of([0, 1], _day("2019-02-28"))
+    assert np.isnan(got).all()
+    assert (days == NO_DAY).all()
+
+
+def _history(per_station):
+    offsets = np.zeros(len(per_station) + 1, dtype=np.int64)
+    days, depths = [], []
+    for i, readings in enumerate(per_station):
+        offsets[i + 1] = offsets[i] + len(readings)
+        for date, value in readings:
+            days.append(_day(date))
+            depths.append(value)
+    return offsets, np.array(days, dtype=np.int32), np.array(depths, dtype=np.float64)
+
+
+def test_seasonal_trend_slope_on_linear_series():
+    years = range(2010, 2020)
+    linear = []
+    for y in years:
+        # two pre-monsoon readings a year around 5 + 0.3 * (y - 2010)
+        level = 5.0 + 0.3 * (y - 2010)
+        linear += [(f"{y}-03-15", level - 0.1), (f"{y}-05-15", level + 0.1)]
+        linear.append((f"{y}-11-01", 2.0 - 0.5 * (y - 2010)))
+        linear.append((f"{y}-08-01", 100.0))  # monsoon reading, in no season
+    trends = seasonal_trends(*_history([linear]))
+    assert trends["trend_pre_monsoon_slope"][0] == pytest.approx(0.3)
+    assert trends["trend_pre_monsoon_years"][0] == 10
+    assert trends["trend_pre_monsoon_mean"][0] == pytest.approx(5.0 + 0.3 * 4.5)
+    assert trends["trend_post_monsoon_slope"][0] == pytest.approx(-0.5)
+
+
+def test_seasonal_trend_needs_min_years():
+    short = [(f"{2010 + i}-04-01", float(i)) for i in range(TREND_MIN_YEARS - 1)]
+    enough = [(f"{2010 + i}-04-01", float(i)) for i in range(TREND_MIN_YEARS)]
+    trends = seasonal_trends(*_history([short, enough, []]))
+    slope = trends["trend_pre_monsoon_slope"]
+    assert np.isnan(slope[0]) and np.isnan(slope[2])
+    assert slope[1] == pytest.approx(1.0)
+    assert trends["trend_pre_monsoon_years"].tolist() == [TREND_MIN_YEARS - 1, TREND_MIN_YEARS, 0]
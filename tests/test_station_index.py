@@ -0,0 +1,129 @@
+import math
+
+import numpy as np
+import pytest
+
+from geo import haversine_km
+from station_index import StationGridIndex
+
+
+def _random_stations(seed, n, south=-90.0, west=-180.0, north=90.0, east=180.0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(south, north, n), rng.uniform(west, east, n)
+
+
+def _assert_matches_bruteforce(index, points, radius_km):
+    for lat, lon in points:
+        assert index.nearest(lat, lon, radius_km) == index.nearest_bruteforce(lat, lon, radius_km), (lat, lon)
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("radius_km", [5.0, 50.0, 500.0, 25000.0])
+def test_nearest_matches_bruteforce_random(seed, radius_km):
+    lats, lons = _random_stations(seed, 400, 6.0, 66.0, 37.0, 98.0)
+    index = StationGridIndex(lats, lons)
+    q_lat, q_lon = _random_stations(seed + 100, 60, 5.0, 65.0, 38.0, 99.0)
+    _assert_matches_bruteforce(index, zip(q_lat, q_lon), radius_km)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_nearest_matches_bruteforce_whole_globe(seed):
+    lats, lons = _random_stations(seed, 300)
+    index = StationGridIndex(lats, lons, cell_deg=1.0)
+    q_lat, q_lon = _random_stations(seed + 100, 60)
+    _assert_matches_bruteforce(index, zip(q_lat, q_lon), 2000.0)
+
+
+def test_exact_tie_goes_to_lowest_row():
+    # rows 1 and 3 are the same point; rows 0 and 2 mirror each other in
+    # longitude around (20, 77), which haversine_km measures identically
+    lats = [20.0, 25.5, 20.0, 25.5]
+    lons = [77.5, 77.5, 76.5, 77.5]
+    index = StationGridIndex(lats, lons)
+    assert index.nearest(25.5, 77.5, 50.0) == (1, 0.0)
+    assert index.nearest_bruteforce(25.5, 77.5, 50.0) == (1, 0.0)
+
+    assert haversine_km(20.0, 77.0, 20.0, 77.5) == haversine_km(20.0, 77.0, 20.0, 76.5)
+    row, dist = index.nearest(20.0, 77.0, 100.0)
+    assert row == 0
+    assert dist == haversine_km(20.0, 77.0, 20.0, 77.5)
+    assert index.nearest_bruteforce(20.0, 77.0, 100.0) == (row, dist)
+
+
+def test_radius_boundary_is_inclusive():
+    index = StationGridIndex([20.0], [77.0])
+    d = haversine_km(20.3, 77.2, 20.0, 77.0)
+    assert index.nearest(20.3, 77.2, d) == (0, d)
+    assert index.nearest_bruteforce(20.3, 77.2, d) == (0, d)
+    below = math.nextafter(d, 0.0)
+    assert index.nearest(20.3, 77.2, below) is None
+    assert index.nearest_bruteforce(20.3, 77.2, below) is None
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_poles_and_antimeridian(seed):
+    rng = np.random.default_rng(seed)
+    lats = np.concatenate([rng.uniform(84.0, 90.0, 60), rng.uniform(-90.0, -84.0, 60), rng.uniform(-60.0, 60.0, 60)])
+    lons = np.concatenate([rng.uniform(-180.0, 180.0, 120), rng.choice([-1.0, 1.0], 60) * rng.uniform(175.0, 180.0, 60)])
+    index = StationGridIndex(lats, lons)
+    points = [
+        (90.0, 0.0), (-90.0, 0.0), (89.9, -179.9), (-89.95, 123.0),
+        (0.0, 180.0), (0.0, -180.0), (10.0, 179.99), (-10.0, -179.99),
+    ]
+    points += list(zip(rng.uniform(-60.0, 60.0, 20), rng.choice([-1.0, 1.0], 20) * rng.uniform(178.0, 180.0, 20)))
+    for radius_km in (10.0, 100.0, 1000.0):
+        _assert_matches_bruteforce(index, points, radius_km)
+
+
+def test_station_across_antimeridian_is_found():
+    index = StationGridIndex([0.0, 0.0], [179.95, 170.0])
+    row, dist = index.nearest(0.0, -179.95, 50.0)
+    assert row == 0
+    assert dist == pytest.approx(11.1, abs=0.1)
+
+
+def test_nan_and_out_of_range_rows():
+    lats = [np.nan, 20.0, 95.0, 20.1, 20.2, np.inf]
+    lons = [77.0, np.nan, 77.0, 200.0, 77.3, 77.0]
+    index = StationGridIndex(lats, lons)
+    # NaN/inf rows are never returned
+    assert index.nearest(20.0, 77.0, 5000.0) == index.nearest_bruteforce(20.0, 77.0, 5000.0)
+    assert index.nearest(20.0, 77.0, 5000.0)[0] == 4
+    # out-of-range rows still compete, like in the linear scan
+    row, _ = index.nearest(20.1, 200.0, 10.0)
+    assert row == 3
+    assert index.nearest_bruteforce(20.1, 200.0, 10.0)[0] == 3
+    _assert_matches_bruteforce(index, [(89.0, 77.0), (20.1, -160.0), (0.0, 0.0)], 20000.0)
+
+
+def test_all_rows_unusable():
+    index = StationGridIndex([np.nan, 10.0], [77.0, np.nan])
+    assert index.nearest(10.0, 77.0, 20000.0) is None
+    assert index.nearest_bruteforce(10.0, 77.0, 20000.0) is None
+
+
+def test_zero_and_negative_radius():
+    index = StationGridIndex([20.0, 21.0], [77.0, 78.0])
+    assert index.nearest(20.0, 77.0, 0.0) == (0, 0.0)
+    assert index.nearest_bruteforce(20.0, 77.0, 0.0) == (0, 0.0)
+    assert index.nearest(20.01, 77.0, 0.0) is None
+    assert index.nearest_bruteforce(20.01, 77.0, 0.0) is None
+    for radius_km in (-1.0, -0.0 - 1e-9, -math.inf, math.nan):
+        assert index.nearest(20.0, 77.0, radius_km) is None
+    assert index.nearest_bruteforce(20.0, 77.0, -1.0) is None
+
+
+def test_k_nearest_first_column_matches_nearest():
+    lats, lons = _random_stations(7, 500, 6.0, 66.0, 37.0, 98.0)
+    index = StationGridIndex(lats, lons)
+    q_lat, q_lon = _random_stations(8, 200, 5.0, 65.0, 38.0, 99.0)
+    rows, dists = index.k_nearest(q_lat, q_lon, 3, 80.0)
+    for i, (lat, lon) in enumerate(zip(q_lat, q_lon)):
+        expected = index.nearest_bruteforce(lat, lon, 80.0)
+        if expected is None:
+            assert rows[i, 0] == -1
+        else:
+            assert rows[i, 0] == expected[0]
+            assert dists[i, 0] == pytest.approx(expected[1])
+        found = dists[i][np.isfinite(dists[i])]
+        assert np.all(np.diff(found) >= 0)
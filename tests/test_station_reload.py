@@ -0,0 +1,155 @@
+import threading
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from station_store import STATION_FIELDS, StationCsvLoader
+from station_tiles import MAX_TILE_ZOOM, mercator_xy
+
+WATCHED = ("W1", 20.0, 77.0)
+RELOADS = 25
+READERS_PER_PATH = 2
+
+
+def _row(station_id, lat, lon, depth, date, name="Station"):
+    return f"{station_id},{name},{lat},{lon},{depth},{date},State,District\n"
+
+
+@pytest.fixture
+def station_csv(tmp_path, monkeypatch):
+    path = tmp_path / "stations.csv"
+    rng = np.random.default_rng(0)
+    lines = [",".join(STATION_FIELDS) + "\n", _row(*WATCHED, 1.0, "2020-01-01")]
+    for i, (lat, lon) in enumerate(zip(rng.uniform(8, 35, 300), rng.uniform(68, 97, 300))):
+        lines.append(_row(f"S{i}", round(lat, 4), round(lon, 4), round(float(rng.uniform(1, 30)), 2), "2021-06-01"))
+    path.write_text("".join(lines))
+
+    monkeypatch.setattr(main, "INDIA_GW_FILE", str(path))
+    monkeypatch.setattr(main, "INDIA_GW_SNAPSHOT", str(tmp_path / "missing.snap"))
+    # small chunks so a reload reuses most of them
+    monkeypatch.setattr(main, "_india_loader", StationCsvLoader(str(path), chunk_bytes=2048))
+    monkeypatch.setattr(main, "india_store", None)
+    monkeypatch.setattr(main, "last_reload", None)
+    return path
+
+
+def test_reload_while_serving(station_csv):
+    station_id, lat, lon = WATCHED
+    x, y = (int(v[0]) for v in mercator_xy(np.array([lat]), np.array([lon]), MAX_TILE_ZOOM))
+    tile_url = f"/stations/tiles/{MAX_TILE_ZOOM}/{x}/{y}"
+    stop = threading.Event()
+    errors = []
+    kinds = ("point", "as_of", "tile")
+    seen = []
+
+    def tile_depth(client):
+        r = client.get(tile_url)
+        r.raise_for_status()
+        body = r.json()
+        return body["depth_m_bgl"][body["station_id"].index(station_id)]
+
+    def read(kind, depths):
+        client = TestClient(main.app)
+        try:
+            while not stop.is_set():
+                if kind == "point":
+                    depth = main.get_india_depth_for_point(lat, lon, max_radius_km=1.0)["depth_m_below_ground"]
+                elif kind == "as_of":
+                    r = client.get("/gw-depth-india", params={"lat": lat, "lon": lon, "as_of": "2030-01-01"})
+                    r.raise_for_status()
+                    depth = r.json()["depth_m_below_ground"]
+                else:
+                    depth = tile_depth(client)
+                depths.append(depth)
+        except Exception as e:  # reported below
+            errors.append(e)
+
+    main.load_india_data()
+    threads = []
+    for kind in kinds:
+        for _ in range(READERS_PER_PATH):
+            seen.append((kind, []))
+            threads.append(threading.Thread(target=read, args=seen[-1]))
+    for t in threads:
+        t.start()
+    versions = [main.india_store.version]
+    try:
+        for k in range(2, RELOADS + 2):
+            with open(station_csv, "a") as f:
+                f.write(_row(*WATCHED, float(k), f"2020-01-{k:02d}"))
+            report = main.reload_india_data()
+            assert report["changed"]
+            assert report["old_version"] == versions[-1]
+            versions.append(report["new_version"])
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+
+    assert not errors, errors
+    assert len(set(versions)) == len(versions)
+    allowed = {float(k) for k in range(1, RELOADS + 2)}
+    for kind, depths in seen:
+        assert depths, kind
+        assert set(depths) <= allowed, kind
+        # swaps only move forward, so a reader never sees an older version again
+        assert depths == sorted(depths), kind
+    assert main.get_india_depth_for_point(lat, lon)["depth_m_below_ground"] == float(RELOADS + 1)
+
+
+def test_rename_changes_version(station_csv):
+    store = main.load_india_data()
+    text = station_csv.read_text()
+    station_csv.write_text(text.replace("W1,Station,", "W1,Renamed station,", 1))
+    report = main.reload_india_data()
+    assert report["changed"]
+    assert main.india_store.text("station_name", store.row_for_id("W1")) == "Renamed station"
+
+    # same content as the first load: same version and codes, no leftover strings
+    station_csv.write_text(text)
+    report = main.reload_india_data()
+    assert report["new_version"] == store.version
+    assert len(main.india_store.strings) == len(store.strings)
+
+
+def test_lazy_load_and_reload_share_the_loader(station_csv):
+    results, errors = [], []
+
+    def lazy():
+        try:
+            results.append(main.load_india_data())
+        except Exception as e:
+            errors.append(e)
+
+    def reload():
+        try:
+            results.append(main.reload_india_data())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=lazy) for _ in range(4)] + [threading.Thread(target=reload)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    # a concurrent reload may be refused (409); nothing else may fail
+    assert all(getattr(e, "status_code", None) == 409 for e in errors), errors
+    assert main.india_store is not None
+    assert main.get_india_depth_for_point(*WATCHED[1:])["depth_m_below_ground"] == 1.0
+
+
+def test_admin_endpoints_fail_closed(station_csv, monkeypatch):
+    client = TestClient(main.app)
+    monkeypatch.setattr(main, "ADMIN_TOKEN", None)
+    assert client.get("/admin/stations").status_code == 403
+    assert client.post("/admin/stations/reload", headers={"X-Admin-Token": ""}).status_code == 403
+
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "s3cret")
+    assert client.get("/admin/stations").status_code == 403
+    assert client.get("/admin/stations", headers={"X-Admin-Token": "wrong"}).status_code == 403
+    ok = client.get("/admin/stations", headers={"X-Admin-Token": "s3cret"})
+    assert ok.status_code == 200
+    assert ok.json()["stations"] == 301
+    assert client.post("/admin/stations/reload", headers={"X-Admin-Token": "s3cret"}).status_code == 200
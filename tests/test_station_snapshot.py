@@ -0,0 +1,111 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import station_store
+from station_store import (
+    SNAPSHOT_MAGIC,
+    STATION_FIELDS,
+    load_station_store,
+    open_snapshot,
+    read_station_csv,
+    write_snapshot,
+)
+
+
+def _row(station_id, lat, lon, depth, date, name):
+    return f"{station_id},{name},{lat},{lon},{depth},{date},State,District\n"
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "stations.csv"
+    rng = np.random.default_rng(3)
+    lines = [",".join(STATION_FIELDS) + "\n"]
+    for i in range(200):
+        lat, lon = rng.uniform(8, 35), rng.uniform(68, 97)
+        for year in (2019, 2020, 2021):
+            depth = "" if rng.random() < 0.1 else round(float(rng.uniform(1, 30)), 2)
+            lines.append(_row(f"S{i % 150}", round(lat, 4), round(lon, 4), depth, f"{year}-04-01", f"Well {i % 37}"))
+    path.write_text("".join(lines))
+    return str(path)
+
+
+def _assert_same(a, b):
+    assert a.version == b.version
+    assert len(a) == len(b)
+    ca, cb = a.columns(), b.columns()
+    assert ca.keys() == cb.keys()
+    for name in ca:
+        np.testing.assert_array_equal(ca[name], cb[name], err_msg=name)
+    for blob_a, blob_b in zip(a.strings.encoded(), b.strings.encoded()):
+        np.testing.assert_array_equal(blob_a, blob_b)
+    for i in (0, len(a) // 2, len(a) - 1):
+        assert a.text("station_name", i) == b.text("station_name", i)
+
+
+def test_snapshot_round_trip(csv_path, tmp_path):
+    store = read_station_csv(csv_path)
+    snap = str(tmp_path / "stations.snap")
+    assert write_snapshot(store, snap, csv_path) == os.path.getsize(snap)
+
+    opened, stamp = open_snapshot(snap)
+    assert stamp == {"size": os.path.getsize(csv_path), "mtime_ns": os.stat(csv_path).st_mtime_ns}
+    assert opened.source == snap
+    _assert_same(opened, store)
+    for name, arr in store.index.arrays().items():
+        np.testing.assert_array_equal(opened.index.arrays()[name], arr)
+    assert opened.index.nearest(20.0, 80.0, 500.0) == store.index.nearest(20.0, 80.0, 500.0)
+
+
+def test_matching_snapshot_is_used(csv_path, tmp_path):
+    snap = str(tmp_path / "stations.snap")
+    write_snapshot(read_station_csv(csv_path), snap, csv_path)
+    assert load_station_store(csv_path, snap).source == snap
+    # without the CSV the snapshot is all there is
+    os.remove(csv_path)
+    assert load_station_store(csv_path, snap).source == snap
+
+
+def test_changed_csv_rebuilds_from_csv(csv_path, tmp_path):
+    snap = str(tmp_path / "stations.snap")
+    write_snapshot(read_station_csv(csv_path), snap, csv_path)
+    with open(csv_path, "a") as f:
+        f.write(_row("NEW", 12.0, 77.0, 5.0, "2022-04-01", "New well"))
+
+    store = load_station_store(csv_path, snap)
+    assert store.source == csv_path
+    assert store.row_for_id("NEW") is not None
+    _assert_same(store, read_station_csv(csv_path))
+
+
+def _rewrite_version(path, version):
+    with open(path, "rb") as f:
+        data = bytearray(f.read())
+    start = len(SNAPSHOT_MAGIC) + 4
+    length = int.from_bytes(data[len(SNAPSHOT_MAGIC): start], "little")
+    header = json.loads(data[start: start + length])
+    header["version"] = version
+    # keep the header length so the data offsets stay valid
+    data[start: start + length] = json.dumps(header).encode().ljust(length)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def test_stale_snapshot_version_rebuilds_from_csv(csv_path, tmp_path):
+    snap = str(tmp_path / "stations.snap")
+    write_snapshot(read_station_csv(csv_path), snap, csv_path)
+    _rewrite_version(snap, station_store.SNAPSHOT_VERSION - 1)
+    with pytest.raises(ValueError):
+        open_snapshot(snap)
+
+    store = load_station_store(csv_path, snap)
+    assert store.source == csv_path
+    _assert_same(store, read_station_csv(csv_path))
+
+    # with nothing to rebuild from, the bad snapshot is an error
+    os.remove(csv_path)
+    with pytest.raises(ValueError):
+        load_station_store(csv_path, snap)
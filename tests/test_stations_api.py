@@ -0,0 +1,54 @@
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+import station_tiles
+from station_store import read_station_csv
+
+client = TestClient(main.app)
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = read_station_csv(main.INDIA_GW_FILE)
+    monkeypatch.setattr(main, "india_store", store)
+    return store
+
+
+@pytest.mark.parametrize("bbox", ["1..,80,25,90", "1.2.3,80,25,90", "., 80, 25, 90", "-,80,25,90", "1,80,25"])
+def test_malformed_bbox_is_a_client_error(store, bbox):
+    r = client.get("/stations", params={"bbox": bbox})
+    assert r.status_code == 422
+
+
+@pytest.mark.parametrize("text", ["1..,80,25,90", "1,2,3", "a,b,c,d"])
+def test_parse_bbox_rejects_non_numbers(text):
+    with pytest.raises(HTTPException) as e:
+        main._parse_bbox(text)
+    assert e.value.status_code == 400
+
+
+def test_bbox_accepts_plain_decimals(store):
+    r = client.get("/stations", params={"bbox": " 5, 65.5 ,38,-179.25"})
+    assert r.status_code == 200
+
+
+def test_rendered_cache_is_bounded_by_bytes(store, monkeypatch):
+    monkeypatch.setattr(station_tiles, "TILE_CACHE_BYTES", 1000)
+    monkeypatch.setattr(station_tiles, "TILE_CACHE_MAX_BODY_BYTES", 400)
+    tiles = station_tiles.StationTiles(store)
+
+    for i in range(10):
+        assert tiles.cached(("k", i), lambda: b"x" * 300) == b"x" * 300
+    stats = tiles.stats()
+    assert (stats["rendered_cached"], stats["rendered_bytes"]) == (3, 900)
+    # the oldest went first
+    assert tiles.cached(("k", 9), lambda: b"new") == b"x" * 300
+    assert tiles.cached(("k", 0), lambda: b"new") == b"new"
+
+    # oversized bodies are served but not kept
+    big = b"y" * 500
+    assert tiles.cached(("big",), lambda: big) is big
+    assert tiles.cached(("big",), lambda: b"again") == b"again"
+    assert tiles.stats()["rendered_bytes"] <= 1000
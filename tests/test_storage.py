@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from storage import candidate_volumes, daily_inflow_m3, simulate_storage, storage_sizing
+
+
+def naive_storage(inflow_m3, demand_m3_per_day, volume_m3):
+    """Day-by-day yield-before-spillage loop, starting empty."""
+    store = 0.0
+    failures, unmet, spill = 0, 0.0, 0.0
+    for inflow in inflow_m3:
+        available = store + inflow
+        if available < demand_m3_per_day:
+            failures += 1
+            unmet += demand_m3_per_day - available
+            store = 0.0
+        else:
+            store = available - demand_m3_per_day
+            if store > volume_m3:
+                spill += store - volume_m3
+                store = volume_m3
+    return failures, unmet, spill
+
+
+def _rain(seed, n_days):
+    rng = np.random.default_rng(seed)
+    # dry spells, monsoon-like wet spells and the odd cloudburst
+    wet = rng.random(n_days) < 0.5 + 0.4 * np.sin(np.arange(n_days) * 2 * np.pi / 365.25)
+    rain = np.where(wet, rng.gamma(0.7, 12.0, n_days), 0.0)
+    rain[rng.integers(0, n_days, 5)] = np.nan
+    return rain
+
+
+@pytest.mark.parametrize("seed", range(6))
+@pytest.mark.parametrize("demand_l", [0.0, 150.0, 540.0, 2500.0])
+def test_matches_naive_daily_loop(seed, demand_l):
+    rain = _rain(seed, 3 * 365)
+    inflow = daily_inflow_m3(rain, 0.85, 120.0, 2.0)
+    volumes = np.concatenate([[0.0], candidate_volumes(inflow, len(rain), 40), [1e6]])
+    demand = demand_l / 1000.0
+
+    sim = simulate_storage(inflow, demand, volumes)
+    for k, volume in enumerate(volumes):
+        failures, unmet, spill = naive_storage(inflow, demand, volume)
+        assert sim["failure_days"][k] == failures, volume
+        assert sim["unmet_m3"][k] == pytest.approx(unmet, rel=1e-9, abs=1e-9), volume
+        assert sim["spill_m3"][k] == pytest.approx(spill, rel=1e-9, abs=1e-9), volume
+
+
+def test_edge_records():
+    volumes = np.array([0.0, 0.5, 2.0])
+    for inflow in (np.zeros(30), np.full(30, 0.54), np.full(30, 3.0), np.array([]), np.array([5.0, 0, 0, 0, 0, 0])):
+        sim = simulate_storage(inflow, 0.54, volumes)
+        for k, volume in enumerate(volumes):
+            failures, unmet, spill = naive_storage(inflow, 0.54, volume)
+            assert sim["failure_days"][k] == failures
+            assert sim["unmet_m3"][k] == pytest.approx(unmet, abs=1e-12)
+            assert sim["spill_m3"][k] == pytest.approx(spill, abs=1e-12)
+
+
+def test_sizing_reliability_is_monotonic():
+    result = storage_sizing(_rain(1, 5 * 365), 0.85, 100.0)
+    reliability = result["curve"]["reliability"]
+    assert reliability == sorted(reliability)
+    if result["recommended_volume_m3"] is not None:
+        assert result["recommended_reliability"] >= result["target_reliability"]
@@ -0,0 +1,66 @@
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+# ---------- upstream HTTP configuration ----------
+# Every outbound call (Open-Meteo) goes through the clients below, so
+# connection limits and timeouts are tuned here and nowhere else.
+UPSTREAM_CONNECT_TIMEOUT_S = 5.0
+UPSTREAM_READ_TIMEOUT_S = 20.0
+UPSTREAM_MAX_CONNECTIONS = 64
+UPSTREAM_MAX_KEEPALIVE = 32
+UPSTREAM_KEEPALIVE_EXPIRY_S = 30.0
+
+# Archive dispatcher (rainfall_dispatch.py): how long to hold a request open
+# for other cells to join it, how many cells one request may carry, and how
+# many distinct cells may be queued or in flight before callers get a 503.
+DISPATCH_WINDOW_S = 0.01
+DISPATCH_MAX_BATCH = 50
+DISPATCH_MAX_PENDING = 2000
+# -------------------------------------------------
+
+_async_client: Optional[httpx.AsyncClient] = None
+_session: Optional[requests.Session] = None
+
+
+def sync_timeout():
+    return (UPSTREAM_CONNECT_TIMEOUT_S, UPSTREAM_READ_TIMEOUT_S)
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Shared keep-alive client; created on first use or by open_async_client()."""
+    global _async_client
+    if _async_client is None or _async_client.is_closed:
+        _async_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(UPSTREAM_READ_TIMEOUT_S, connect=UPSTREAM_CONNECT_TIMEOUT_S),
+            limits=httpx.Limits(
+                max_connections=UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+                keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY_S,
+            ),
+        )
+    return _async_client
+
+
+async def close_async_client() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.aclose()
+        _async_client = None
+
+
+def get_session() -> requests.Session:
+    """Pooled session for the synchronous fetchers."""
+    global _session
+    if _session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=UPSTREAM_MAX_KEEPALIVE,
+            pool_maxsize=UPSTREAM_MAX_CONNECTIONS,
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session